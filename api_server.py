@@ -10,6 +10,18 @@ import hashlib
 import hmac
 import urllib.parse
 import config
+from utils.achievement_catalog import achievement_catalog
+from utils.leaderboard_service import (
+    leaderboard_service,
+    LEADERBOARD_CATEGORIES,
+    GRAPH_CATEGORIES,
+    PERIOD_TYPES,
+    PERIOD_CONTEST_TYPES,
+    PERIOD_METRICS
+)
+from utils.rank_index import rank_index, RANK_CATEGORIES
+from utils.referral_graph import referral_graph
+from utils.user_directory import user_directory
 
 
 def validate_init_data(init_data: str) -> dict:
@@ -89,6 +101,8 @@ async def get_user_stats(request):
             'user_id': user_id,
             'stats': {
                 'referrals': referral_count,
+                'secondLevelReferrals': referral_graph.second_level_count(user_id),
+                'networkSize': referral_graph.downstream_size(user_id),
                 'totalContests': stats.get('total_contests', 0),
                 'totalWins': stats.get('total_wins', 0),
                 'votingWins': stats.get('voting_wins', 0),
@@ -113,30 +127,44 @@ async def get_user_stats(request):
 
 async def get_leaderboard(request):
     """
-    GET /api/leaderboard?type=wins|referrals|contests
+    GET /api/leaderboard?type=wins|referrals|contests|second_level|network
+                        [&period=week|month|all&contest_type=all|voting_contest|random_contest|spam_contest]
     Возвращает топ пользователей
     """
     try:
         leaderboard_type = request.query.get('type', 'wins')
+        period_type = request.query.get('period')
+        contest_type = request.query.get('contest_type')
         
-        # Получаем топ из БД
-        if leaderboard_type == 'wins':
-            leaders = await db.get_leaderboard_by_wins(limit=10)
-        elif leaderboard_type == 'referrals':
-            leaders = await db.get_leaderboard_by_referrals(limit=10)
-        elif leaderboard_type == 'contests':
-            leaders = await db.get_leaderboard_by_contests(limit=10)
-        else:
+        if leaderboard_type not in LEADERBOARD_CATEGORIES and leaderboard_type not in GRAPH_CATEGORIES:
             return web.json_response(
                 {'error': f'Неизвестный тип: {leaderboard_type}'},
                 status=400
             )
         
+        if period_type or contest_type:
+            # ТОП за период по типу конкурса (user_rollups)
+            period_type = period_type or 'all'
+            contest_type = contest_type or 'all'
+            if (leaderboard_type not in PERIOD_METRICS or period_type not in PERIOD_TYPES
+                    or contest_type not in PERIOD_CONTEST_TYPES):
+                return web.json_response(
+                    {'error': 'Неизвестный период или тип конкурса'},
+                    status=400
+                )
+            board = await leaderboard_service.get_period_board(period_type, contest_type, leaderboard_type)
+            leaders = board['leaders']
+        else:
+            # Готовый ТОП из памяти (utils.leaderboard_service)
+            leaders = leaderboard_service.get_leaders(leaderboard_type)
+        
         # Форматируем данные для фронтенда
         formatted_leaders = []
         for leader in leaders:
             # Определяем score в зависимости от типа
-            if leaderboard_type == 'wins':
+            if 'score' in leader:
+                score = leader['score']
+            elif leaderboard_type == 'wins':
                 score = leader.get('total_wins', 0)
             elif leaderboard_type == 'referrals':
                 score = leader.get('referral_count', 0)
@@ -154,6 +182,8 @@ async def get_leaderboard(request):
         return web.json_response({
             'success': True,
             'type': leaderboard_type,
+            'period': period_type or 'all',
+            'contestType': contest_type or 'all',
             'leaders': formatted_leaders
         })
         
@@ -166,10 +196,10 @@ async def get_leaderboard(request):
             status=500
         )
 
-async def get_achievements(request):
+async def get_user_rank(request):
     """
-    GET /api/achievements?init_data=...
-    Возвращает достижения пользователя
+    GET /api/rank?init_data=...&type=wins|referrals|contests&k=3
+    Возвращает место пользователя и соседей по рейтингу (±k)
     """
     try:
         init_data = request.query.get('init_data')
@@ -188,111 +218,139 @@ async def get_achievements(request):
                 status=400
             )
         
-        # Получаем статистику для подсчета прогресса
-        stats = await db.get_user_stats(user_id)
-        referral_count = await db.get_referral_count(user_id)
+        rank_type = request.query.get('type', 'wins')
+        if rank_type not in RANK_CATEGORIES:
+            return web.json_response(
+                {'error': f'Неизвестный тип: {rank_type}'},
+                status=400
+            )
         
-        # Список всех достижений с прогрессом
-        all_achievements = [
-            # Участие в конкурсах
-            {
-                'id': 'newbie',
-                'name': '🎯 Новичок',
-                'emoji': '🎯',
-                'description': 'Участвуй в 5 конкурсах',
-                'target': 5,
-                'progress': min(stats.get('total_contests', 0), 5),
-                'earned': stats.get('total_contests', 0) >= 5
-            },
-            {
-                'id': 'regular',
-                'name': '⭐ Постоялец',
-                'emoji': '⭐',
-                'description': 'Участвуй в 20 конкурсах',
-                'target': 20,
-                'progress': min(stats.get('total_contests', 0), 20),
-                'earned': stats.get('total_contests', 0) >= 20
-            },
-            {
-                'id': 'veteran',
-                'name': '👑 Ветеран',
-                'emoji': '👑',
-                'description': 'Участвуй в 50 конкурсах',
-                'target': 50,
-                'progress': min(stats.get('total_contests', 0), 50),
-                'earned': stats.get('total_contests', 0) >= 50
-            },
-            
-            # Победы
-            {
-                'id': 'first_win',
-                'name': '🏆 Первая победа',
-                'emoji': '🏆',
-                'description': 'Выиграй свой первый конкурс',
-                'target': 1,
-                'progress': min(stats.get('total_wins', 0), 1),
-                'earned': stats.get('total_wins', 0) >= 1
-            },
-            {
-                'id': 'winner',
-                'name': '🌟 Победитель',
-                'emoji': '🌟',
-                'description': 'Выиграй 5 конкурсов',
-                'target': 5,
-                'progress': min(stats.get('total_wins', 0), 5),
-                'earned': stats.get('total_wins', 0) >= 5
-            },
-            {
-                'id': 'champion',
-                'name': '💎 Чемпион',
-                'emoji': '💎',
-                'description': 'Выиграй 10 конкурсов',
-                'target': 10,
-                'progress': min(stats.get('total_wins', 0), 10),
-                'earned': stats.get('total_wins', 0) >= 10
-            },
-            
-            # Рефералы
-            {
-                'id': 'recruiter',
-                'name': '👋 Друг',
-                'emoji': '👋',
-                'description': 'Пригласи 5 друзей',
-                'target': 5,
-                'progress': min(referral_count, 5),
-                'earned': referral_count >= 5
-            },
-            {
-                'id': 'influencer',
-                'name': '🌟 Популярный',
-                'emoji': '🌟',
-                'description': 'Пригласи 25 друзей',
-                'target': 25,
-                'progress': min(referral_count, 25),
-                'earned': referral_count >= 25
-            },
-            {
-                'id': 'legend',
-                'name': '🔥 Легенда',
-                'emoji': '🔥',
-                'description': 'Пригласи 100 друзей',
-                'target': 100,
-                'progress': min(referral_count, 100),
-                'earned': referral_count >= 100
-            },
-            
-            # Серии побед
+        try:
+            k = min(max(int(request.query.get('k', 3)), 0), 10)
+        except ValueError:
+            k = 3
+        
+        # Место и соседи из индекса в памяти (utils.rank_index)
+        position, total = rank_index.get_position(user_id, rank_type)
+        around = rank_index.get_around(user_id, rank_type, k)
+        
+        # Имена соседей — из справочника пользователей по первичному ключу
+        names = await user_directory.resolve(neighbour_id for _, neighbour_id, _ in around)
+        neighbours = [
             {
-                'id': 'streak',
-                'name': '🔥 Серия побед',
-                'emoji': '🔥',
-                'description': 'Выиграй 3 раза подряд',
-                'target': 3,
-                'progress': min(stats.get('best_win_streak', 0), 3),
-                'earned': stats.get('best_win_streak', 0) >= 3
+                'rank': place,
+                'userId': neighbour_id,
+                'username': names.get(neighbour_id, {}).get('username'),
+                'fullName': names.get(neighbour_id, {}).get('full_name'),
+                'score': score
             }
+            for place, neighbour_id, score in around
         ]
         
+        return web.json_response({
+            'success': True,
+            'type': rank_type,
+            'position': position,
+            'total': total,
+            'score': rank_index.get_score(user_id, rank_type),
+            'neighbours': neighbours
+        })
+        
+    except ValueError as e:
+        return web.json_response(
+            {'error': f'Невалидные данные: {str(e)}'},
+            status=401
+        )
+    except Exception as e:
+        print(f"❌ Ошибка в get_user_rank: {e}")
+        return web.json_response(
+            {'error': 'Внутренняя ошибка сервера'},
+            status=500
+        )
+
+
+async def get_rank_history(request):
+    """
+    GET /api/rank/history?init_data=...&days=14
+    Возвращает места пользователя по дням для всех рейтингов
+    """
+    try:
+        init_data = request.query.get('init_data')
+        if not init_data:
+            return web.json_response(
+                {'error': 'init_data отсутствует'},
+                status=400
+            )
+        
+        user_data = validate_init_data(init_data)
+        user_id = user_data.get('id')
+        
+        if not user_id:
+            return web.json_response(
+                {'error': 'user_id отсутствует'},
+                status=400
+            )
+        
+        try:
+            days = min(max(int(request.query.get('days', 14)), 1), 90)
+        except ValueError:
+            days = 14
+        
+        history = await db.get_rank_history(user_id, days=days)
+        
+        return web.json_response({
+            'success': True,
+            'history': [
+                {
+                    'date': row['snapshot_date'].isoformat(),
+                    'type': row['category'],
+                    'position': row['position'],
+                    'score': row['score']
+                }
+                for row in history
+            ]
+        })
+        
+    except ValueError as e:
+        return web.json_response(
+            {'error': f'Невалидные данные: {str(e)}'},
+            status=401
+        )
+    except Exception as e:
+        print(f"❌ Ошибка в get_rank_history: {e}")
+        return web.json_response(
+            {'error': 'Внутренняя ошибка сервера'},
+            status=500
+        )
+
+
+async def get_achievements(request):
+    """
+    GET /api/achievements?init_data=...
+    Возвращает достижения пользователя
+    """
+    try:
+        init_data = request.query.get('init_data')
+        if not init_data:
+            return web.json_response(
+                {'error': 'init_data отсутствует'},
+                status=400
+            )
+        
+        user_data = validate_init_data(init_data)
+        user_id = user_data.get('id')
+        
+        if not user_id:
+            return web.json_response(
+                {'error': 'user_id отсутствует'},
+                status=400
+            )
+        
+        # Прогресс и разблокированные уровни одним запросом,
+        # статичная часть берётся из общего каталога
+        progress = await db.get_achievement_progress(user_id)
+        all_achievements = achievement_catalog.to_api(progress)
+        
         return web.json_response({
             'success': True,
             'achievements': all_achievements
@@ -340,13 +398,28 @@ def create_app():
     app.router.add_get('/api/stats', get_user_stats)
     app.router.add_get('/api/leaderboard', get_leaderboard)
     app.router.add_get('/api/achievements', get_achievements)
+    app.router.add_get('/api/rank', get_user_rank)
+    app.router.add_get('/api/rank/history', get_rank_history)
     
     return app
 
 
-async def start_api_server():
-    """Запускает API сервер"""
+async def start_api_server(dp=None, bot=None):
+    """
+    Запускает API сервер
+    С dp и bot на том же порту принимаются обновления Telegram (webhook)
+    """
     app = create_app()
+    
+    if dp is not None:
+        from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+        SimpleRequestHandler(
+            dispatcher=dp,
+            bot=bot,
+            secret_token=config.WEBHOOK_SECRET
+        ).register(app, path=config.WEBHOOK_PATH)
+        setup_application(app, dp, bot=bot)
+    
     runner = web.AppRunner(app)
     await runner.setup()
     site = web.TCPSite(runner, '0.0.0.0', 8000)
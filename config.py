@@ -39,6 +39,10 @@ BOT_INVITE_LINK = os.getenv("BOT_INVITE_LINK", "")
 if not CHANNEL_ID or not DISCUSSION_GROUP_ID:
     raise ValueError("❌ CHANNEL_ID или DISCUSSION_GROUP_ID не найдены в .env!")
 
+# Кэш статуса подписки на канал (секунды)
+SUBSCRIPTION_CACHE_TTL = 300      # подписан
+SUBSCRIPTION_NEGATIVE_TTL = 20    # не подписан (короче, чтобы быстро увидеть новую подписку)
+
 # ============== БАЗА ДАННЫХ ==============
 
 # PostgreSQL (из .env)
@@ -57,8 +61,73 @@ DEFAULT_PARTICIPANTS_COUNT = 10
 MAX_PARTICIPANTS_COUNT = 15
 DEFAULT_TIMER_MINUTES = 60
 
-# Интервал проверки комментариев (секунды)
-COMMENT_CHECK_INTERVAL = 15
+# Обновление таймеров конкурсов в канале (секунды)
+CONTEST_TIMER_TICK = 60
+
+# Сверка набора без дедлайна (голосование): закрыть набор, если он заполнен,
+# а сигнал от регистрации потерялся (секунды)
+COLLECT_RECONCILE_INTERVAL = 60
+
+# Задачи конкурсов (таблица contest_jobs)
+CONTEST_JOB_MAX_ATTEMPTS = 3      # попыток выполнить упавший дедлайн
+CONTEST_JOB_RETRY_DELAY = 30      # пауза перед первым повтором, дальше удваивается (секунды)
+
+# Несколько экземпляров бота (выбор ведущего через advisory lock PostgreSQL)
+LEADER_LOCK_ID = 7301001               # ключ pg_advisory_lock ведущего
+LEADER_CHECK_INTERVAL = 5              # проверка / захват лидерства (секунды)
+CLUSTER_CHANNEL = "contest_bot_events" # канал LISTEN/NOTIFY между экземплярами
+CLUSTER_PUBLISH_WINDOW = 0.1           # события копятся и уходят пачкой (секунды)
+INSTANCE_ALIVE_TIMEOUT = LEADER_CHECK_INTERVAL * 3  # экземпляр без отметки дольше — считается упавшим
+
+# Webhook вместо polling (нужен, если экземпляров несколько:
+# getUpdates отдаёт обновления только одному получателю)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")                 # https://домен/telegram/webhook
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+
+# Микропачки регистрации участников (всплеск комментариев после анонса)
+REGISTRATION_BATCH_SIZE = 50       # максимум заявок в одной пачке
+REGISTRATION_BATCH_WINDOW = 0.2    # сколько ждать добора пачки (секунды)
+
+# Интервал записи счётчиков спам-конкурса в БД (секунды)
+SPAM_FLUSH_INTERVAL = 5
+# Ожидание подтверждений финального сброса счётчиков от остальных экземпляров
+# перед подсчётом победителя (без подтверждений задача завершения повторяется)
+SPAM_FLUSH_ACK_TIMEOUT = 30
+SPAM_FLUSH_ACK_POLL = 1
+
+# Лидерборды (готовятся в фоне, кнопки читают из памяти)
+LEADERBOARD_TOP_SIZE = 10              # мест в ТОПе
+LEADERBOARD_FETCH_LIMIT = 50           # строк из БД для отбора подписанных
+LEADERBOARD_REFRESH_INTERVAL = 300     # полное обновление (секунды)
+LEADERBOARD_DIRTY_INTERVAL = 15        # обновление изменившихся категорий (секунды)
+LEADERBOARD_PERIOD_TTL = 60            # кэш ТОПов за неделю / месяц по типам (секунды)
+
+# Справочник имён пользователей (таблица users)
+USER_DIRECTORY_CACHE_SIZE = 10000      # записей в LRU-кэше
+USER_DIRECTORY_FLUSH_INTERVAL = 5      # запись изменений пачкой (секунды)
+USER_DIRECTORY_TOUCH_INTERVAL = 3600   # как часто обновлять last_seen (секунды)
+USER_DIRECTORY_MISSING_TTL = 60        # через сколько перечитать из БД неизвестного пользователя (секунды)
+
+# Ежедневные снимки рейтингов и уведомления об изменении мест
+RANK_SNAPSHOT_CHECK_INTERVAL = 3600    # как часто проверять, снят ли сегодняшний снимок (секунды)
+NOTIFY_RATE = 20                       # личных уведомлений в секунду
+
+# Кэш строк user_stats в DatabasePostgres
+USER_STATS_CACHE_SIZE = 5000           # записей
+USER_STATS_CACHE_TTL = 300             # секунды
+
+# Фоновая перепроверка подписок рефералов
+REFERRAL_VERIFY_BUDGET = 5             # запросов get_chat_member в секунду
+REFERRAL_VERIFY_BATCH_SIZE = 100       # рефералов в одной транзакции
+REFERRAL_VERIFY_PASS_INTERVAL = 21600  # пауза между полными проходами (секунды)
+
+# Пачки записи рефералов (всплеск переходов по одной ссылке)
+REFERRAL_BATCH_SIZE = 200              # переходов в одном INSERT
+REFERRAL_BATCH_WINDOW = 0.1            # сколько ждать добора пачки (секунды)
+
+# Граф рефералов в памяти (рефералы 2-го уровня, вся сеть)
+REFERRAL_GRAPH_COMPACT_THRESHOLD = 1000  # изменений до пересборки массивов
 
 # Эмодзи для участников (15 уникальных)
 PARTICIPANT_EMOJIS = [
@@ -103,6 +172,10 @@ ENTRY_CONDITIONS = {
         "name": "🆕 Максимум участий",
         "description": "Ограничить максимальное количество участий (например, только новички)"
     },
+    "min_second_level_referrals": {
+        "name": "🌳 Минимум рефералов 2-го уровня",
+        "description": "Участвовать могут только те, чьи рефералы тоже приглашают друзей"
+    },
 }
 
 # ============== ДОСТИЖЕНИЯ ==============
@@ -2,8 +2,27 @@
 
 import asyncpg
 import json
+import time
+from collections import OrderedDict
 from datetime import datetime
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Tuple
+
+from utils.contest_registry import contest_registry, CONTEST_TRANSITIONS
+from utils.leader_election import leader_election
+from utils.leaderboard_service import leaderboard_service
+from utils.rank_index import rank_index
+from utils.referral_graph import referral_graph
+import config
+
+
+# Колонки user_stats со счётчиками (для строки по умолчанию без INSERT)
+USER_STATS_COUNTERS = (
+    'total_contests', 'total_wins', 'referral_points',
+    'voting_wins', 'random_wins', 'spam_wins',
+    'current_win_streak', 'best_win_streak',
+    'best_voting_streak', 'best_random_streak', 'best_spam_streak',
+    'best_referral_streak', 'best_activity_streak',
+)
 
 
 class DatabasePostgres:
@@ -14,6 +33,10 @@ class DatabasePostgres:
         """
         self.dsn = dsn
         self.pool = None
+        # LRU-кэш строк user_stats: user_id -> (строка, время загрузки)
+        self._stats_cache: "OrderedDict[int, tuple]" = OrderedDict()
+        self._stats_cache_size = config.USER_STATS_CACHE_SIZE
+        self._stats_cache_ttl = config.USER_STATS_CACHE_TTL
     
     async def init_pool(self):
         """Создание пула соединений"""
@@ -76,6 +99,100 @@ class DatabasePostgres:
             await conn.execute('CREATE INDEX IF NOT EXISTS idx_participants_user ON participants(user_id)')
             await conn.execute('CREATE INDEX IF NOT EXISTS idx_participants_position ON participants(contest_id, position)')
             
+            # Один пользователь — одна запись в конкурсе
+            try:
+                await conn.execute('''
+                    CREATE UNIQUE INDEX IF NOT EXISTS idx_participants_contest_user
+                    ON participants(contest_id, user_id)
+                ''')
+            except Exception as e:
+                print(f"⚠️ Не удалось создать уникальный индекс участников (есть дубликаты?): {e}")
+            
+            # Атомарная регистрация пачки участников: уникальность, позиции без пропусков, лимит мест,
+            # эмодзи без повторов (пачки разных экземпляров бота разрешаются под блокировкой конкурса)
+            await conn.execute('''
+                CREATE OR REPLACE FUNCTION register_participants(
+                    p_contest_id INTEGER,
+                    p_user_ids BIGINT[],
+                    p_usernames VARCHAR(100)[],
+                    p_full_names VARCHAR(200)[],
+                    p_emojis TEXT[],
+                    p_emoji_set TEXT[]
+                ) RETURNS TABLE(reg_user_id BIGINT, result TEXT, assigned_position INTEGER,
+                                total INTEGER, assigned_emoji TEXT)
+                LANGUAGE plpgsql AS $$
+                DECLARE
+                    v_capacity INTEGER;
+                    v_status VARCHAR(20);
+                    v_count INTEGER;
+                    v_found BOOLEAN;
+                    i INTEGER;
+                    a_user_ids BIGINT[] := '{}';
+                    a_usernames VARCHAR(100)[] := '{}';
+                    a_full_names VARCHAR(200)[] := '{}';
+                    a_emojis TEXT[] := '{}';
+                    a_positions INTEGER[] := '{}';
+                    a_taken TEXT[];
+                BEGIN
+                    -- Блокируем строку конкурса: пачки одного конкурса пишутся по очереди
+                    SELECT c.participants_count, c.status INTO v_capacity, v_status
+                    FROM contests c WHERE c.id = p_contest_id
+                    FOR UPDATE;
+                    v_found := FOUND;
+                    
+                    SELECT COUNT(*), COALESCE(array_agg(p.comment_text), '{}') INTO v_count, a_taken
+                    FROM participants p WHERE p.contest_id = p_contest_id;
+                    
+                    -- Заявки обрабатываются строго в порядке массива
+                    FOR i IN 1 .. COALESCE(array_length(p_user_ids, 1), 0) LOOP
+                        reg_user_id := p_user_ids[i];
+                        assigned_position := NULL;
+                        assigned_emoji := NULL;
+                        
+                        IF p_user_ids[i] = ANY(a_user_ids) OR EXISTS (
+                            SELECT 1 FROM participants p
+                            WHERE p.contest_id = p_contest_id AND p.user_id = p_user_ids[i]
+                        ) THEN
+                            result := 'exists';
+                        ELSIF NOT v_found OR v_status <> 'collecting' THEN
+                            result := 'closed';
+                        ELSIF v_count >= v_capacity THEN
+                            result := 'full';
+                        ELSE
+                            -- Эмодзи уже занят (выдан другим экземпляром) — берём свободный из набора,
+                            -- а если свободных нет, оставляем предложенный повтор
+                            assigned_emoji := p_emojis[i];
+                            IF assigned_emoji = ANY(a_taken) THEN
+                                SELECT COALESCE(MIN(e), assigned_emoji) INTO assigned_emoji
+                                FROM unnest(p_emoji_set) AS e
+                                WHERE NOT e = ANY(a_taken);
+                            END IF;
+                            a_taken := a_taken || assigned_emoji;
+                            
+                            v_count := v_count + 1;
+                            a_user_ids := a_user_ids || p_user_ids[i];
+                            a_usernames := a_usernames || p_usernames[i];
+                            a_full_names := a_full_names || p_full_names[i];
+                            a_emojis := a_emojis || assigned_emoji;
+                            a_positions := a_positions || v_count;
+                            result := 'added';
+                            assigned_position := v_count;
+                        END IF;
+                        
+                        total := v_count;
+                        RETURN NEXT;
+                    END LOOP;
+                    
+                    -- Все принятые заявки — одним многострочным INSERT
+                    INSERT INTO participants
+                        (contest_id, user_id, username, full_name, comment_text, position)
+                    SELECT p_contest_id, u.user_id, u.username, u.full_name, u.emoji, u.pos
+                    FROM unnest(a_user_ids, a_usernames, a_full_names, a_emojis, a_positions)
+                        AS u(user_id, username, full_name, emoji, pos);
+                END;
+                $$
+            ''')
+            
             # Таблица winners
             await conn.execute('''
                 CREATE TABLE IF NOT EXISTS winners (
@@ -106,6 +223,10 @@ class DatabasePostgres:
             # Индексы для referrals
             await conn.execute('CREATE INDEX IF NOT EXISTS idx_referrals_referrer ON referrals(referrer_id)')
             await conn.execute('CREATE INDEX IF NOT EXISTS idx_referrals_referred ON referrals(referred_id)')
+            await conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_referrals_subscribed
+                ON referrals(referrer_id) WHERE subscribed = TRUE
+            ''')
             
             # Таблица user_stats
             await conn.execute('''
@@ -132,6 +253,25 @@ class DatabasePostgres:
             await conn.execute('CREATE INDEX IF NOT EXISTS idx_user_stats_total_wins ON user_stats(total_wins DESC)')
             await conn.execute('CREATE INDEX IF NOT EXISTS idx_user_stats_referrals ON user_stats(referral_points DESC)')
             
+            # Сверка referral_points с подписавшимися рефералами
+            # (раньше очко могло начисляться повторно)
+            await conn.execute('''
+                INSERT INTO user_stats (user_id, referral_points)
+                SELECT referrer_id, COUNT(*) FROM referrals
+                WHERE subscribed = TRUE
+                GROUP BY referrer_id
+                ON CONFLICT (user_id) DO UPDATE
+                SET referral_points = EXCLUDED.referral_points
+                WHERE user_stats.referral_points <> EXCLUDED.referral_points
+            ''')
+            await conn.execute('''
+                UPDATE user_stats SET referral_points = 0
+                WHERE referral_points > 0 AND NOT EXISTS (
+                    SELECT 1 FROM referrals
+                    WHERE referrer_id = user_stats.user_id AND subscribed = TRUE
+                )
+            ''')
+            
             # Таблица achievements
             await conn.execute('''
                 CREATE TABLE IF NOT EXISTS achievements (
@@ -162,6 +302,137 @@ class DatabasePostgres:
             await conn.execute('CREATE INDEX IF NOT EXISTS idx_spam_contest ON spam_messages(contest_id)')
             await conn.execute('CREATE INDEX IF NOT EXISTS idx_spam_leaderboard ON spam_messages(contest_id, spam_count DESC)')
             
+            # Таблица channel_subscribers (локальное множество подписчиков канала)
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS channel_subscribers (
+                    user_id BIGINT PRIMARY KEY,
+                    is_member BOOLEAN NOT NULL,
+                    updated_at TIMESTAMP DEFAULT NOW()
+                )
+            ''')
+            
+            # Таблица users (справочник имён пользователей)
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    user_id BIGINT PRIMARY KEY,
+                    username VARCHAR(255),
+                    full_name VARCHAR(255),
+                    last_seen TIMESTAMP DEFAULT NOW()
+                )
+            ''')
+            
+            # Первичное заполнение из участников конкурсов (только пустой таблицы)
+            await conn.execute('''
+                INSERT INTO users (user_id, username, full_name, last_seen)
+                SELECT DISTINCT ON (user_id) user_id, username, full_name, added_at
+                FROM participants
+                WHERE NOT EXISTS (SELECT 1 FROM users)
+                ORDER BY user_id, added_at DESC
+                ON CONFLICT (user_id) DO NOTHING
+            ''')
+            
+            # Таблица user_rollups (счётчики пользователей по периодам и типам конкурсов)
+            # period_type: week / month / all; contest_type: тип конкурса или 'all'
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS user_rollups (
+                    period_type VARCHAR(10) NOT NULL,
+                    period_start DATE NOT NULL,
+                    contest_type VARCHAR(50) NOT NULL,
+                    user_id BIGINT NOT NULL,
+                    contests INTEGER DEFAULT 0,
+                    wins INTEGER DEFAULT 0,
+                    PRIMARY KEY (period_type, period_start, contest_type, user_id)
+                )
+            ''')
+            
+            await conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_rollups_wins
+                ON user_rollups(period_type, period_start, contest_type, wins DESC, user_id)
+            ''')
+            await conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_rollups_contests
+                ON user_rollups(period_type, period_start, contest_type, contests DESC, user_id)
+            ''')
+            
+            # Первичное заполнение из participants и winners (только пустой таблицы)
+            await conn.execute('''
+                INSERT INTO user_rollups (period_type, period_start, contest_type, user_id, contests, wins)
+                SELECT p.period_type, p.period_start, t.contest_type, e.user_id,
+                       SUM(e.contests), SUM(e.wins)
+                FROM (
+                    SELECT pt.user_id, c.contest_type, pt.added_at AS at, 1 AS contests, 0 AS wins
+                    FROM participants pt JOIN contests c ON c.id = pt.contest_id
+                    UNION ALL
+                    SELECT w.user_id, c.contest_type, w.won_at, 0, 1
+                    FROM winners w JOIN contests c ON c.id = w.contest_id
+                ) e
+                CROSS JOIN LATERAL (VALUES
+                    ('week', date_trunc('week', e.at)::date),
+                    ('month', date_trunc('month', e.at)::date),
+                    ('all', DATE '1970-01-01')
+                ) AS p(period_type, period_start)
+                CROSS JOIN LATERAL (VALUES (e.contest_type), ('all')) AS t(contest_type)
+                WHERE NOT EXISTS (SELECT 1 FROM user_rollups)
+                GROUP BY p.period_type, p.period_start, t.contest_type, e.user_id
+                ON CONFLICT DO NOTHING
+            ''')
+            
+            # Таблица rank_snapshots (ежедневные снимки рейтингов)
+            # Один ряд на день и категорию: user_ids упорядочены по месту, scores — в том же порядке
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS rank_snapshots (
+                    snapshot_date DATE NOT NULL,
+                    category VARCHAR(20) NOT NULL,
+                    user_ids BIGINT[] NOT NULL,
+                    scores INTEGER[] NOT NULL,
+                    PRIMARY KEY (snapshot_date, category)
+                )
+            ''')
+            
+            # Таблица job_state (позиции фоновых задач для продолжения после рестарта)
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS job_state (
+                    job_name VARCHAR(50) PRIMARY KEY,
+                    cursor BIGINT NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT NOW()
+                )
+            ''')
+            
+            # Таблица contest_jobs (таймеры конкурсов с абсолютными дедлайнами)
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS contest_jobs (
+                    job_key VARCHAR(50) PRIMARY KEY,
+                    contest_id INTEGER NOT NULL REFERENCES contests(id) ON DELETE CASCADE,
+                    stage VARCHAR(20) NOT NULL,
+                    deadline TIMESTAMPTZ,
+                    tick_interval REAL,
+                    status VARCHAR(20) NOT NULL DEFAULT 'scheduled',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    created_at TIMESTAMP DEFAULT NOW(),
+                    updated_at TIMESTAMP DEFAULT NOW()
+                )
+            ''')
+            await conn.execute('CREATE INDEX IF NOT EXISTS idx_contest_jobs_contest ON contest_jobs(contest_id)')
+            
+            # Живые экземпляры бота (отметку обновляет utils.leader_election)
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS bot_instances (
+                    instance_id VARCHAR(32) PRIMARY KEY,
+                    seen_at TIMESTAMP NOT NULL DEFAULT NOW()
+                )
+            ''')
+            
+            # Подтверждения финального сброса счётчиков спам-конкурса экземплярами
+            await conn.execute('''
+                CREATE TABLE IF NOT EXISTS spam_flush_acks (
+                    contest_id INTEGER NOT NULL REFERENCES contests(id) ON DELETE CASCADE,
+                    instance_id VARCHAR(32) NOT NULL,
+                    flushed_at TIMESTAMP DEFAULT NOW(),
+                    PRIMARY KEY (contest_id, instance_id)
+                )
+            ''')
+            
             print("✅ PostgreSQL база данных инициализирована!")
     
 # ==================== CONTESTS ====================
@@ -176,10 +447,16 @@ class DatabasePostgres:
                 (contest_type, status, prize, conditions, entry_conditions, 
                 participants_count, timer_minutes)
                 VALUES ($1::VARCHAR(50), $2::VARCHAR(20), $3::TEXT, $4::TEXT, $5::JSONB, $6::INTEGER, $7::INTEGER)
-                RETURNING id
+                RETURNING *
             ''', contest_type, 'collecting', prize, conditions, json.dumps(entry_conditions),
                 participants_count, timer_minutes)
             
+            # Регистрируем конкурс в реестре активных (и у остальных экземпляров)
+            contest = dict(row)
+            contest['entry_conditions'] = entry_conditions
+            contest_registry.add(contest)
+            await self._notify_registry(conn, row['id'])
+            
             return row['id']
 
     async def get_active_contests(self) -> List[Dict]:
@@ -189,7 +466,7 @@ class DatabasePostgres:
                 SELECT *, 
                     entry_conditions::text as entry_conditions_json
                 FROM contests 
-                WHERE status IN ('collecting', 'voting', 'running', 'ready_to_start')
+                WHERE status IN ('collecting', 'voting', 'running', 'finishing', 'ready_to_start')
                 ORDER BY created_at DESC
             ''')
             
@@ -251,19 +528,47 @@ class DatabasePostgres:
                 contest['entry_conditions'] = json.loads(contest['entry_conditions_json'])
             return contest
     
-    async def update_contest_status(self, contest_id: int, status: str):
-        """Обновить статус конкурса"""
+    async def transition_contest(self, contest_id: int, expected, status: str) -> bool:
+        """
+        Перевести конкурс в status, только если текущий статус — expected
+        (compare-and-set: из одновременных вызовов переход выполняет один)
+        
+        Args:
+            expected: ожидаемый статус или кортеж статусов
+            status: новый статус (переход должен быть в CONTEST_TRANSITIONS)
+        
+        Returns:
+            True если переход выполнил этот вызов — он и запускает следующий этап
+            (остальные экземпляры узнают о смене статуса в той же транзакции)
+        """
+        if isinstance(expected, str):
+            expected = (expected,)
+        for current in expected:
+            if status not in CONTEST_TRANSITIONS.get(current, ()):
+                raise ValueError(f"Недопустимый переход конкурса: {current} -> {status}")
+        
         async with self.pool.acquire() as conn:
-            await conn.execute('''
-                UPDATE contests 
-                SET status = $1::VARCHAR(20), 
-                    ended_at = CASE 
-                        WHEN $1::VARCHAR(20) = 'ended' 
-                        THEN NOW() 
-                        ELSE ended_at 
-                    END
-                WHERE id = $2
-            ''', status, contest_id)
+            updated = await conn.fetchval('''
+                WITH updated AS (
+                    UPDATE contests 
+                    SET status = $1::VARCHAR(20), 
+                        ended_at = CASE 
+                            WHEN $1::VARCHAR(20) = 'ended' 
+                            THEN NOW() 
+                            ELSE ended_at 
+                        END
+                    WHERE id = $2 AND status = ANY($3::VARCHAR(20)[])
+                    RETURNING id
+                )
+                SELECT id, pg_notify($4, $5) FROM updated
+            ''', status, contest_id, list(expected),
+                config.CLUSTER_CHANNEL, leader_election.payload("registry", contest_id))
+        
+        if updated is None:
+            return False
+        
+        contest_registry.set_status(contest_id, status)
+        return True
     
     async def set_announcement_message(self, contest_id: int, message_id: int):
         """Сохранить ID сообщения анонса"""
@@ -271,6 +576,9 @@ class DatabasePostgres:
             await conn.execute('''
                 UPDATE contests SET announcement_message_id = $1 WHERE id = $2
             ''', message_id, contest_id)
+            await self._notify_registry(conn, contest_id)
+        
+        contest_registry.set_announcement(contest_id, message_id)
     
     async def set_discussion_message(self, contest_id: int, message_id: int):
         """Сохранить ID сообщения в группе"""
@@ -279,37 +587,168 @@ class DatabasePostgres:
                 UPDATE contests SET discussion_message_id = $1 WHERE id = $2
             ''', message_id, contest_id)
     
+    # ==================== CLUSTER EVENTS ====================
+    
+    async def notify_cluster(self, kind: str, *args):
+        """Событие для остальных экземпляров бота (LISTEN/NOTIFY)"""
+        async with self.pool.acquire() as conn:
+            await conn.execute('SELECT pg_notify($1, $2)',
+                               config.CLUSTER_CHANNEL, leader_election.payload(kind, *args))
+    
+    async def notify_cluster_batch(self, payloads: List[str]):
+        """Пачка готовых событий (utils.leader_election.publish) одним запросом"""
+        async with self.pool.acquire() as conn:
+            await conn.execute('SELECT pg_notify($1, p) FROM unnest($2::TEXT[]) AS p',
+                               config.CLUSTER_CHANNEL, payloads)
+    
+    async def _notify_registry(self, conn, contest_id: int):
+        """Остальные экземпляры перечитают конкурс в свой реестр"""
+        await conn.execute('SELECT pg_notify($1, $2)',
+                           config.CLUSTER_CHANNEL, leader_election.payload("registry", contest_id))
+    
+    # ==================== CONTEST JOBS ====================
+    
+    async def save_contest_job(self, job_key: str, contest_id: int, stage: str,
+                               deadline: Optional[float], tick_interval: Optional[float]) -> Tuple[str, int]:
+        """
+        Записать задачу планировщика (deadline — unix-время или None)
+        
+        Задача с тем же дедлайном (восстановление после рестарта) сохраняет
+        статус, попытки и последнюю ошибку; новый дедлайн начинает их заново
+        
+        Returns:
+            (status, attempts) задачи после записи
+        """
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow('''
+                INSERT INTO contest_jobs (job_key, contest_id, stage, deadline, tick_interval)
+                VALUES ($1, $2, $3, to_timestamp($4), $5)
+                ON CONFLICT (job_key) DO UPDATE
+                SET stage = EXCLUDED.stage,
+                    tick_interval = EXCLUDED.tick_interval,
+                    status = CASE WHEN contest_jobs.deadline IS NOT DISTINCT FROM EXCLUDED.deadline
+                                  THEN contest_jobs.status ELSE 'scheduled' END,
+                    attempts = CASE WHEN contest_jobs.deadline IS NOT DISTINCT FROM EXCLUDED.deadline
+                                    THEN contest_jobs.attempts ELSE 0 END,
+                    last_error = CASE WHEN contest_jobs.deadline IS NOT DISTINCT FROM EXCLUDED.deadline
+                                      THEN contest_jobs.last_error END,
+                    deadline = EXCLUDED.deadline,
+                    updated_at = NOW()
+                RETURNING status, attempts
+            ''', job_key, contest_id, stage, deadline, tick_interval)
+            return row['status'], row['attempts']
+    
+    async def retry_contest_job(self, job_key: str, attempts: int, error: str, deadline: float):
+        """Дедлайн упал — повтор в deadline"""
+        async with self.pool.acquire() as conn:
+            await conn.execute('''
+                UPDATE contest_jobs
+                SET attempts = $2, last_error = $3, deadline = to_timestamp($4), updated_at = NOW()
+                WHERE job_key = $1
+            ''', job_key, attempts, error, deadline)
+    
+    async def fail_contest_job(self, job_key: str, attempts: int, error: str):
+        """Попытки исчерпаны — задача остаётся в таблице со статусом failed"""
+        async with self.pool.acquire() as conn:
+            await conn.execute('''
+                UPDATE contest_jobs
+                SET status = 'failed', attempts = $2, last_error = $3, updated_at = NOW()
+                WHERE job_key = $1
+            ''', job_key, attempts, error)
+    
+    async def delete_contest_job(self, job_key: str):
+        """Этап выполнен или отменён"""
+        async with self.pool.acquire() as conn:
+            await conn.execute('DELETE FROM contest_jobs WHERE job_key = $1', job_key)
+    
+    async def delete_contest_jobs(self, contest_id: int):
+        """Удалить все задачи конкурса"""
+        async with self.pool.acquire() as conn:
+            await conn.execute('DELETE FROM contest_jobs WHERE contest_id = $1', contest_id)
+    
+    async def get_contest_jobs(self) -> List[Dict]:
+        """
+        Все задачи конкурсов одним запросом (deadline — unix-время или None)
+        Задачи завершённых конкурсов удаляются в том же запросе
+        """
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch('''
+                WITH stale AS (
+                    DELETE FROM contest_jobs j
+                    USING contests c
+                    WHERE c.id = j.contest_id AND c.status = 'ended'
+                    RETURNING j.job_key
+                )
+                SELECT j.job_key, j.contest_id, j.stage,
+                       EXTRACT(EPOCH FROM j.deadline)::DOUBLE PRECISION AS deadline,
+                       j.tick_interval, j.status, j.attempts, j.last_error, j.updated_at
+                FROM contest_jobs j
+                WHERE j.job_key NOT IN (SELECT job_key FROM stale)
+                ORDER BY j.deadline NULLS LAST, j.job_key
+            ''')
+        
+        return [dict(row) for row in rows]
+    
     # ==================== PARTICIPANTS ====================
     
-    async def add_participant(self, contest_id: int, user_id: int, 
-                            username: str, full_name: str, emoji: str) -> bool:
-        """Добавить участника с проверкой уникальности"""
+    async def add_participants_batch(self, contest_id: int, entries: List[Dict]) -> List[Dict]:
+        """
+        Атомарно зарегистрировать пачку участников одним запросом
+        (функция register_participants, заявки обрабатываются по порядку)
+        
+        Args:
+            entries: [{'user_id', 'username', 'full_name', 'emoji'}, ...]
+        
+        Returns:
+            Для каждой заявки в том же порядке:
+            {'user_id', 'status': 'added' | 'exists' | 'full' | 'closed',
+             'position': присвоенная позиция или None,
+             'count': количество участников после обработки заявки,
+             'emoji': записанный эмодзи (другой, если предложенный уже занят) или None}
+        """
+        if not entries:
+            return []
+        
         async with self.pool.acquire() as conn:
-            # Проверяем существование
-            exists = await conn.fetchval('''
-                SELECT EXISTS(
-                    SELECT 1 FROM participants 
-                    WHERE contest_id = $1::INTEGER AND user_id = $2::BIGINT
+            rows = await conn.fetch('''
+                SELECT * FROM register_participants(
+                    $1::INTEGER, $2::BIGINT[], $3::VARCHAR(100)[], $4::VARCHAR(200)[], $5::TEXT[], $6::TEXT[]
                 )
-            ''', contest_id, user_id)
-            
-            if exists:
-                return False
-            
-            # Получаем позицию
-            position = await conn.fetchval('''
-                SELECT COALESCE(MAX(position), 0) + 1 
-                FROM participants WHERE contest_id = $1::INTEGER
-            ''', contest_id)
-            
-            # Добавляем
-            await conn.execute('''
-                INSERT INTO participants 
-                (contest_id, user_id, username, full_name, comment_text, position)
-                VALUES ($1::INTEGER, $2::BIGINT, $3::VARCHAR(100), $4::VARCHAR(200), $5::TEXT, $6::INTEGER)
-            ''', contest_id, user_id, username or 'noname', full_name, emoji, position)
-            
-            return True
+            ''',
+                contest_id,
+                [e['user_id'] for e in entries],
+                [e.get('username') or 'noname' for e in entries],
+                [e.get('full_name') for e in entries],
+                [e.get('emoji') for e in entries],
+                list(config.PARTICIPANT_EMOJIS)
+            )
+        
+        return [
+            {
+                'user_id': row['reg_user_id'],
+                'status': row['result'],
+                'position': row['assigned_position'],
+                'count': row['total'],
+                'emoji': row['assigned_emoji']
+            }
+            for row in rows
+        ]
+    
+    async def add_participant(self, contest_id: int, user_id: int, 
+                            username: str, full_name: str, emoji: str) -> Dict:
+        """
+        Атомарно зарегистрировать одного участника
+        
+        Returns:
+            {'user_id', 'status', 'position', 'count'} — см. add_participants_batch
+        """
+        results = await self.add_participants_batch(contest_id, [{
+            'user_id': user_id,
+            'username': username,
+            'full_name': full_name,
+            'emoji': emoji
+        }])
+        return results[0]
 
 
     async def get_participants(self, contest_id: int) -> List[Dict]:
@@ -346,10 +785,18 @@ class DatabasePostgres:
     async def set_contest_winner(self, contest_id: int, user_id: int, position: int = 1):
         """Сохранить победителя"""
         async with self.pool.acquire() as conn:
-            await conn.execute('''
-                INSERT INTO winners (contest_id, user_id, position)
-                VALUES ($1, $2, $3)
+            contest_type = await conn.fetchval('''
+                WITH w AS (
+                    INSERT INTO winners (contest_id, user_id, position)
+                    VALUES ($1, $2, $3)
+                    RETURNING contest_id
+                )
+                SELECT c.contest_type FROM w JOIN contests c ON c.id = w.contest_id
             ''', contest_id, user_id, position)
+        
+        if contest_type:
+            contest_registry.set_last_winner(contest_type, user_id)
+            leader_election.publish("winner", contest_type, user_id)
     
     async def get_last_winners_by_type(self, contest_type: str, limit: int = 10) -> List[int]:
         """Получить последних победителей определенного типа конкурса"""
@@ -367,87 +814,511 @@ class DatabasePostgres:
     
     # ==================== REFERRALS ====================
     
-    async def add_referral(self, referrer_id: int, referred_id: int):
-        """Добавить реферала"""
+    async def add_referral(self, referrer_id: int, referred_id: int) -> bool:
+        """
+        Добавить реферала
+        
+        Returns:
+            True если добавлен, False если этот пользователь уже приглашён этим реферером
+        """
+        added = await self.add_referrals_batch([(referrer_id, referred_id)])
+        return (referrer_id, referred_id) in added
+    
+    async def add_referrals_batch(self, pairs: List[Tuple[int, int]]) -> set:
+        """
+        Добавить пачку рефералов одним запросом
+        
+        Args:
+            pairs: [(referrer_id, referred_id), ...]
+        
+        Returns:
+            Множество действительно добавленных пар
+        """
+        if not pairs:
+            return set()
+        
         async with self.pool.acquire() as conn:
-            try:
-                await conn.execute('''
-                    INSERT INTO referrals (referrer_id, referred_id)
-                    VALUES ($1, $2)
-                    ON CONFLICT DO NOTHING
+            rows = await conn.fetch('''
+                INSERT INTO referrals (referrer_id, referred_id)
+                SELECT * FROM unnest($1::BIGINT[], $2::BIGINT[])
+                ON CONFLICT (referrer_id, referred_id) DO NOTHING
+                RETURNING referrer_id, referred_id
+            ''', [p[0] for p in pairs], [p[1] for p in pairs])
+        
+        return {(row['referrer_id'], row['referred_id']) for row in rows}
+    
+    async def mark_referral_subscribed(self, referrer_id: int, referred_id: int) -> Optional[int]:
+        """
+        Отметить что реферал подписался
+        
+        Очко начисляется в той же транзакции и только при переходе
+        subscribed FALSE → TRUE, поэтому user_stats.referral_points
+        всегда равно числу подписавшихся рефералов.
+        
+        Returns:
+            Новое количество подписавшихся рефералов у реферера
+            или None, если реферал уже был отмечен (или не найден)
+        """
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                stats = await conn.fetchrow('''
+                    WITH flipped AS (
+                        UPDATE referrals 
+                        SET subscribed = TRUE, points_awarded = TRUE
+                        WHERE referrer_id = $1 AND referred_id = $2 AND subscribed = FALSE
+                        RETURNING referrer_id
+                    )
+                    INSERT INTO user_stats (user_id, referral_points)
+                    SELECT referrer_id, 1 FROM flipped
+                    ON CONFLICT (user_id) DO UPDATE
+                    SET referral_points = user_stats.referral_points + 1,
+                        updated_at = NOW()
+                    RETURNING *
                 ''', referrer_id, referred_id)
-            except:
-                pass
+        
+        if stats is None:
+            # Уже был подписан (повторное нажатие) — счётчик не меняется
+            return None
+        
+        self._cache_stats(stats)
+        rank_index.update('referrals', referrer_id, stats['referral_points'])
+        referral_graph.add_edge(referrer_id, referred_id)
+        leader_election.publish("stats", referrer_id, 'referrals', stats['referral_points'])
+        leader_election.publish("edge", "+", referrer_id, referred_id)
+        leaderboard_service.mark_dirty('referrals')
+        return stats['referral_points']
+    
+    async def get_referral_count(self, user_id: int) -> int:
+        """Получить количество подписавшихся рефералов (user_stats.referral_points)"""
+        stats = await self.get_user_stats(user_id)
+        return stats['referral_points']
     
-    async def mark_referral_subscribed(self, referrer_id: int, referred_id: int):
-        """Отметить что реферал подписался"""
+    async def get_job_cursor(self, job_name: str) -> int:
+        """Сохранённая позиция фоновой задачи (0 — с начала)"""
+        async with self.pool.acquire() as conn:
+            cursor = await conn.fetchval('''
+                SELECT cursor FROM job_state WHERE job_name = $1
+            ''', job_name)
+            return cursor or 0
+    
+    async def set_job_cursor(self, job_name: str, cursor: int):
+        """Сохранить позицию фоновой задачи"""
         async with self.pool.acquire() as conn:
             await conn.execute('''
-                UPDATE referrals 
-                SET subscribed = TRUE, points_awarded = TRUE
-                WHERE referrer_id = $1 AND referred_id = $2
-            ''', referrer_id, referred_id)
-            
-            # Начислить очко рефереру
+                INSERT INTO job_state (job_name, cursor) VALUES ($1, $2)
+                ON CONFLICT (job_name) DO UPDATE
+                SET cursor = EXCLUDED.cursor, updated_at = NOW()
+            ''', job_name, cursor)
+    
+    async def get_confirmed_referrals_page(self, after_id: int, limit: int) -> List[Dict]:
+        """Страница подтверждённых рефералов после after_id (keyset по id)"""
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch('''
+                SELECT id, referrer_id, referred_id, subscribed
+                FROM referrals
+                WHERE id > $1 AND points_awarded = TRUE
+                ORDER BY id
+                LIMIT $2
+            ''', after_id, limit)
+        
+        return [dict(row) for row in rows]
+    
+    async def apply_referral_checks(self, checks: Dict[int, bool], job_name: str, cursor: int) -> int:
+        """
+        Применить результаты перепроверки подписок одной транзакцией
+        
+        Args:
+            checks: {id реферала: подписан ли сейчас}
+            job_name, cursor: позиция проверки, сохраняется в той же транзакции
+        
+        Returns:
+            Сколько рефералов изменили статус
+        """
+        ids = list(checks.keys())
+        statuses = [checks[referral_id] for referral_id in ids]
+        
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                rows = await conn.fetch('''
+                    WITH changed AS (
+                        UPDATE referrals r
+                        SET subscribed = c.subscribed
+                        FROM unnest($1::INTEGER[], $2::BOOLEAN[]) AS c(id, subscribed)
+                        WHERE r.id = c.id AND r.subscribed <> c.subscribed
+                        RETURNING r.referrer_id, r.referred_id,
+                                  CASE WHEN c.subscribed THEN 1 ELSE -1 END AS delta
+                    ),
+                    deltas AS (
+                        SELECT referrer_id, SUM(delta) AS delta, COUNT(*) AS changed,
+                               array_agg(referred_id) FILTER (WHERE delta > 0) AS subscribed_ids,
+                               array_agg(referred_id) FILTER (WHERE delta < 0) AS unsubscribed_ids
+                        FROM changed
+                        GROUP BY referrer_id
+                    ),
+                    updated AS (
+                        UPDATE user_stats us
+                        SET referral_points = GREATEST(us.referral_points + deltas.delta, 0),
+                            updated_at = NOW()
+                        FROM deltas
+                        WHERE us.user_id = deltas.referrer_id
+                        RETURNING us.*
+                    )
+                    SELECT updated.*, deltas.changed, deltas.subscribed_ids, deltas.unsubscribed_ids
+                    FROM updated JOIN deltas ON deltas.referrer_id = updated.user_id
+                ''', ids, statuses)
+                
+                await conn.execute('''
+                    INSERT INTO job_state (job_name, cursor) VALUES ($1, $2)
+                    ON CONFLICT (job_name) DO UPDATE
+                    SET cursor = EXCLUDED.cursor, updated_at = NOW()
+                ''', job_name, cursor)
+        
+        changed = 0
+        for row in rows:
+            stats = dict(row)
+            changed += stats.pop('changed')
+            for referred_id in stats.pop('subscribed_ids') or ():
+                referral_graph.add_edge(stats['user_id'], referred_id)
+                leader_election.publish("edge", "+", stats['user_id'], referred_id)
+            for referred_id in stats.pop('unsubscribed_ids') or ():
+                referral_graph.remove_edge(stats['user_id'], referred_id)
+                leader_election.publish("edge", "-", stats['user_id'], referred_id)
+            self._cache_stats(stats)
+            rank_index.update('referrals', stats['user_id'], stats['referral_points'])
+            leader_election.publish("stats", stats['user_id'], 'referrals', stats['referral_points'])
+        
+        if rows:
+            leaderboard_service.mark_dirty('referrals')
+        return changed
+    
+    async def get_subscribed_referral_edges(self) -> List[Dict]:
+        """Связи «реферер → подписавшийся реферал» для графа (utils.referral_graph)"""
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch('''
+                SELECT referrer_id, referred_id
+                FROM referrals
+                WHERE subscribed = TRUE
+                ORDER BY referrer_id
+            ''')
+        
+        return [dict(row) for row in rows]
+    
+    # ==================== CHANNEL SUBSCRIBERS ====================
+    
+    async def set_channel_subscriber(self, user_id: int, is_member: bool):
+        """Сохранить статус подписки на канал"""
+        async with self.pool.acquire() as conn:
             await conn.execute('''
-                INSERT INTO user_stats (user_id, referral_points)
-                VALUES ($1, 1)
+                INSERT INTO channel_subscribers (user_id, is_member)
+                VALUES ($1, $2)
                 ON CONFLICT (user_id) DO UPDATE
-                SET referral_points = user_stats.referral_points + 1,
+                SET is_member = EXCLUDED.is_member,
                     updated_at = NOW()
-            ''', referrer_id)
+            ''', user_id, is_member)
     
-    async def get_referral_count(self, user_id: int) -> int:
-        """Получить количество рефералов"""
+    async def delete_channel_subscriber(self, user_id: int):
+        """Забыть статус подписки (пользователь снова неизвестен)"""
         async with self.pool.acquire() as conn:
-            count = await conn.fetchval('''
-                SELECT COUNT(*) FROM referrals 
-                WHERE referrer_id = $1 AND subscribed = TRUE
-            ''', user_id)
-            return count or 0
+            await conn.execute('DELETE FROM channel_subscribers WHERE user_id = $1', user_id)
     
-    async def check_referral_exists(self, referrer_id: int, referred_id: int) -> bool:
-        """Проверить существует ли реферал"""
+    async def get_channel_subscribers(self) -> tuple[List[int], List[int]]:
+        """Получить ID подписчиков и отписавшихся (для загрузки в память)"""
         async with self.pool.acquire() as conn:
-            exists = await conn.fetchval('''
-                SELECT EXISTS(SELECT 1 FROM referrals 
-                WHERE referrer_id = $1 AND referred_id = $2)
-            ''', referrer_id, referred_id)
-            return exists
+            rows = await conn.fetch('SELECT user_id, is_member FROM channel_subscribers')
+        
+        members = [row['user_id'] for row in rows if row['is_member']]
+        non_members = [row['user_id'] for row in rows if not row['is_member']]
+        return members, non_members
+    
+    # ==================== ROLLUPS ====================
+    
+    @staticmethod
+    async def _bump_rollups(conn, user_id: int, contest_type: str,
+                            contests: int = 0, wins: int = 0):
+        """Добавить к счётчикам пользователя за неделю, месяц и всё время (свой тип и 'all')"""
+        await conn.execute('''
+            INSERT INTO user_rollups (period_type, period_start, contest_type, user_id, contests, wins)
+            SELECT p.period_type, p.period_start, t.contest_type, $1, $3, $4
+            FROM (VALUES
+                ('week', date_trunc('week', NOW())::date),
+                ('month', date_trunc('month', NOW())::date),
+                ('all', DATE '1970-01-01')
+            ) AS p(period_type, period_start)
+            CROSS JOIN (VALUES ($2::VARCHAR), ('all')) AS t(contest_type)
+            ON CONFLICT (period_type, period_start, contest_type, user_id) DO UPDATE
+            SET contests = user_rollups.contests + EXCLUDED.contests,
+                wins = user_rollups.wins + EXCLUDED.wins
+        ''', user_id, contest_type, contests, wins)
+    
+    async def get_rollup_leaderboard(self, period_type: str, contest_type: str,
+                                     metric: str, limit: int = 10) -> List[Dict]:
+        """
+        Топ за период по типу конкурса
+        
+        Args:
+            period_type: 'week', 'month' или 'all' (текущий период)
+            contest_type: тип конкурса или 'all'
+            metric: 'wins' или 'contests'
+        """
+        column = 'wins' if metric == 'wins' else 'contests'
+        
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(f'''
+                SELECT 
+                    r.user_id,
+                    u.username,
+                    u.full_name,
+                    r.{column} as score,
+                    ROW_NUMBER() OVER (ORDER BY r.{column} DESC, r.user_id) as rank
+                FROM user_rollups r
+                LEFT JOIN users u ON u.user_id = r.user_id
+                WHERE r.period_type = $1
+                  AND r.period_start = CASE $1
+                      WHEN 'week' THEN date_trunc('week', NOW())::date
+                      WHEN 'month' THEN date_trunc('month', NOW())::date
+                      ELSE DATE '1970-01-01'
+                  END
+                  AND r.contest_type = $2
+                  AND r.{column} > 0
+                ORDER BY r.{column} DESC, r.user_id
+                LIMIT $3
+            ''', period_type, contest_type, limit)
+        
+        return [dict(row) for row in rows]
+    
+    # ==================== RANK SNAPSHOTS ====================
+    
+    async def take_rank_snapshot(self, category: str, column: str) -> bool:
+        """
+        Снимок рейтинга категории за сегодня (из user_stats)
+        
+        Returns:
+            True если снимок создан, False если за сегодня он уже есть
+        """
+        async with self.pool.acquire() as conn:
+            created = await conn.fetchval(f'''
+                INSERT INTO rank_snapshots (snapshot_date, category, user_ids, scores)
+                SELECT CURRENT_DATE, $1::VARCHAR,
+                       COALESCE(array_agg(user_id ORDER BY {column} DESC, user_id), '{{}}'),
+                       COALESCE(array_agg({column} ORDER BY {column} DESC, user_id), '{{}}')
+                FROM user_stats
+                WHERE {column} > 0
+                ON CONFLICT (snapshot_date, category) DO NOTHING
+                RETURNING TRUE
+            ''', category)
+            return bool(created)
+    
+    async def diff_rank_snapshots(self, category: str, top_size: int) -> List[Dict]:
+        """
+        Сравнить сегодняшний снимок с предыдущим одним запросом
+        
+        Returns:
+            [{'user_id', 'old_rank', 'new_rank'}, ...] — кто вошёл в топ
+            и кого обогнали внутри топа (old_rank None — раньше не было в рейтинге)
+        """
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch('''
+                WITH snaps AS (
+                    SELECT snapshot_date, user_ids,
+                           ROW_NUMBER() OVER (ORDER BY snapshot_date DESC) AS age
+                    FROM rank_snapshots
+                    WHERE category = $1 AND snapshot_date <= CURRENT_DATE
+                    ORDER BY snapshot_date DESC
+                    LIMIT 2
+                ),
+                cur AS (
+                    SELECT u.user_id, u.pos FROM snaps s,
+                    unnest(s.user_ids) WITH ORDINALITY AS u(user_id, pos)
+                    WHERE s.age = 1
+                ),
+                prev AS (
+                    SELECT u.user_id, u.pos FROM snaps s,
+                    unnest(s.user_ids) WITH ORDINALITY AS u(user_id, pos)
+                    WHERE s.age = 2
+                )
+                SELECT COALESCE(cur.user_id, prev.user_id) AS user_id,
+                       prev.pos AS old_rank, cur.pos AS new_rank
+                FROM cur FULL JOIN prev ON prev.user_id = cur.user_id
+                WHERE EXISTS (SELECT 1 FROM snaps WHERE age = 2)
+                  AND (
+                      -- вошёл в топ
+                      (cur.pos <= $2 AND (prev.pos IS NULL OR prev.pos > $2))
+                      -- был в топе и опустился
+                      OR (prev.pos <= $2 AND (cur.pos IS NULL OR cur.pos > prev.pos))
+                  )
+            ''', category, top_size)
+        
+        return [dict(row) for row in rows]
+    
+    async def get_rank_history(self, user_id: int, days: int = 7) -> List[Dict]:
+        """
+        История мест пользователя по дням
+        
+        Returns:
+            [{'snapshot_date', 'category', 'position', 'score'}, ...] от новых к старым
+            (position None — пользователя не было в рейтинге)
+        """
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch('''
+                SELECT snapshot_date, category, pos AS position, scores[pos] AS score
+                FROM (
+                    SELECT snapshot_date, category, scores,
+                           array_position(user_ids, $1::BIGINT) AS pos
+                    FROM rank_snapshots
+                    WHERE snapshot_date > CURRENT_DATE - $2::INTEGER
+                ) s
+                ORDER BY snapshot_date DESC, category
+            ''', user_id, days)
+        
+        return [dict(row) for row in rows]
+    
+    # ==================== USERS ====================
+    
+    async def upsert_users(self, users: List[Dict]):
+        """
+        Пачкой обновить справочник пользователей (один запрос)
+        
+        Args:
+            users: [{'user_id', 'username', 'full_name'}, ...]
+        """
+        if not users:
+            return
+        
+        async with self.pool.acquire() as conn:
+            await conn.execute('''
+                INSERT INTO users (user_id, username, full_name, last_seen)
+                SELECT u.user_id, u.username, u.full_name, NOW()
+                FROM unnest($1::BIGINT[], $2::VARCHAR[], $3::VARCHAR[])
+                     AS u(user_id, username, full_name)
+                ON CONFLICT (user_id) DO UPDATE
+                SET username = EXCLUDED.username,
+                    full_name = EXCLUDED.full_name,
+                    last_seen = NOW()
+            ''', [u['user_id'] for u in users],
+                [u['username'] for u in users],
+                [u['full_name'] for u in users])
+    
+    async def get_users(self, user_ids: List[int]) -> Dict[int, Dict]:
+        """Имена пользователей по ID: {user_id: {'user_id', 'username', 'full_name'}}"""
+        if not user_ids:
+            return {}
+        
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch('''
+                SELECT user_id, username, full_name
+                FROM users
+                WHERE user_id = ANY($1::BIGINT[])
+            ''', list(user_ids))
+        
+        return {row['user_id']: dict(row) for row in rows}
     
     # ==================== USER STATS ====================
     
+    def _cache_stats(self, row) -> Dict:
+        """Положить строку user_stats в кэш (после чтения или RETURNING *)"""
+        stats = dict(row)
+        self._stats_cache[stats['user_id']] = (stats, time.monotonic())
+        self._stats_cache.move_to_end(stats['user_id'])
+        while len(self._stats_cache) > self._stats_cache_size:
+            self._stats_cache.popitem(last=False)
+        return stats
+    
+    def forget_stats(self, user_id: int):
+        """Убрать пользователя из кэша user_stats (строку изменил другой экземпляр)"""
+        self._stats_cache.pop(user_id, None)
+    
+    def invalidate_stats_cache(self):
+        """Сбросить кэш user_stats (после массовых UPDATE)"""
+        self._stats_cache.clear()
+    
     async def get_user_stats(self, user_id: int) -> Dict:
-        """Получить статистику пользователя"""
+        """
+        Получить статистику пользователя
+        
+        Читается через LRU/TTL-кэш; для неизвестного пользователя
+        возвращаются нули без создания строки.
+        """
+        cached = self._stats_cache.get(user_id)
+        if cached is not None:
+            stats, loaded_at = cached
+            if time.monotonic() - loaded_at < self._stats_cache_ttl:
+                self._stats_cache.move_to_end(user_id)
+                return dict(stats)
+        
         async with self.pool.acquire() as conn:
             row = await conn.fetchrow('''
                 SELECT * FROM user_stats WHERE user_id = $1
             ''', user_id)
-            
-            if not row:
-                # Создать если нет
-                await conn.execute('''
-                    INSERT INTO user_stats (user_id) VALUES ($1)
-                ''', user_id)
-                row = await conn.fetchrow('''
-                    SELECT * FROM user_stats WHERE user_id = $1
-                ''', user_id)
+        
+        if row is None:
+            row = {'user_id': user_id, **{column: 0 for column in USER_STATS_COUNTERS},
+                   'created_at': None, 'updated_at': None}
+        
+        return dict(self._cache_stats(row))
+    
+    async def get_user_facts(self, user_id: int) -> Dict:
+        """
+        Снимок фактов пользователя для условий участия — один запрос
+        (участия в конкурсах и подписанные рефералы, без создания строки user_stats)
+        """
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow('''
+                SELECT
+                    COALESCE(s.total_contests, 0) AS total_contests,
+                    COALESCE(s.referral_points, 0) AS referral_count
+                FROM (SELECT 1) AS one
+                LEFT JOIN user_stats s ON s.user_id = $1
+            ''', user_id)
             
             return dict(row)
     
-    async def increment_user_contests(self, user_id: int):
-        """Увеличить счетчик участий"""
+    async def get_achievement_progress(self, user_id: int) -> Dict:
+        """
+        Прогресс достижений одним запросом: счётчики, рефералы
+        и разблокированные уровни (без создания строки user_stats)
+        """
         async with self.pool.acquire() as conn:
-            await conn.execute('''
-                INSERT INTO user_stats (user_id, total_contests)
-                VALUES ($1, 1)
-                ON CONFLICT (user_id) DO UPDATE
-                SET total_contests = user_stats.total_contests + 1,
-                    updated_at = NOW()
+            row = await conn.fetchrow('''
+                SELECT
+                    COALESCE(s.total_contests, 0) AS total_contests,
+                    COALESCE(s.total_wins, 0) AS total_wins,
+                    COALESCE(s.best_win_streak, 0) AS best_win_streak,
+                    COALESCE(s.referral_points, 0) AS referral_count,
+                    ARRAY(SELECT achievement_type || ':' || achievement_level
+                          FROM achievements WHERE user_id = $1) AS unlocked
+                FROM (SELECT 1) AS one
+                LEFT JOIN user_stats s ON s.user_id = $1
             ''', user_id)
+            
+            progress = dict(row)
+            progress['unlocked'] = {
+                tuple(key.split(':', 1)) for key in progress['unlocked']
+            }
+            return progress
+    
+    async def increment_user_contests(self, user_id: int, contest_type: str) -> int:
+        """Увеличить счетчик участий (и счётчики за периоды), вернуть новое значение"""
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                stats = await conn.fetchrow('''
+                    INSERT INTO user_stats (user_id, total_contests)
+                    VALUES ($1, 1)
+                    ON CONFLICT (user_id) DO UPDATE
+                    SET total_contests = user_stats.total_contests + 1,
+                        updated_at = NOW()
+                    RETURNING *
+                ''', user_id)
+                await self._bump_rollups(conn, user_id, contest_type, contests=1)
+        
+        total = self._cache_stats(stats)['total_contests']
+        
+        rank_index.update('contests', user_id, total)
+        leaderboard_service.mark_dirty('contests')
+        leader_election.publish("stats", user_id, 'contests', total)
+        return total
     
-    async def increment_user_wins(self, user_id: int, contest_type: str):
-        """Увеличить счетчик побед"""
+    async def increment_user_wins(self, user_id: int, contest_type: str) -> int:
+        """Увеличить счетчик побед (и счётчики за периоды), вернуть новое значение total_wins"""
         type_column = f"{contest_type.replace('_contest', '')}_wins"
         
         async with self.pool.acquire() as conn:
@@ -460,8 +1331,18 @@ class DatabasePostgres:
                     current_win_streak = user_stats.current_win_streak + 1,
                     best_win_streak = GREATEST(user_stats.best_win_streak, user_stats.current_win_streak + 1),
                     updated_at = NOW()
+                RETURNING *
             '''
-            await conn.execute(query, user_id)
+            async with conn.transaction():
+                stats = await conn.fetchrow(query, user_id)
+                await self._bump_rollups(conn, user_id, contest_type, wins=1)
+        
+        total_wins = self._cache_stats(stats)['total_wins']
+        
+        rank_index.update('wins', user_id, total_wins)
+        leaderboard_service.mark_dirty('wins')
+        leader_election.publish("stats", user_id, 'wins', total_wins)
+        return total_wins
     
     async def get_top_by_referrals(self, limit: int = 10) -> List[Dict]:
         """Топ по рефералам"""
@@ -502,60 +1383,45 @@ class DatabasePostgres:
             
             return [dict(row) for row in rows]
     
-    async def get_user_position(self, user_id: int, leaderboard_type: str) -> tuple[int, int]:
-        """Получить позицию в рейтинге и общее количество участников"""
-        column_map = {
-            'referrals': 'referral_points',
-            'wins': 'total_wins',
-            'contests': 'total_contests'
-        }
-        
-        column = column_map.get(leaderboard_type, 'total_wins')
-        
+    async def get_rank_scores(self) -> List[Dict]:
+        """Счётчики всех пользователей для индекса мест (utils.rank_index)"""
         async with self.pool.acquire() as conn:
-            # Получаем позицию пользователя
-            position_row = await conn.fetchrow(f'''
-                WITH ranked AS (
-                    SELECT user_id, 
-                        ROW_NUMBER() OVER (ORDER BY {column} DESC) as position
-                    FROM user_stats
-                    WHERE {column} > 0
-                )
-                SELECT position FROM ranked WHERE user_id = $1
-            ''', user_id)
-            
-            # Получаем общее количество участников с ненулевым значением
-            total = await conn.fetchval(f'''
-                SELECT COUNT(*) FROM user_stats WHERE {column} > 0
+            rows = await conn.fetch('''
+                SELECT user_id, referral_points, total_wins, total_contests
+                FROM user_stats
+                WHERE referral_points > 0 OR total_wins > 0 OR total_contests > 0
             ''')
             
-            # Если пользователя нет в рейтинге - он на последнем месте
-            position = position_row['position'] if position_row else (total + 1 if total else 1)
-            
-            return (position, total)
-            
-            async with self.pool.acquire() as conn:
-                position = await conn.fetchval(f'''
-                    SELECT COUNT(*) + 1
-                    FROM user_stats
-                    WHERE {column} > (
-                        SELECT {column} FROM user_stats WHERE user_id = $1
-                    )
-                ''', user_id)
-                
-                return position or 0
+            return [dict(row) for row in rows]
     
     # ==================== ACHIEVEMENTS ==================== #
     
-    async def check_and_unlock_achievement(self, user_id: int, achievement_type: str, 
-                                         achievement_level: str):
-        """Проверить и разблокировать достижение"""
+    async def unlock_achievements(self, user_id: int, 
+                                  achievements: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """
+        Разблокировать несколько достижений одним запросом
+        
+        Args:
+            achievements: [(тип, уровень), ...]
+        
+        Returns:
+            Только впервые разблокированные [(тип, уровень), ...]
+        """
+        if not achievements:
+            return []
+        
+        types = [a[0] for a in achievements]
+        levels = [a[1] for a in achievements]
+        
         async with self.pool.acquire() as conn:
-            await conn.execute('''
+            rows = await conn.fetch('''
                 INSERT INTO achievements (user_id, achievement_type, achievement_level)
-                VALUES ($1, $2, $3)
+                SELECT $1, t.achievement_type, t.achievement_level
+                FROM unnest($2::varchar[], $3::varchar[]) AS t(achievement_type, achievement_level)
                 ON CONFLICT DO NOTHING
-            ''', user_id, achievement_type, achievement_level)
+                RETURNING achievement_type, achievement_level
+            ''', user_id, types, levels)
+            return [(row['achievement_type'], row['achievement_level']) for row in rows]
     
     async def get_user_achievements(self, user_id: int) -> List[Dict]:
         """Получить все достижения пользователя"""
@@ -599,6 +1465,48 @@ class DatabasePostgres:
                 DO UPDATE SET spam_count = spam_messages.spam_count + 1
             ''', contest_id, user_id)
     
+    async def add_spam_counts(self, contest_id: int, counts: Dict[int, int]):
+        """Пачкой добавить накопленные спамы участников (один запрос)"""
+        if not counts:
+            return
+        
+        user_ids = list(counts.keys())
+        increments = [counts[user_id] for user_id in user_ids]
+        
+        async with self.pool.acquire() as conn:
+            await conn.execute('''
+                INSERT INTO spam_messages (contest_id, user_id, spam_count)
+                SELECT $1, u.user_id, u.cnt
+                FROM unnest($2::BIGINT[], $3::INTEGER[]) AS u(user_id, cnt)
+                ON CONFLICT (contest_id, user_id)
+                DO UPDATE SET spam_count = spam_messages.spam_count + EXCLUDED.spam_count
+            ''', contest_id, user_ids, increments)
+    
+    async def ack_spam_flush(self, contest_id: int, instance_id: str):
+        """Экземпляр записал свои счётчики остановленного спам-конкурса"""
+        async with self.pool.acquire() as conn:
+            await conn.execute('''
+                INSERT INTO spam_flush_acks (contest_id, instance_id)
+                VALUES ($1, $2)
+                ON CONFLICT (contest_id, instance_id) DO UPDATE SET flushed_at = NOW()
+            ''', contest_id, instance_id)
+    
+    async def get_spam_flush_missing(self, contest_id: int, instance_id: str) -> List[str]:
+        """Живые экземпляры (кроме instance_id), не подтвердившие сброс счётчиков"""
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch('''
+                SELECT i.instance_id
+                FROM bot_instances i
+                WHERE i.instance_id <> $2
+                  AND i.seen_at > NOW() - make_interval(secs => $3)
+                  AND NOT EXISTS (
+                      SELECT 1 FROM spam_flush_acks a
+                      WHERE a.contest_id = $1 AND a.instance_id = i.instance_id
+                  )
+            ''', contest_id, instance_id, float(config.INSTANCE_ALIVE_TIMEOUT))
+        
+        return [row['instance_id'] for row in rows]
+    
     async def get_spam_leaderboard(self, contest_id: int) -> List[Dict]:
         """Получить таблицу лидеров спам-конкурса"""
         async with self.pool.acquire() as conn:
@@ -660,14 +1568,13 @@ class DatabasePostgres:
             rows = await conn.fetch('''
                 SELECT 
                     us.user_id,
-                    MAX(p.username) as username,
-                    MAX(p.full_name) as full_name,
+                    u.username,
+                    u.full_name,
                     us.total_wins,
                     ROW_NUMBER() OVER (ORDER BY us.total_wins DESC, us.user_id) as rank
                 FROM user_stats us
-                LEFT JOIN participants p ON us.user_id = p.user_id
+                LEFT JOIN users u ON u.user_id = us.user_id
                 WHERE us.total_wins > 0
-                GROUP BY us.user_id, us.total_wins
                 ORDER BY us.total_wins DESC, us.user_id
                 LIMIT $1
             ''', limit)
@@ -679,19 +1586,15 @@ class DatabasePostgres:
         async with self.pool.acquire() as conn:
             rows = await conn.fetch('''
                 SELECT 
-                    r.referrer_id as user_id,
-                    (SELECT username FROM participants 
-                    WHERE user_id = r.referrer_id 
-                    LIMIT 1) as username,
-                    (SELECT full_name FROM participants 
-                    WHERE user_id = r.referrer_id 
-                    LIMIT 1) as full_name,
-                    COUNT(r.referred_id) as referral_count,
-                    ROW_NUMBER() OVER (ORDER BY COUNT(r.referred_id) DESC) as rank
-                FROM referrals r
-                WHERE r.subscribed = true
-                GROUP BY r.referrer_id
-                ORDER BY referral_count DESC
+                    us.user_id,
+                    u.username,
+                    u.full_name,
+                    us.referral_points as referral_count,
+                    ROW_NUMBER() OVER (ORDER BY us.referral_points DESC, us.user_id) as rank
+                FROM user_stats us
+                LEFT JOIN users u ON u.user_id = us.user_id
+                WHERE us.referral_points > 0
+                ORDER BY us.referral_points DESC, us.user_id
                 LIMIT $1
             ''', limit)
             
@@ -703,14 +1606,13 @@ class DatabasePostgres:
             rows = await conn.fetch('''
                 SELECT 
                     us.user_id,
-                    MAX(p.username) as username,
-                    MAX(p.full_name) as full_name,
+                    u.username,
+                    u.full_name,
                     us.total_contests,
                     ROW_NUMBER() OVER (ORDER BY us.total_contests DESC, us.user_id) as rank
                 FROM user_stats us
-                LEFT JOIN participants p ON us.user_id = p.user_id
+                LEFT JOIN users u ON u.user_id = us.user_id
                 WHERE us.total_contests > 0
-                GROUP BY us.user_id, us.total_contests
                 ORDER BY us.total_contests DESC, us.user_id
                 LIMIT $1
             ''', limit)
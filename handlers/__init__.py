@@ -13,7 +13,7 @@ def setup_routers():
     from handlers.faq import faq_menu, contest_types, referral_info, contact_info
     from handlers.admin import admin_menu, create_contest, select_winner
     from handlers.contests import voting_contest, random_contest, spam_contest, message_handler
-    from handlers.system import auto_approve
+    from handlers.system import auto_approve, channel_members
     from handlers.admin import publish_rules
     
     # ⬇️ ВАЖНО: Подключаем message_handler ПЕРВЫМ (до debug)
@@ -48,6 +48,7 @@ def setup_routers():
     
     # System handlers
     router.include_router(auto_approve.router)
+    router.include_router(channel_members.router)
     
     # ⬇️ DEBUG: Подключаем ПОСЛЕДНИМ (для отладки)
     # import test_debug
@@ -8,6 +8,7 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 import config
 from database_postgres import db
+from utils.contest_registry import ACTIVE_STATUSES
 
 
 router = Router()
@@ -25,8 +26,9 @@ async def show_admin_menu(callback: CallbackQuery):
     builder.button(text="📊 Активные конкурсы", callback_data="active_contests")
     builder.button(text="🛑 Отменить конкурс", callback_data="cancel_contest")
     builder.button(text="📈 Статистика", callback_data="admin_stats")
+    builder.button(text="⏱ Задачи конкурсов", callback_data="contest_jobs")
     builder.button(text="🔙 В главное меню", callback_data="back_to_menu")
-    builder.adjust(2, 1, 1, 1)
+    builder.adjust(2, 1, 1, 1, 1)
     
     await callback.message.edit_text(
         config.MESSAGES["start_admin"],
@@ -82,6 +84,8 @@ async def show_active_contests(callback: CallbackQuery):
             conditions_text += f"• Первые {entry_conditions['first_n']} человек\n"
         if 'min_referrals' in entry_conditions:
             conditions_text += f"• Минимум {entry_conditions['min_referrals']} рефералов\n"
+        if 'min_second_level_referrals' in entry_conditions:
+            conditions_text += f"• Минимум {entry_conditions['min_second_level_referrals']} рефералов 2-го уровня\n"
         if 'min_contests' in entry_conditions:
             conditions_text += f"• Минимум {entry_conditions['min_contests']} участий\n"
         if entry_conditions.get('all_subscribers'):
@@ -142,6 +146,72 @@ async def show_admin_stats(callback: CallbackQuery):
     await callback.answer()
 
 
+# Этапы задач планировщика (utils.scheduler)
+JOB_STAGE_NAMES = {
+    "collect": "сбор участников",
+    "timer": "таймер голосования",
+    "spam_timer": "таймер спам-конкурса",
+}
+
+
+@router.callback_query(F.data == "contest_jobs")
+async def show_contest_jobs(callback: CallbackQuery):
+    """Задачи конкурсов: дедлайны, попытки, ошибки (таблица contest_jobs)"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("⛔️ У вас нет доступа!", show_alert=True)
+        return
+    
+    import time
+    from utils.leader_election import leader_election
+    from utils.scheduler import scheduler
+    
+    jobs = await db.get_contest_jobs()
+    now = time.time()
+    
+    text = f"⏱ ЗАДАЧИ КОНКУРСОВ ({len(jobs)})\n\n"
+    if not leader_election.is_leader:
+        text += "ℹ️ Задачи ведёт другой экземпляр бота\n\n"
+    if not jobs:
+        text += "ℹ️ Нет запланированных задач\n"
+    
+    for job in jobs:
+        stage = JOB_STAGE_NAMES.get(job['stage'], job['stage'])
+        icon = "🛑" if job['status'] == 'failed' else "🟢"
+        text += f"{icon} #{job['contest_id']} · {stage}\n"
+        
+        if job['deadline'] is not None:
+            left = max(job['deadline'] - now, 0)
+            text += f"   ⏰ До дедлайна: {int(left // 60)} мин {int(left % 60)} с\n"
+        
+        running = scheduler.get_job(job['job_key'])
+        if running is None:
+            if job['status'] != 'failed' and leader_election.is_leader:
+                text += "   ⚠️ Не запущена в этом процессе\n"
+        elif running.next_tick is not None:
+            text += f"   🔄 Следующий тик через {max(int(running.next_tick - now), 0)} с\n"
+        
+        if job['attempts']:
+            text += f"   🔁 Попыток: {job['attempts']}\n"
+        if job['last_error']:
+            text += f"   ❌ {job['last_error'][:100]}\n"
+        text += "\n"
+    
+    builder = InlineKeyboardBuilder()
+    builder.button(text="🔄 Обновить", callback_data="contest_jobs")
+    builder.button(text="🔙 Назад", callback_data="admin_panel")
+    builder.adjust(2)
+    
+    try:
+        await callback.message.edit_text(
+            text,
+            reply_markup=builder.as_markup()
+        )
+    except Exception:
+        # Текст не изменился (повторное нажатие «Обновить»)
+        pass
+    await callback.answer()
+
+
 @router.callback_query(F.data == "cancel_contest")
 async def cancel_contest_menu(callback: CallbackQuery):
     """Меню выбора конкурса для отмены"""
@@ -272,13 +342,14 @@ async def confirm_cancel_contest(callback: CallbackQuery):
         await callback.answer("❌ Конкурс не найден", show_alert=True)
         return
     
-    # Проверяем что конкурс активный
-    if contest['status'] == 'ended':
+    # Меняем статус на 'ended', если конкурс ещё активен (его мог завершить таймер)
+    if not await db.transition_contest(contest_id, ACTIVE_STATUSES, 'ended'):
         await callback.answer("ℹ️ Конкурс уже завершён", show_alert=True)
         return
     
-    # Меняем статус на 'ended'
-    await db.update_contest_status(contest_id, 'ended')
+    # Останавливаем таймеры и сбор участников конкурса
+    from utils.scheduler import scheduler
+    await scheduler.cancel_contest(contest_id)
     
     # Отправляем уведомление в канал
     try:
@@ -334,6 +405,19 @@ async def clear_referrals(message: Message):
             # Удаляем достижения за рефералов
             await conn.execute("DELETE FROM achievements WHERE achievement_type = 'referrals'")
         
+        from utils.rank_index import rank_index
+        from utils.leader_election import leader_election
+        from utils.leaderboard_service import leaderboard_service, GRAPH_CATEGORIES
+        from utils.referral_graph import referral_graph
+        rank_index.reset('referrals')
+        referral_graph.reset()
+        db.invalidate_stats_cache()
+        leader_election.publish("reset_referrals")
+        leaderboard_service.mark_dirty('referrals')
+        # ТОПы по сети иначе обновились бы только в полном пересчёте
+        for category in GRAPH_CATEGORIES:
+            await leaderboard_service.refresh(category)
+        
         await message.answer("✅ Реферальная система очищена!")
     except Exception as e:
         await message.answer(f"❌ Ошибка: {e}")
\ No newline at end of file
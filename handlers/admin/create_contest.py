@@ -27,6 +27,7 @@ class ContestCreation(StatesGroup):
     # Настройка условий участия
     configuring_entry_conditions = State()
     waiting_for_min_referrals = State()
+    waiting_for_min_second_level = State()
     waiting_for_min_contests = State()
     waiting_for_max_contests = State()
 
@@ -168,6 +169,11 @@ async def show_entry_conditions_menu(message: Message, state: FSMContext):
     else:
         conditions_text += "❌ Минимум рефералов (не задано)\n"
     
+    if 'min_second_level_referrals' in entry_conditions:
+        conditions_text += f"✅ Минимум {entry_conditions['min_second_level_referrals']} рефералов 2-го уровня\n"
+    else:
+        conditions_text += "❌ Минимум рефералов 2-го уровня (не задано)\n"
+    
     # НОВОЕ: Показываем диапазон участий
     has_min = 'min_contests' in entry_conditions
     has_max = 'max_contests' in entry_conditions
@@ -189,8 +195,9 @@ async def show_entry_conditions_menu(message: Message, state: FSMContext):
     builder.button(text="🔗 Минимум рефералов", callback_data="set_min_referrals")
     builder.button(text="🎯 Минимум участий", callback_data="set_min_contests")  # ← УБРАЛИ ЗАГЛУШКУ
     builder.button(text="🆕 Максимум участий", callback_data="set_max_contests")  # ← НОВАЯ КНОПКА
+    builder.button(text="🌳 Рефералы 2-го уровня", callback_data="set_min_second_level")
     builder.button(text="✅ Готово, продолжить", callback_data="entry_conditions_done")
-    builder.adjust(2, 2, 1)
+    builder.adjust(2, 2, 1, 1)
     
     text = (
         "⚙️ **НАСТРОЙКА УСЛОВИЙ УЧАСТИЯ**\n\n"
@@ -345,6 +352,80 @@ async def process_min_referrals_custom(message: Message, state: FSMContext):
         await message.answer("⚠️ Введите число от 1 до 50:")
 
 
+@router.callback_query(ContestCreation.configuring_entry_conditions, F.data == "set_min_second_level")
+async def set_min_second_level(callback: CallbackQuery, state: FSMContext):
+    """Настройка минимума рефералов 2-го уровня"""
+    builder = InlineKeyboardBuilder()
+    builder.button(text="1 человек", callback_data="min_l2_1")
+    builder.button(text="3 человека", callback_data="min_l2_3")
+    builder.button(text="10 человек", callback_data="min_l2_10")
+    builder.button(text="Свой вариант", callback_data="min_l2_custom")
+    builder.button(text="❌ Убрать условие", callback_data="min_l2_remove")
+    builder.button(text="🔙 Назад", callback_data="back_to_entry_menu")
+    builder.adjust(3, 1, 1, 1)
+    
+    await callback.message.edit_text(
+        "🌳 **Минимум рефералов 2-го уровня**\n\n"
+        "Сколько подписчиков должны привести рефералы участника:",
+        reply_markup=builder.as_markup(),
+        parse_mode="Markdown"
+    )
+    await callback.answer()
+
+
+@router.callback_query(ContestCreation.configuring_entry_conditions, F.data.startswith("min_l2_"))
+async def process_min_second_level(callback: CallbackQuery, state: FSMContext):
+    """Обработка выбора минимума рефералов 2-го уровня"""
+    value = callback.data.replace("min_l2_", "")
+    
+    data = await state.get_data()
+    entry_conditions = data.get('entry_conditions', {})
+    
+    if value == "custom":
+        await callback.message.edit_text(
+            "🌳 Введите минимальное количество рефералов 2-го уровня (от 1 до 100):"
+        )
+        await state.set_state(ContestCreation.waiting_for_min_second_level)
+        await callback.answer()
+        return
+    elif value == "remove":
+        if 'min_second_level_referrals' in entry_conditions:
+            del entry_conditions['min_second_level_referrals']
+        await state.update_data(entry_conditions=entry_conditions)
+        await callback.answer("✅ Условие убрано")
+    else:
+        count = int(value)
+        entry_conditions['min_second_level_referrals'] = count
+        await state.update_data(entry_conditions=entry_conditions)
+        await callback.answer(f"✅ Установлено: минимум {count} рефералов 2-го уровня")
+    
+    await show_entry_conditions_menu(callback.message, state)
+
+
+@router.message(ContestCreation.waiting_for_min_second_level)
+async def process_min_second_level_custom(message: Message, state: FSMContext):
+    """Обработка ввода своего минимума рефералов 2-го уровня"""
+    if not is_admin(message.from_user.id):
+        return
+    
+    try:
+        count = int(message.text)
+        if count < 1 or count > 100:
+            await message.answer("⚠️ Количество должно быть от 1 до 100. Попробуйте снова:")
+            return
+        
+        data = await state.get_data()
+        entry_conditions = data.get('entry_conditions', {})
+        entry_conditions['min_second_level_referrals'] = count
+        await state.update_data(entry_conditions=entry_conditions)
+        
+        await message.answer(f"✅ Установлено: минимум {count} рефералов 2-го уровня")
+        await show_entry_conditions_menu(message, state)
+        
+    except ValueError:
+        await message.answer("⚠️ Введите число от 1 до 100:")
+
+
 @router.callback_query(ContestCreation.configuring_entry_conditions, F.data == "set_min_contests")
 async def set_min_contests(callback: CallbackQuery, state: FSMContext):
     """Настройка минимального количества участий"""
@@ -767,22 +848,24 @@ async def force_start_contest(callback: CallbackQuery):
         await callback.answer("❌ Нельзя запустить конкурс без участников!", show_alert=True)
         return
     
-    # ⚡ ВАЖНО: Отменяем задачу сбора комментариев
-    from handlers.contests.voting_contest import cancel_collect_task, publish_participants_list, start_timer, active_tasks
-    await cancel_collect_task(contest_id)
-    
-    # Закрываем набор - меняем статус на 'voting'
-    await db.update_contest_status(contest_id, 'voting')
+    # Закрываем набор тем же обработчиком, что и сборщик конкурса:
+    # он меняет статус через compare-and-set, снимает задачу сбора
+    # и запускает следующий этап (таймер, розыгрыш или спам)
+    from handlers.contests.voting_contest import close_registration
+    from handlers.contests.random_contest import close_random_registration
+    from handlers.contests.spam_contest import close_spam_registration
+    closers = {
+        'voting_contest': close_registration,
+        'random_contest': close_random_registration,
+        'spam_contest': close_spam_registration,
+    }
+    
+    if not await closers[contest['contest_type']](callback.bot, contest):
+        # Набор успел закрыться сам (заполнился или вышло время)
+        await callback.answer("ℹ️ Конкурс уже не в статусе 'collecting'", show_alert=True)
+        return
     print(f"🔒 [{contest_id}] Регистрация закрыта принудительно")
     
-    # Публикуем список участников
-    await publish_participants_list(callback.bot, contest_id)
-    
-    # Запускаем таймер с сохранением задачи
-    import asyncio
-    task = asyncio.create_task(start_timer(callback.bot, contest_id, contest['timer_minutes']))
-    active_tasks[f"timer_{contest_id}"] = task
-    
     # Уведомляем админа
     text = (
         "✅ **КОНКУРС ЗАПУЩЕН ПРИНУДИТЕЛЬНО**\n\n"
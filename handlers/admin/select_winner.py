@@ -85,11 +85,11 @@ async def select_winner(message: Message):
             print(f"💾 Победитель сохранён: user_id={winner['user_id']}")
             
             # Увеличиваем счётчик побед
-            await db.increment_user_wins(winner['user_id'], contest['contest_type'])
+            total_wins = await db.increment_user_wins(winner['user_id'], contest['contest_type'])
             
             # Проверяем достижения
             from handlers.user.achievements import check_achievements
-            await check_achievements(message.bot, winner['user_id'])
+            await check_achievements(message.bot, winner['user_id'], total_wins=total_wins)
         
         # Формируем пост с победителем/победителями
         if len(winners) == 1:
@@ -4,36 +4,31 @@
 Маршрутизирует сообщения по типу и статусу конкурса
 """
 
-import random
 from datetime import datetime
-from aiogram import Router, F, Bot
+from aiogram import Router, F
 from aiogram.types import Message
 import config
 from database_postgres import db
-from utils.filters import ParticipantFilter
+from utils.filters import ParticipantFilter, UserFacts
+from utils.contest_registry import contest_registry
+from utils.spam_counter import spam_counter
+from utils.registration_queue import registration_queue
+from utils.scheduler import scheduler
 from utils.messages import (
     format_rejection_message,
-    get_not_subscribed_error,
-    get_previous_winner_error
+    get_contest_full_error,
+    format_registration_confirmation
 )
 
 router = Router()
 
 
-async def check_subscription(bot: Bot, user_id: int) -> bool:
-    """Проверка подписки пользователя на канал"""
-    try:
-        member = await bot.get_chat_member(chat_id=config.CHANNEL_ID, user_id=user_id)
-        return member.status in ["member", "administrator", "creator"]
-    except Exception as e:
-        print(f"⚠️ Ошибка проверки подписки для {user_id}: {e}")
-        return False
-
-
-async def handle_participant_registration(message: Message, contest: dict):
+async def handle_participant_registration(message: Message, contest: dict, facts: UserFacts):
     """
     Регистрация участника в конкурсе
     Используется для voting, random и spam (в статусе collecting)
+    
+    facts — факты об авторе сообщения, общие для всех конкурсов этого сообщения
     """
     
     # Игнорируем старые комментарии
@@ -50,85 +45,68 @@ async def handle_participant_registration(message: Message, contest: dict):
     except Exception as e:
         pass
     
-    # Проверяем подписку на канал
-    is_subscribed = await check_subscription(message.bot, message.from_user.id)
-    
-    if not is_subscribed:
-        try:
-            await message.reply(
-                f'⚠️ Вы не подписаны на канал!\n\n'
-                f'👉 <a href="{config.CHANNEL_INVITE_LINK}">Подпишитесь на канал</a> для участия в конкурсе.',
-                parse_mode="HTML"
-            )
-        except Exception:
-            pass
-        return
-    
-    # Проверяем условия участия (entry_conditions)
-    entry_conditions = contest.get('entry_conditions', {})
-    
-    can_participate, error_data = await ParticipantFilter.check_conditions(
-        message.from_user.id, 
-        entry_conditions
-    )
-    
-    if not can_participate:
-        error_type, required, current = error_data
-        error_message = format_rejection_message(error_type, required, current)
-        try:
-            await message.reply(error_message, parse_mode="Markdown")
-        except Exception:
-            pass
-        return
+    # Проверяем условия участия скомпилированным конвейером:
+    # память → один SQL-снимок → Telegram API
+    pipeline = ParticipantFilter.compile(contest)
+    rejection = await pipeline.check(facts)
     
-    # Запрещаем участие только ПОСЛЕДНЕМУ победителю
-    last_winners = await db.get_last_winners_by_type(contest['contest_type'], limit=1)
-    
-    if last_winners and message.from_user.id in last_winners:
+    if rejection:
+        error_type, required, current = rejection
         try:
-            await message.reply(
-                "⛔ Вы были победителем в прошлом конкурсе этого типа!\n\n"
-                "Дайте шанс другим участникам. Вы сможете участвовать в следующем конкурсе. 😊"
-            )
+            if error_type == "not_subscribed":
+                await message.reply(
+                    f'⚠️ Вы не подписаны на канал!\n\n'
+                    f'👉 <a href="{config.CHANNEL_INVITE_LINK}">Подпишитесь на канал</a> для участия в конкурсе.',
+                    parse_mode="HTML"
+                )
+            elif error_type == "previous_winner":
+                # Запрещаем участие только ПОСЛЕДНЕМУ победителю
+                await message.reply(
+                    "⛔ Вы были победителем в прошлом конкурсе этого типа!\n\n"
+                    "Дайте шанс другим участникам. Вы сможете участвовать в следующем конкурсе. 😊"
+                )
+            else:
+                error_message = format_rejection_message(error_type, required, current)
+                await message.reply(error_message, parse_mode="Markdown")
         except Exception:
             pass
         return
     
-    # Получаем уже использованные эмодзи
-    existing_participants = await db.get_participants(contest['id'])
-    used_emojis = [p['comment_text'] for p in existing_participants]
-    
-    # Выбираем эмодзи, который ещё не использовался
-    available_emojis = [e for e in config.PARTICIPANT_EMOJIS if e not in used_emojis]
-    
-    if not available_emojis:
-        random_emoji = random.choice(config.PARTICIPANT_EMOJIS)
-    else:
-        random_emoji = random.choice(available_emojis)
-    
-    # Добавляем участника (позиция определяется автоматически в БД)
+    # Ставим заявку в очередь: писатель конкурса регистрирует заявки пачками,
+    # выдаёт эмодзи и позиции по порядку (utils.registration_queue)
     try:
-        added = await db.add_participant(
+        result = await registration_queue.register(
             contest_id=contest['id'],
             user_id=message.from_user.id,
             username=message.from_user.username or "noname",
-            full_name=message.from_user.full_name,
-            emoji=random_emoji
+            full_name=message.from_user.full_name
         )
         
-        if added:
-            count = await db.get_participants_count(contest['id'])
+        if result['status'] == 'added':
+            # Количество участников возвращается вместе с позицией
+            count = result['count']
+            
+            try:
+                await message.reply(format_registration_confirmation(result['position'], result['emoji']))
+            except Exception:
+                pass
             
             # Увеличиваем счётчик участий в статистике
-            await db.increment_user_contests(message.from_user.id)
+            total_contests = await db.increment_user_contests(message.from_user.id, contest['contest_type'])
             
             # Проверяем достижения за участие
             from handlers.user.achievements import check_achievements
-            await check_achievements(message.bot, message.from_user.id)
+            await check_achievements(message.bot, message.from_user.id, total_contests=total_contests)
             
-            # Если набрано нужное количество, сразу закрываем регистрацию
+            # Набор заполнен — сборщик конкурса срабатывает сразу, без опроса COUNT
             if count >= contest['participants_count']:
-                await db.update_contest_status(contest['id'], 'voting')
+                await scheduler.fire_now("collect", contest['id'])
+        
+        elif result['status'] == 'full':
+            try:
+                await message.reply(get_contest_full_error(), parse_mode="Markdown")
+            except Exception:
+                pass
             
     except Exception as e:
         print(f"❌ ОШИБКА при добавлении участника: {e}")
@@ -142,14 +120,9 @@ async def handle_spam_counting(message: Message, contest: dict):
     """
     Подсчёт спамов для участника спам-конкурса
     Используется только когда spam_contest в статусе 'running'
+    Счёт ведётся в памяти, запись в БД — пачками (utils.spam_counter)
     """
-    # Проверяем является ли этот юзер участником
-    participants = await db.get_participants(contest['id'])
-    participant_ids = [p['user_id'] for p in participants]
-    
-    if message.from_user.id in participant_ids:
-        # Увеличиваем счётчик
-        await db.increment_spam_count(contest['id'], message.from_user.id)
+    if spam_counter.count(contest['id'], message.from_user.id):
         print(f"💬 [{contest['id']}] +1 спам для @{message.from_user.username}")
 
 
@@ -179,8 +152,8 @@ async def handle_discussion_message(message: Message):
         print("   ⏭️ Игнорирую сообщение от другого бота")
         return
     
-    # Получаем все активные конкурсы
-    contests = await db.get_active_contests()
+    # Получаем все активные конкурсы из реестра в памяти
+    contests = contest_registry.get_active()
     
     print(f"   📋 Найдено активных конкурсов: {len(contests)}")
     
@@ -188,6 +161,9 @@ async def handle_discussion_message(message: Message):
         print("   ⏭️ Нет активных конкурсов")
         return
     
+    # Факты об авторе загружаются один раз и переиспользуются всеми конкурсами
+    facts = UserFacts(message.bot, message.from_user.id)
+    
     # Обрабатываем каждый активный конкурс
     for contest in contests:
         contest_type = contest['contest_type']
@@ -205,7 +181,7 @@ async def handle_discussion_message(message: Message):
             print(f"      ✅ Конкурс в статусе 'collecting' - начинаю регистрацию")
             # Все типы конкурсов регистрируют участников через комментарии
             if contest_type in ['voting_contest', 'random_contest', 'spam_contest']:
-                await handle_participant_registration(message, contest)
+                await handle_participant_registration(message, contest, facts)
             else:
                 print(f"      ⚠️ Неизвестный тип конкурса: {contest_type}")
         else:
@@ -3,22 +3,20 @@
 Автоматический случайный выбор победителя
 """
 
-import asyncio
 import random
-from datetime import datetime
+import time
+from functools import partial
 from aiogram import Router, F, Bot
 from aiogram.types import Message
 import config
 from database_postgres import db
 from utils.filters import ParticipantFilter
 from utils.formatters import format_participant_list
+from utils.scheduler import scheduler
 
 
 router = Router()
 
-# Глобальный словарь для хранения активных задач (используем общий из voting_contest)
-from handlers.contests.voting_contest import active_tasks
-
 
 async def publish_random_contest_announcement(bot: Bot, contest_id: int):
     """Публикация анонса рандомайзера в канале"""
@@ -53,96 +51,72 @@ async def publish_random_contest_announcement(bot: Bot, contest_id: int):
         
         print(f"✅ [{contest_id}] Анонс рандомайзера опубликован! Message ID: {message.message_id}")
         
-        # Запускаем сбор участников с сохранением задачи
-        task = asyncio.create_task(collect_random_participants(bot, contest_id))
-        active_tasks[f"collect_{contest_id}"] = task
+        # Запускаем сбор участников
+        await collect_random_participants(bot, contest_id)
         
     except Exception as e:
         print(f"❌ [{contest_id}] Ошибка публикации анонса: {e}")
 
 
-async def collect_random_participants(bot: Bot, contest_id: int):
-    """Фоновая задача сбора участников для рандомайзера"""
-    task_key = f"collect_{contest_id}"
+async def collect_random_participants(bot: Bot, contest_id: int, deadline: float = None):
+    """
+    Сбор участников для рандомайзера: до набора или до конца времени сбора
+    deadline — сохранённый дедлайн при восстановлении (иначе сейчас + timer_minutes)
+    """
+    contest = await db.get_contest_by_id(contest_id)
+    if not contest:
+        print(f"❌ [{contest_id}] Конкурс не найден при сборе участников")
+        return
     
-    try:
-        contest = await db.get_contest_by_id(contest_id)
-        if not contest:
-            print(f"❌ [{contest_id}] Конкурс не найден при сборе участников")
-            return
-        
-        print(f"🔄 [{contest_id}] Начат сбор участников для рандомайзера")
-        
-        # Ждём указанное время ИЛИ пока не наберём нужное количество
-        start_time = datetime.now()
-        timeout_minutes = contest['timer_minutes']
-        
-        while True:
-            # Проверяем не отменена ли задача
-            if task_key not in active_tasks:
-                print(f"⛔ [{contest_id}] Задача сбора участников отменена")
-                break
-            
-            try:
-                current_count = await db.get_participants_count(contest_id)
-                needed_count = contest['participants_count']
-                
-                # Проверяем набралось ли нужное количество
-                if current_count >= needed_count:
-                    print(f"✅ [{contest_id}] Собрано {current_count} участников!")
-                    await db.update_contest_status(contest_id, 'voting')
-                    
-                    # Запускаем розыгрыш
-                    await select_random_winner(bot, contest_id)
-                    
-                    # Удаляем задачу из активных
-                    if task_key in active_tasks:
-                        del active_tasks[task_key]
-                    break
-                
-                # Проверяем не истекло ли время
-                elapsed_minutes = (datetime.now() - start_time).total_seconds() / 60
-                if elapsed_minutes >= timeout_minutes:
-                    print(f"⏰ [{contest_id}] Время вышло! Собрано {current_count} участников")
-                    
-                    if current_count > 0:
-                        await db.update_contest_status(contest_id, 'voting')
-                        await select_random_winner(bot, contest_id)
-                    else:
-                        print(f"❌ [{contest_id}] Нет участников, конкурс отменяется")
-                        await db.update_contest_status(contest_id, 'ended')
-                    
-                    # Удаляем задачу из активных
-                    if task_key in active_tasks:
-                        del active_tasks[task_key]
-                    break
-                
-                print(f"📊 [{contest_id}] Собрано {current_count}/{needed_count} участников (прошло {int(elapsed_minutes)} мин)")
-                
-                await asyncio.sleep(config.COMMENT_CHECK_INTERVAL)
-                
-            except Exception as e:
-                print(f"❌ [{contest_id}] Ошибка при сборе участников: {e}")
-                await asyncio.sleep(5)
-    
-    except asyncio.CancelledError:
-        print(f"⛔ [{contest_id}] Задача сбора участников была отменена")
-        if task_key in active_tasks:
-            del active_tasks[task_key]
-    except Exception as e:
-        print(f"❌ [{contest_id}] Критическая ошибка в сборе участников: {e}")
-        if task_key in active_tasks:
-            del active_tasks[task_key]
+    print(f"🔄 [{contest_id}] Начат сбор участников для рандомайзера")
+    
+    # Ждём указанное время ИЛИ пока не наберём нужное количество:
+    # заполненный набор срабатывает дедлайн досрочно (scheduler.fire_now)
+    await scheduler.schedule(
+        "collect", contest_id,
+        deadline=deadline or time.time() + contest['timer_minutes'] * 60,
+        on_deadline=partial(close_random_registration, bot, contest)
+    )
+
+
+async def close_random_registration(bot: Bot, contest: dict) -> bool:
+    """
+    Набор заполнен или время вышло: разыграть приз среди собравшихся
+    Returns: True если набор закрыл этот вызов (а не сборщик или админ раньше)
+    """
+    contest_id = contest['id']
+    
+    # Следующий этап запускает только выигравший переход
+    if not await db.transition_contest(contest_id, 'collecting', 'voting'):
+        print(f"⏭️ [{contest_id}] Набор уже закрыт")
+        return False
+    await scheduler.cancel("collect", contest_id)
+    
+    # Считаем после перехода: вне 'collecting' регистрация уже отклоняется
+    current_count = await db.get_participants_count(contest_id)
+    print(f"⏰ [{contest_id}] Сбор завершён! Собрано {current_count}/{contest['participants_count']} участников")
+    
+    if current_count > 0:
+        # Запускаем розыгрыш
+        await select_random_winner(bot, contest_id)
+    else:
+        print(f"❌ [{contest_id}] Нет участников, конкурс отменяется")
+        await db.transition_contest(contest_id, 'voting', 'ended')
+    return True
 
 
 async def select_random_winner(bot: Bot, contest_id: int):
     """Выбор случайного победителя"""
+    # Завершаем конкурс до розыгрыша: победителя выбирает только один вызов
+    if not await db.transition_contest(contest_id, 'voting', 'ended'):
+        print(f"⏭️ [{contest_id}] Розыгрыш уже проведён или конкурс отменён")
+        return
+    
     contest = await db.get_contest_by_id(contest_id)
     participants = await db.get_participants(contest_id)
     
     if not participants:
         print(f"❌ [{contest_id}] Нет участников для розыгрыша")
-        await db.update_contest_status(contest_id, 'ended')
         return
     
     print(f"🎲 [{contest_id}] Выбираем случайного победителя из {len(participants)} участников")
@@ -188,14 +162,11 @@ async def select_random_winner(bot: Bot, contest_id: int):
     
     # Сохраняем победителя в БД
     await db.set_contest_winner(contest_id, winner['user_id'])
-    await db.increment_user_wins(winner['user_id'], contest['contest_type'])
+    total_wins = await db.increment_user_wins(winner['user_id'], contest['contest_type'])
     
     # Проверяем достижения победителя
     from handlers.user.achievements import check_achievements
-    await check_achievements(bot, winner['user_id'])
-    
-    # Завершаем конкурс
-    await db.update_contest_status(contest_id, 'ended')
+    await check_achievements(bot, winner['user_id'], total_wins=total_wins)
     
     # Уведомляем админа
     admin_text = (
@@ -5,8 +5,10 @@
 """
 
 import asyncio
+import math
 import random
-from datetime import datetime
+import time
+from functools import partial
 from aiogram import Router, F, Bot
 from aiogram.types import Message
 from aiogram.utils import markdown
@@ -14,7 +16,8 @@ from aiogram.exceptions import TelegramRetryAfter
 import config
 from database_postgres import db
 from utils.filters import ParticipantFilter
-from utils.rate_limiter import rate_limiter
+from utils.scheduler import scheduler
+from utils.spam_counter import spam_counter
 
 def escape_markdown(text: str) -> str:
     """Экранирует спецсимволы Markdown"""
@@ -27,9 +30,6 @@ def escape_markdown(text: str) -> str:
 
 router = Router()
 
-# Глобальный словарь для хранения активных задач
-from handlers.contests.voting_contest import active_tasks
-
 
 async def publish_spam_contest_announcement(bot: Bot, contest_id: int):
     """Публикация анонса спам-конкурса в канале"""
@@ -70,105 +70,69 @@ async def publish_spam_contest_announcement(bot: Bot, contest_id: int):
         
         print(f"✅ [{contest_id}] Анонс спам-конкурса опубликован! Message ID: {message.message_id}")
         
-        # Запускаем сбор участников с сохранением задачи
-        task = asyncio.create_task(collect_spam_participants(bot, contest_id))
-        active_tasks[f"collect_{contest_id}"] = task
+        # Запускаем сбор участников
+        await collect_spam_participants(bot, contest_id)
         
     except Exception as e:
         print(f"❌ [{contest_id}] Ошибка публикации анонса: {e}")
 
 
-async def collect_spam_participants(bot: Bot, contest_id: int):
-    """Фоновая задача сбора участников для спам-конкурса (ТАЙМЕР 1)"""
-    task_key = f"collect_{contest_id}"
+async def collect_spam_participants(bot: Bot, contest_id: int, deadline: float = None):
+    """
+    Сбор участников для спам-конкурса (ТАЙМЕР 1)
+    deadline — сохранённый дедлайн при восстановлении (иначе сейчас + timer_minutes)
+    """
+    contest = await db.get_contest_by_id(contest_id)
+    if not contest:
+        print(f"❌ [{contest_id}] Конкурс не найден при сборе участников")
+        return
     
-    try:
-        contest = await db.get_contest_by_id(contest_id)
-        if not contest:
-            print(f"❌ [{contest_id}] Конкурс не найден при сборе участников")
-            return
-        
-        print(f"🔄 [{contest_id}] Начат сбор участников для спам-конкурса")
-        
-        # Ждём указанное время ИЛИ пока не наберём нужное количество
-        start_time = datetime.now()
-        timeout_minutes = contest['timer_minutes']  # ТАЙМЕР 1: время регистрации
+    print(f"🔄 [{contest_id}] Начат сбор участников для спам-конкурса")
+    
+    # Ждём указанное время ИЛИ пока не наберём нужное количество:
+    # заполненный набор срабатывает дедлайн досрочно (scheduler.fire_now)
+    # ТАЙМЕР 1: время регистрации — contest['timer_minutes']
+    await scheduler.schedule(
+        "collect", contest_id,
+        deadline=deadline or time.time() + contest['timer_minutes'] * 60,
+        on_deadline=partial(close_spam_registration, bot, contest)
+    )
+
+
+async def close_spam_registration(bot: Bot, contest: dict) -> bool:
+    """
+    Набор заполнен или время регистрации вышло: начать конкурс или отменить
+    Returns: True если регистрацию закрыл этот вызов (а не сборщик или админ раньше)
+    """
+    contest_id = contest['id']
+    
+    # Следующий этап запускает только выигравший переход
+    if not await db.transition_contest(contest_id, 'collecting', 'running'):
+        print(f"⏭️ [{contest_id}] Регистрация уже закрыта")
+        return False
+    await scheduler.cancel("collect", contest_id)
+    
+    # Считаем после перехода: вне 'collecting' регистрация уже отклоняется
+    current_count = await db.get_participants_count(contest_id)
+    print(f"⏰ [{contest_id}] Регистрация завершена! Собрано {current_count}/{contest['participants_count']} участников")
+    
+    if current_count > 0:
+        # Запускаем сам спам-конкурс (ТАЙМЕР 2)
+        await start_spam_contest(bot, contest_id)
+    else:
+        print(f"❌ [{contest_id}] Нет участников, конкурс отменяется")
+        await db.transition_contest(contest_id, 'running', 'ended')
         
-        while True:
-            # Проверяем не отменена ли задача
-            if task_key not in active_tasks:
-                print(f"⛔ [{contest_id}] Задача сбора участников отменена")
-                break
-            
+        # Удаляем анонс
+        old_announcement_id = contest.get('announcement_message_id')
+        if old_announcement_id:
             try:
-                current_count = await db.get_participants_count(contest_id)
-                needed_count = contest['participants_count']
-                
-                # Проверяем набралось ли нужное количество
-                if current_count >= needed_count:
-                    print(f"✅ [{contest_id}] Собрано {current_count} участников!")
-                    
-                    # Меняем статус на 'running' (идёт конкурс)
-                    await db.update_contest_status(contest_id, 'running')
-                    
-                    # Удаляем задачу сбора из активных
-                    if task_key in active_tasks:
-                        del active_tasks[task_key]
-                    
-                    # Запускаем сам спам-конкурс (ТАЙМЕР 2)
-                    await start_spam_contest(bot, contest_id)
-                    break
-                
-                # Проверяем не истекло ли время регистрации
-                elapsed_minutes = (datetime.now() - start_time).total_seconds() / 60
-                if elapsed_minutes >= timeout_minutes:
-                    print(f"⏰ [{contest_id}] Время регистрации вышло! Собрано {current_count} участников")
-                    
-                    if current_count > 0:
-                        await db.update_contest_status(contest_id, 'running')
-                        
-                        # Удаляем задачу сбора
-                        if task_key in active_tasks:
-                            del active_tasks[task_key]
-                        
-                        # Запускаем конкурс
-                        await start_spam_contest(bot, contest_id)
-                    else:
-                        print(f"❌ [{contest_id}] Нет участников, конкурс отменяется")
-                        await db.update_contest_status(contest_id, 'ended')
-                        
-                        # Удаляем анонс
-                        old_announcement_id = contest.get('announcement_message_id')
-                        if old_announcement_id:
-                            try:
-                                await bot.delete_message(
-                                    chat_id=config.CHANNEL_ID,
-                                    message_id=old_announcement_id
-                                )
-                            except:
-                                pass
-                    
-                    # Удаляем задачу
-                    if task_key in active_tasks:
-                        del active_tasks[task_key]
-                    break
-                
-                print(f"📊 [{contest_id}] Регистрация: {current_count}/{needed_count} участников (прошло {int(elapsed_minutes)} мин)")
-                
-                await asyncio.sleep(config.COMMENT_CHECK_INTERVAL)
-                
-            except Exception as e:
-                print(f"❌ [{contest_id}] Ошибка при сборе участников: {e}")
-                await asyncio.sleep(5)
-    
-    except asyncio.CancelledError:
-        print(f"⛔ [{contest_id}] Задача сбора участников была отменена")
-        if task_key in active_tasks:
-            del active_tasks[task_key]
-    except Exception as e:
-        print(f"❌ [{contest_id}] Критическая ошибка в сборе участников: {e}")
-        if task_key in active_tasks:
-            del active_tasks[task_key]
+                await bot.delete_message(
+                    chat_id=config.CHANNEL_ID,
+                    message_id=old_announcement_id
+                )
+            except:
+                pass
 
 
 async def start_spam_contest(bot: Bot, contest_id: int):
@@ -178,7 +142,7 @@ async def start_spam_contest(bot: Bot, contest_id: int):
     
     if not participants:
         print(f"❌ [{contest_id}] Нет участников для спам-конкурса")
-        await db.update_contest_status(contest_id, 'ended')
+        await db.transition_contest(contest_id, 'running', 'ended')
         return
     
     print(f"⚡ [{contest_id}] СПАМ-КОНКУРС НАЧАЛСЯ! Участников: {len(participants)}")
@@ -187,6 +151,9 @@ async def start_spam_contest(bot: Bot, contest_id: int):
     for participant in participants:
         await db.init_spam_participant(contest_id, participant['user_id'])
     
+    # Запускаем подсчёт сообщений в памяти (запись в БД пачками)
+    spam_counter.start_contest(contest_id, [p['user_id'] for p in participants])
+    
     # Удаляем старый анонс
     old_announcement_id = contest.get('announcement_message_id')
     if old_announcement_id:
@@ -217,39 +184,21 @@ async def start_spam_contest(bot: Bot, contest_id: int):
         print(f"✅ [{contest_id}] Live-таблица опубликована")
         
         # Запускаем таймер конкурса с обновлениями
-        task = asyncio.create_task(run_spam_timer(bot, contest_id, contest_duration))
-        active_tasks[f"spam_timer_{contest_id}"] = task
+        await run_spam_timer(bot, contest_id, contest_duration)
         
     except Exception as e:
         print(f"❌ [{contest_id}] Ошибка публикации таблицы: {e}")
         import traceback
         traceback.print_exc()
-    
-    # Публикуем live-таблицу
-    leaderboard_text = await format_spam_leaderboard(contest, participants, contest['timer_minutes'])
-    
-    try:
-        message = await bot.send_message(
-            chat_id=config.CHANNEL_ID,
-            text=leaderboard_text,
-            mode="Markdown"
-        )
-        
-        await db.set_announcement_message(contest_id, message.message_id)
-        print(f"✅ [{contest_id}] Live-таблица опубликована")
-        
-        # Запускаем таймер конкурса с обновлениями
-        task = asyncio.create_task(run_spam_timer(bot, contest_id, contest['timer_minutes']))
-        active_tasks[f"spam_timer_{contest_id}"] = task
-        
-    except Exception as e:
-        print(f"❌ [{contest_id}] Ошибка публикации таблицы: {e}")
 
 
 async def format_spam_leaderboard(contest: dict, participants: list, minutes_left: int) -> str:
     """Форматирование таблицы лидеров"""
     contest_id = contest['id']
     
+    # Сбрасываем накопленные счётчики, чтобы таблица была актуальной
+    await spam_counter.flush(contest_id)
+    
     try:
         leaderboard = await db.get_spam_leaderboard(contest_id)
     except Exception as e:
@@ -310,81 +259,108 @@ async def format_spam_leaderboard(contest: dict, participants: list, minutes_lef
     return text
 
 
-async def run_spam_timer(bot: Bot, contest_id: int, duration_minutes: int):
-    """Таймер спам-конкурса с обновлением таблицы раз в минуту"""  # ← ИЗМЕНЕНО описание
-    task_key = f"spam_timer_{contest_id}"
+async def run_spam_timer(bot: Bot, contest_id: int, duration_minutes: int, deadline: float = None):
+    """
+    Таймер спам-конкурса: обновление таблицы раз в минуту и итоги в дедлайн
+    deadline — сохранённый дедлайн при восстановлении (иначе сейчас + duration_minutes)
+    """
+    contest = await db.get_contest_by_id(contest_id)
+    participants = await db.get_participants(contest_id)
+    
+    print(f"⏰ [{contest_id}] Таймер спам-конкурса запущен на {duration_minutes} минут")
+    
+    await scheduler.schedule(
+        "spam_timer", contest_id,
+        deadline=deadline or time.time() + duration_minutes * 60,
+        on_deadline=partial(finish_spam_timer, bot, contest, participants),
+        interval=config.CONTEST_TIMER_TICK,
+        on_tick=partial(update_spam_table, bot, contest, participants),
+        tick_now=True
+    )
+
+
+async def update_spam_table(bot: Bot, contest: dict, participants: list, remaining: float):
+    """Тик таймера: обновить live-таблицу"""
+    contest_id = contest['id']
+    minutes_left = math.ceil(remaining / 60)
     
+    leaderboard_text = await format_spam_leaderboard(contest, participants, minutes_left)
+    
+    # Без ожиданий внутри тика: дедлайн дожидается выполняющегося тика,
+    # а правки и так разнесены сеткой планировщика (CONTEST_TIMER_TICK)
     try:
-        contest = await db.get_contest_by_id(contest_id)
-        message_id = contest['announcement_message_id']
-        participants = await db.get_participants(contest_id)
-        
-        print(f"⏰ [{contest_id}] Таймер спам-конкурса запущен на {duration_minutes} минут")
-        
-        # ИЗМЕНЕНО: Обновляем раз в минуту вместо 30 секунд
-        total_iterations = duration_minutes  # ← БЫЛО: duration_minutes * 2
-        
-        for iteration in range(total_iterations, -1, -1):
-            # Проверяем не отменена ли задача
-            if task_key not in active_tasks:
-                print(f"⛔ [{contest_id}] Таймер спам-конкурса отменён")
-                break
-            
-            # ИЗМЕНЕНО: Прямое значение, не делим на 2
-            minutes_left = iteration  # ← БЫЛО: iteration // 2
-            
-            # Обновляем таблицу
-            leaderboard_text = await format_spam_leaderboard(contest, participants, minutes_left)
-            
-            try:
-                await rate_limiter.safe_edit_message(
-                    bot=bot,
-                    chat_id=config.CHANNEL_ID,
-                    message_id=message_id,
-                    text=leaderboard_text,
-                    parse_mode="Markdown"
-                )
-                print(f"🔄 [{contest_id}] Таблица обновлена, осталось {minutes_left} мин")
+        await bot.edit_message_text(
+            chat_id=config.CHANNEL_ID,
+            message_id=contest['announcement_message_id'],
+            text=leaderboard_text,
+            parse_mode="Markdown"
+        )
+        print(f"🔄 [{contest_id}] Таблица обновлена, осталось {minutes_left} мин")
 
-            except TelegramRetryAfter as e:
-                # Telegram попросил подождать - пропускаем это обновление
-                print(f"⏳ FloodWait: Telegram просит подождать {e.retry_after}с (пропускаем)")
-                await asyncio.sleep(e.retry_after)
+    except TelegramRetryAfter as e:
+        # Telegram попросил подождать — таблицу обновит следующий тик
+        print(f"⏳ FloodWait: Telegram просит подождать {e.retry_after}с (пропускаем тик)")
 
-            except Exception as e:
-                # Любая другая ошибка - тоже просто пропускаем
-                print(f"⚠️ Ошибка обновления (пропускаем): {e}")
-            
-            # ИЗМЕНЕНО: Ждём 60 секунд вместо 30
-            if iteration > 0:
-                await asyncio.sleep(60)  # ← БЫЛО: 30
-        
-        # Конкурс завершён
-        await finish_spam_contest(bot, contest_id)
-        
-        # Удаляем задачу из активных
-        if task_key in active_tasks:
-            del active_tasks[task_key]
-    
-    except asyncio.CancelledError:
-        print(f"⛔ [{contest_id}] Таймер спам-конкурса был отменён")
-        if task_key in active_tasks:
-            del active_tasks[task_key]
     except Exception as e:
-        print(f"❌ [{contest_id}] Критическая ошибка в таймере: {e}")
-        if task_key in active_tasks:
-            del active_tasks[task_key]
+        # Любая другая ошибка - тоже просто пропускаем
+        print(f"⚠️ Ошибка обновления (пропускаем): {e}")
+
+
+async def finish_spam_timer(bot: Bot, contest: dict, participants: list):
+    """Дедлайн таймера: финальная таблица и итоги"""
+    await update_spam_table(bot, contest, participants, 0)
+    
+    # Конкурс завершён
+    await finish_spam_contest(bot, contest['id'])
+
+
+async def wait_spam_flushes(contest_id: int):
+    """
+    Дождаться, пока остальные живые экземпляры запишут свои счётчики
+    (spam_flush_acks); без подтверждений — исключение, задача повторится
+    """
+    from utils.leader_election import leader_election
+    
+    deadline = time.time() + config.SPAM_FLUSH_ACK_TIMEOUT
+    while True:
+        missing = await db.get_spam_flush_missing(contest_id, leader_election.instance_id)
+        if not missing:
+            return
+        if time.time() >= deadline:
+            raise RuntimeError(f"нет подтверждения сброса счётчиков от экземпляров: {', '.join(missing)}")
+        # Событие о завершении могло потеряться — напоминаем
+        await db.notify_cluster("registry", contest_id)
+        await asyncio.sleep(config.SPAM_FLUSH_ACK_POLL)
 
 
 async def finish_spam_contest(bot: Bot, contest_id: int):
-    """Завершение спам-конкурса и публикация результатов"""
+    """
+    Завершение спам-конкурса и публикация результатов
+    
+    running -> finishing: подсчёт остановлен, экземпляры записывают счётчики;
+    finishing -> ended — только после публикации итогов. Упавшее завершение
+    повторяет задача spam_timer (в том числе после рестарта)
+    """
+    # Останавливаем подсчёт до итогов: завершение ведёт только один вызов
+    if not await db.transition_contest(contest_id, 'running', 'finishing'):
+        contest = await db.get_contest_by_id(contest_id)
+        if not contest or contest['status'] != 'finishing':
+            print(f"⏭️ [{contest_id}] Спам-конкурс уже завершён")
+            return
+        print(f"🔁 [{contest_id}] Продолжаем завершение спам-конкурса")
+    
+    # Финальный сброс счётчиков из памяти перед подсчётом победителя
+    if not await spam_counter.stop_contest(contest_id):
+        raise RuntimeError("не удалось записать счётчики спама")
+    await wait_spam_flushes(contest_id)
+    
     contest = await db.get_contest_by_id(contest_id)
     winner = await db.get_spam_winner(contest_id)
     leaderboard = await db.get_spam_leaderboard(contest_id)
     
     if not winner:
         print(f"❌ [{contest_id}] Нет победителя")
-        await db.update_contest_status(contest_id, 'ended')
+        await db.transition_contest(contest_id, 'finishing', 'ended')
         return
     
     print(f"🏆 [{contest_id}] Победитель: {winner['username']} с {winner['spam_count']} спамами")
@@ -460,14 +436,14 @@ async def finish_spam_contest(bot: Bot, contest_id: int):
     
     # Сохраняем победителя
     await db.set_contest_winner(contest_id, winner['user_id'])
-    await db.increment_user_wins(winner['user_id'], 'spam_contest')
+    total_wins = await db.increment_user_wins(winner['user_id'], 'spam_contest')
+    
+    # Итоги опубликованы и сохранены
+    await db.transition_contest(contest_id, 'finishing', 'ended')
     
     # Проверяем достижения
     from handlers.user.achievements import check_achievements
-    await check_achievements(bot, winner['user_id'])
-    
-    # Завершаем конкурс
-    await db.update_contest_status(contest_id, 'ended')
+    await check_achievements(bot, winner['user_id'], total_wins=total_wins)
     
     # Уведомляем админа
     admin_text = (
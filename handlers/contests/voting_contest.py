@@ -1,25 +1,25 @@
 """
 Голосовательный конкурс (Voting Contest)
 Обработка комментариев, таймер, завершение
-ИСПРАВЛЕНО: отмена фоновых задач при принудительном запуске
+Сбор и таймер — задачи общего планировщика (utils.scheduler)
 """
 
-import asyncio
+import math
 import random
+import time
 from datetime import datetime
+from functools import partial
 from aiogram import Router, F, Bot
 from aiogram.types import Message
 import config
 from database_postgres import db
 from utils.filters import ParticipantFilter
 from utils.formatters import format_time_left, format_participant_list
+from utils.scheduler import scheduler
 
 
 router = Router()
 
-# Глобальный словарь для хранения активных задач
-active_tasks = {}
-
 
 def escape_markdown(text: str) -> str:
     """Экранирует спецсимволы Markdown"""
@@ -63,115 +63,74 @@ async def publish_contest_announcement(bot: Bot, contest_id: int):
         
         print(f"✅ Анонс опубликован! Message ID: {message.message_id}")
         
-        # Запускаем сбор комментариев с сохранением задачи
-        task = asyncio.create_task(collect_comments(bot, contest_id))
-        active_tasks[f"collect_{contest_id}"] = task
+        # Запускаем сбор комментариев
+        await collect_comments(bot, contest_id)
         
     except Exception as e:
         print(f"❌ Ошибка публикации анонса: {e}")
 
 
-async def collect_comments(bot: Bot, contest_id: int):
-    """Фоновая задача сбора комментариев"""
-    task_key = f"collect_{contest_id}"
+async def collect_comments(bot: Bot, contest_id: int, deadline: float = None):
+    """
+    Сбор комментариев: задача планировщика без дедлайна
+    Регистрация срабатывает её через scheduler.fire_now, как только набор заполнен;
+    редкий тик сверяет количество участников на случай, если сигнал потерялся
+    deadline — сохранённый дедлайн при восстановлении (ожидающий повтор закрытия набора)
+    """
+    contest = await db.get_contest_by_id(contest_id)
+    if not contest:
+        print("❌ Активный конкурс не найден при сборе комментариев")
+        return
     
-    try:
-        contest = await db.get_contest_by_id(contest_id)
-        if not contest:
-            print("❌ Активный конкурс не найден при сборе комментариев")
-            return
-        
-        print(f"🔄 Начат сбор комментариев для конкурса {contest_id}")
-        
-        while True:
-            # Проверяем не отменена ли задача
-            if task_key not in active_tasks:
-                print(f"⛔ Задача сбора комментариев для конкурса {contest_id} отменена")
-                break
-            
-            try:
-                current_count = await db.get_participants_count(contest_id)
-                needed_count = contest['participants_count']
-                
-                print(f"📊 [{contest_id}] Собрано {current_count}/{needed_count} участников")
-                
-                if current_count >= needed_count:
-                    print(f"✅ [{contest_id}] Собрано {current_count} участников!")
-                    
-                    # Меняем статус на 'voting'
-                    await db.update_contest_status(contest_id, 'voting')
-                    print(f"🔄 [{contest_id}] Статус конкурса изменён на 'voting'")
-                    
-                    await publish_participants_list(bot, contest_id)
-                    
-                    # Запускаем таймер с сохранением задачи
-                    timer_task = asyncio.create_task(start_timer(bot, contest_id, contest['timer_minutes']))
-                    active_tasks[f"timer_{contest_id}"] = timer_task
-                    
-                    # Удаляем задачу из активных
-                    if task_key in active_tasks:
-                        del active_tasks[task_key]
-                    break
-                
-                await asyncio.sleep(config.COMMENT_CHECK_INTERVAL)
-                
-            except Exception as e:
-                print(f"❌ [{contest_id}] Ошибка при сборе комментариев: {e}")
-                await asyncio.sleep(5)
+    print(f"🔄 Начат сбор комментариев для конкурса {contest_id}")
     
-    except asyncio.CancelledError:
-        print(f"⛔ Задача сбора комментариев для конкурса {contest_id} была отменена")
-        if task_key in active_tasks:
-            del active_tasks[task_key]
-    except Exception as e:
-        print(f"❌ Критическая ошибка в сборе комментариев: {e}")
-        if task_key in active_tasks:
-            del active_tasks[task_key]
+    await scheduler.schedule(
+        "collect", contest_id,
+        deadline=deadline,
+        on_deadline=partial(close_registration, bot, contest),
+        interval=config.COLLECT_RECONCILE_INTERVAL,
+        on_tick=partial(reconcile_collect, contest)
+    )
+
+
+async def reconcile_collect(contest: dict, remaining: float = None):
+    """Тик сбора: набор заполнен, а fire_now не дошёл — закрыть сейчас"""
+    if await db.get_participants_count(contest['id']) >= contest['participants_count']:
+        print(f"🔁 [{contest['id']}] Набор заполнен без сигнала регистрации — закрываем")
+        await scheduler.fire_now("collect", contest['id'])
+
+
+async def close_registration(bot: Bot, contest: dict) -> bool:
+    """
+    Набор заполнен: список участников и таймер голосования
+    Returns: True если набор закрыл этот вызов (а не сборщик или админ раньше)
+    """
+    contest_id = contest['id']
+    
+    # Меняем статус на 'voting'; следующий этап запускает только выигравший переход
+    if not await db.transition_contest(contest_id, 'collecting', 'voting'):
+        print(f"⏭️ [{contest_id}] Набор уже закрыт")
+        return False
+    await scheduler.cancel("collect", contest_id)
+    print(f"✅ [{contest_id}] Набор участников завершён, статус изменён на 'voting'")
+    
+    await publish_participants_list(bot, contest_id)
+    
+    # Запускаем таймер голосования
+    await start_timer(bot, contest_id, contest['timer_minutes'])
+    return True
 
 
 async def cancel_collect_task(contest_id: int):
     """Отменить задачу сбора комментариев для конкурса"""
-    task_key = f"collect_{contest_id}"
-    
-    if task_key in active_tasks:
-        task = active_tasks[task_key]
-        task.cancel()
-        del active_tasks[task_key]
+    if await scheduler.cancel("collect", contest_id):
         print(f"✅ Задача сбора комментариев для конкурса {contest_id} отменена")
-        
-        # Даём время на завершение
-        try:
-            await task
-        except asyncio.CancelledError:
-            pass
 
 
 async def cancel_timer_task(contest_id: int):
     """Отменить задачу таймера для конкурса"""
-    task_key = f"timer_{contest_id}"
-    
-    if task_key in active_tasks:
-        task = active_tasks[task_key]
-        task.cancel()
-        del active_tasks[task_key]
+    if await scheduler.cancel("timer", contest_id):
         print(f"✅ Задача таймера для конкурса {contest_id} отменена")
-        
-        # Даём время на завершение
-        try:
-            await task
-        except asyncio.CancelledError:
-            pass
-
-
-async def check_subscription(bot: Bot, user_id: int) -> bool:
-    """Проверка подписки пользователя на канал"""
-    try:
-        member = await bot.get_chat_member(chat_id=config.CHANNEL_ID, user_id=user_id)
-        return member.status in ["member", "administrator", "creator"]
-    except Exception as e:
-        print(f"⚠️ Ошибка проверки подписки для {user_id}: {e}")
-        return False
-
 
 
 async def publish_participants_list(bot: Bot, contest_id: int):
@@ -221,81 +180,86 @@ async def publish_participants_list(bot: Bot, contest_id: int):
         print(f"❌ [{contest_id}] Ошибка публикации списка: {e}")
         return None
 
-async def start_timer(bot: Bot, contest_id: int, minutes: int):
-    """Запуск таймера конкурса с обновлением каждую минуту"""
-    task_key = f"timer_{contest_id}"
+def format_timer_text(contest: dict, participants: list, remaining_minutes: int) -> str:
+    """Текст списка участников с таймером (0 — время вышло)"""
+    text = f"🎁 Приз: {contest['prize']}\n"
+    text += "\n👥 Список участников:"
+    text += format_participant_list(participants, include_blockquote=True)
+    if remaining_minutes > 0:
+        text += f"\n\n⏰ Осталось {format_time_left(remaining_minutes)}"
+    else:
+        text += "\n\n⏳ Время вышло, ждём результатов!"
+    text += f'\n\n💡 Голосуем Реакциями в <a href="{config.CHANNEL_INVITE_LINK}">Зазвездился</a>'
+    text += f'\n📱<a href="{config.BOT_INVITE_LINK}"> Открыть Бота</a>'
+    return text
+
+
+async def start_timer(bot: Bot, contest_id: int, minutes: int, deadline: float = None):
+    """
+    Запуск таймера конкурса: обновление раз в минуту и завершение в дедлайн
+    deadline — сохранённый дедлайн при восстановлении (иначе сейчас + minutes)
+    """
+    if deadline is None:
+        deadline = time.time() + minutes * 60
+        print(f"⏰ [{contest_id}] Таймер запущен на {minutes} минут")
+    else:
+        print(f"⏰ [{contest_id}] Таймер продолжен: осталось {max(deadline - time.time(), 0) / 60:.1f} мин")
+    
+    contest = await db.get_contest_by_id(contest_id)
+    participants = await db.get_participants(contest_id)
+    
+    await scheduler.schedule(
+        "timer", contest_id,
+        deadline=deadline,
+        on_deadline=partial(finish_timer, bot, contest, participants),
+        interval=config.CONTEST_TIMER_TICK,
+        on_tick=partial(update_timer, bot, contest, participants),
+        tick_now=True
+    )
+
+
+async def update_timer(bot: Bot, contest: dict, participants: list, remaining: float):
+    """Тик таймера: обновить оставшееся время в сообщении"""
+    contest_id = contest['id']
+    remaining_minutes = math.ceil(remaining / 60)
     
     try:
-        print(f"⏰ [{contest_id}] Таймер запущен на {minutes} минут")
-        
-        contest = await db.get_contest_by_id(contest_id)
-        message_id = contest['announcement_message_id']
-        participants = await db.get_participants(contest_id)
-        
-        # Обновляем сообщение каждую минуту
-        for remaining in range(minutes, -1, -1):  # minutes, minutes-1, ..., 1, 0
-            # Проверяем не отменена ли задача
-            if task_key not in active_tasks:
-                print(f"⛔ [{contest_id}] Таймер отменён")
-                break
-            
-            # Формируем текст в зависимости от оставшегося времени
-            if remaining > 0:
-                # Ещё есть время
-                text = f"🎁 Приз: {contest['prize']}\n"
-                text += "\n👥 Список участников:"
-                text += format_participant_list(participants, include_blockquote=True)
-                text += f"\n\n⏰ Осталось {format_time_left(remaining)}"
-                text += f'\n\n💡 Голосуем Реакциями в <a href="{config.CHANNEL_INVITE_LINK}">Зазвездился</a>'
-                text += f'\n📱<a href="{config.BOT_INVITE_LINK}"> Открыть Бота</a>'
-            else:
-                # Время вышло (remaining = 0)
-                text = f"🎁 Приз: {contest['prize']}\n"
-                text += "\n👥 Список участников:"
-                text += format_participant_list(participants, include_blockquote=True)
-                text += "\n\n⏳ Время вышло, ждём результатов!"
-                text += f'\n\n💡 Голосуем Реакциями в <a href="{config.CHANNEL_INVITE_LINK}">Зазвездился</a>'
-                text += f'\n📱<a href="{config.BOT_INVITE_LINK}"> Открыть Бота</a>'
-            try:
-                await bot.edit_message_text(
-                    chat_id=config.CHANNEL_ID,
-                    message_id=message_id,
-                    text=text,
-                    parse_mode="HTML",
-                    disable_web_page_preview=True
-                )
-                
-                if remaining > 0:
-                    print(f"⏰ [{contest_id}] Обновлён таймер: осталось {format_time_left(remaining)}")
-                else:
-                    print(f"⏳ [{contest_id}] Финальное обновление: Время вышло!")
-            except Exception as e:
-                print(f"❌ [{contest_id}] Ошибка обновления таймера: {e}")
-            
-            # Если время ещё не вышло - ждём минуту
-            if remaining > 0:
-                await asyncio.sleep(60)
-        
-        # Завершаем конкурс
-        await end_contest(bot, contest_id)
-        
-        # Удаляем задачу из активных
-        if task_key in active_tasks:
-            del active_tasks[task_key]
+        await bot.edit_message_text(
+            chat_id=config.CHANNEL_ID,
+            message_id=contest['announcement_message_id'],
+            text=format_timer_text(contest, participants, remaining_minutes),
+            parse_mode="HTML",
+            disable_web_page_preview=True
+        )
+        print(f"⏰ [{contest_id}] Обновлён таймер: осталось {format_time_left(remaining_minutes)}")
+    except Exception as e:
+        print(f"❌ [{contest_id}] Ошибка обновления таймера: {e}")
+
+
+async def finish_timer(bot: Bot, contest: dict, participants: list):
+    """Дедлайн таймера: финальное обновление и завершение конкурса"""
+    contest_id = contest['id']
     
-    except asyncio.CancelledError:
-        print(f"⛔ [{contest_id}] Таймер был отменён")
-        if task_key in active_tasks:
-            del active_tasks[task_key]
+    try:
+        await bot.edit_message_text(
+            chat_id=config.CHANNEL_ID,
+            message_id=contest['announcement_message_id'],
+            text=format_timer_text(contest, participants, 0),
+            parse_mode="HTML",
+            disable_web_page_preview=True
+        )
+        print(f"⏳ [{contest_id}] Финальное обновление: Время вышло!")
     except Exception as e:
-        print(f"❌ [{contest_id}] Критическая ошибка в таймере: {e}")
-        if task_key in active_tasks:
-            del active_tasks[task_key]
+        print(f"❌ [{contest_id}] Ошибка обновления таймера: {e}")
+    
+    await end_contest(bot, contest_id)
 
 
 async def end_contest(bot: Bot, contest_id: int):
     """Завершение конкурса - отправка результатов админу"""
-    await db.update_contest_status(contest_id, 'ended')
+    if not await db.transition_contest(contest_id, 'voting', 'ended'):
+        print(f"⏭️ [{contest_id}] Конкурс уже завершён")
+        return
     
     participants = await db.get_participants(contest_id)
     contest = await db.get_contest_by_id(contest_id)
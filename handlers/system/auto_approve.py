@@ -5,6 +5,8 @@
 from aiogram import Router, F
 from aiogram.types import ChatJoinRequest
 import config
+from utils.subscriber_set import subscriber_set
+from utils.subscription_cache import subscription_cache
 
 
 router = Router()
@@ -22,6 +24,10 @@ async def approve_channel_request(join_request: ChatJoinRequest):
         # Принимаем заявку
         await join_request.approve()
         
+        # Пользователь теперь подписчик канала
+        subscription_cache.set(join_request.from_user.id, True)
+        await subscriber_set.record(join_request.from_user.id, True)
+        
         print(f"✅ Принята заявка в КАНАЛ от @{join_request.from_user.username} "
               f"(ID: {join_request.from_user.id})")
         
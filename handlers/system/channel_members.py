@@ -0,0 +1,47 @@
+"""
+Отслеживание подписчиков канала по обновлениям chat_member
+Поддерживает локальное множество подписчиков (utils.subscriber_set)
+"""
+
+from aiogram import Router, F
+from aiogram.types import ChatMemberUpdated
+import config
+from utils.subscriber_set import subscriber_set
+from utils.subscription_cache import subscription_cache, SUBSCRIBED_STATUSES
+from utils.leaderboard_service import leaderboard_service
+
+
+router = Router()
+
+
+@router.chat_member(F.chat.id == config.CHANNEL_ID)
+async def on_channel_member_update(update: ChatMemberUpdated):
+    """
+    Пользователь подписался / отписался от канала
+    """
+    user_id = update.new_chat_member.user.id
+    is_member = update.new_chat_member.status in SUBSCRIBED_STATUSES
+    
+    subscription_cache.set(user_id, is_member)
+    await subscriber_set.record(user_id, is_member)
+    leaderboard_service.on_subscription_change(user_id)
+    
+    if is_member:
+        print(f"➕ Подписка на канал: {user_id}")
+    else:
+        print(f"➖ Отписка от канала: {user_id}")
+
+
+@router.my_chat_member(F.chat.id == config.CHANNEL_ID)
+async def on_bot_member_update(update: ChatMemberUpdated):
+    """
+    Изменились права самого бота в канале
+    Без прав администратора Telegram не присылает обновления chat_member
+    """
+    status = update.new_chat_member.status
+    
+    if status == "administrator":
+        print("✅ Бот — администратор канала, обновления подписчиков включены")
+    else:
+        print(f"⚠️ Бот больше не администратор канала (статус: {status}), "
+              f"подписки будут проверяться через API")
@@ -1,6 +1,6 @@
 """
 ТОП игроков (Лидерборды)
-3 категории: рефералы, победы, активность
+Категории: рефералы, победы, активность, рефералы 2-го уровня, вся сеть
 """
 
 from aiogram import Router, F, Bot
@@ -8,7 +8,16 @@ from aiogram.types import CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.utils import markdown
 from database_postgres import db
-import config
+from utils.subscription_cache import subscription_cache
+from utils.leaderboard_service import (
+    leaderboard_service,
+    GRAPH_CATEGORIES,
+    PERIOD_TYPES,
+    PERIOD_CONTEST_TYPES,
+    PERIOD_METRICS
+)
+from utils.rank_index import rank_index
+from utils.referral_graph import referral_graph
 
 def escape_markdown(text: str) -> str:
     """Экранирует спецсимволы Markdown"""
@@ -22,39 +31,120 @@ def escape_markdown(text: str) -> str:
 router = Router()
 
 
-async def check_user_subscription(bot: Bot, user_id: int) -> bool:
-    """Проверка подписки пользователя на канал"""
-    try:
-        member = await bot.get_chat_member(chat_id=config.CHANNEL_ID, user_id=user_id)
-        return member.status in ["member", "administrator", "creator"]
-    except Exception as e:
-        print(f"⚠️ Ошибка проверки подписки для {user_id}: {e}")
-        return False
+# Оформление категорий: заголовок, подпись счёта, подпись «ваш счёт», пустой счёт
+CATEGORY_TEXTS = {
+    "referrals": {
+        "title": "👥 **ТОП ПО РЕФЕРАЛАМ**",
+        "empty_title": "📊 **ТОП ПО РЕФЕРАЛАМ**",
+        "unit": "реф.",
+        "own": "👥 **Ваши рефералы:**",
+        "no_score": "📍 У вас пока нет рефералов\n💡 Пригласите друзей, чтобы попасть в рейтинг!",
+    },
+    "wins": {
+        "title": "🏆 **ТОП ПО ПОБЕДАМ**",
+        "empty_title": "📊 **ТОП ПО ПОБЕДАМ**",
+        "unit": "побед",
+        "own": "🏆 **Ваши победы:**",
+        "no_score": "📍 У вас пока нет побед\n💡 Участвуйте в конкурсах, чтобы попасть в рейтинг!",
+    },
+    "contests": {
+        "title": "🎯 **ТОП ПО АКТИВНОСТИ**",
+        "empty_title": "📊 **ТОП ПО АКТИВНОСТИ**",
+        "unit": "участий",
+        "own": "🎯 **Ваши участия:**",
+        "no_score": "📍 Вы ещё не участвовали в конкурсах\n💡 Примите участие, чтобы попасть в рейтинг!",
+    },
+    "second_level": {
+        "title": "🌿 **ТОП ПО РЕФЕРАЛАМ 2-ГО УРОВНЯ**",
+        "empty_title": "📊 **ТОП ПО РЕФЕРАЛАМ 2-ГО УРОВНЯ**",
+        "unit": "чел.",
+        "own": "🌿 **Рефералы ваших рефералов:**",
+        "no_score": "📍 Ваши рефералы пока никого не пригласили\n💡 Попросите друзей поделиться своей ссылкой!",
+    },
+    "network": {
+        "title": "🌳 **ТОП ПО РАЗМЕРУ СЕТИ**",
+        "empty_title": "📊 **ТОП ПО РАЗМЕРУ СЕТИ**",
+        "unit": "чел.",
+        "own": "🌳 **Ваша сеть:**",
+        "no_score": "📍 У вас пока нет сети рефералов\n💡 Пригласите друзей, чтобы попасть в рейтинг!",
+    },
+}
+
+MEDALS = {1: "🥇", 2: "🥈", 3: "🥉"}
 
 
-async def get_user_info(bot: Bot, user_id: int) -> tuple[str, bool]:
+async def render_top(bot: Bot, user_id: int, category: str) -> str:
     """
-    Получить имя пользователя и статус подписки
-    
-    Returns:
-        tuple (display_name, is_subscribed)
+    Текст ТОПа категории для пользователя
+    Список лидеров берётся из памяти (utils.leaderboard_service)
     """
-    try:
-        user = await bot.get_chat(user_id)
-        
-        # Формируем отображаемое имя
-        if user.username:
-            display_name = f"@{user.username}"
-        else:
-            display_name = user.first_name
+    texts = CATEGORY_TEXTS[category]
+    top_users = leaderboard_service.get_top(category)
+    
+    if not top_users:
+        return f"{texts['empty_title']}\n\n❌ Пока нет данных"
+    
+    text = f"{texts['title']}\n\n"
+    
+    for idx, user in enumerate(top_users, 1):
+        emoji = MEDALS.get(idx, f"{idx}.")
         
-        # Проверяем подписку
-        is_subscribed = await check_user_subscription(bot, user_id)
+        # ЭКРАНИРУЕМ ИМЯ
+        safe_name = escape_markdown(user['name'])
+        line = f"{emoji} {safe_name} — {user['score']} {texts['unit']}"
         
-        return (display_name, is_subscribed)
-    except Exception as e:
-        print(f"⚠️ Ошибка получения информации о пользователе {user_id}: {e}")
-        return (f"User {user_id}", False)
+        # Подсветка текущего пользователя
+        if user['user_id'] == user_id:
+            text += f"**{line}**\n"
+        else:
+            text += f"{line}\n"
+    
+    text += f"\n━━━━━━━━━━━━━━━━\n"
+    
+    # Текущий пользователь уже в ТОПе — дополнительных запросов не нужно
+    if any(u['user_id'] == user_id for u in top_users):
+        return text + f"📍 Вы в топ-{leaderboard_service.top_size}! Поздравляем! 🎉"
+    
+    if not await subscription_cache.is_subscribed(bot, user_id):
+        return text + "⚠️ Вы не подписаны на канал\n💡 Подпишитесь, чтобы попасть в рейтинг!"
+    
+    # Категории по графу рефералов: счёт из графа в памяти, место — если есть в выборке
+    if category in GRAPH_CATEGORIES:
+        score = referral_graph.get_score(user_id, GRAPH_CATEGORIES[category])
+        if score > 0:
+            for leader in leaderboard_service.get_leaders(category):
+                if leader['user_id'] == user_id:
+                    text += f"📍 **Ваша позиция:** {leader['rank']} место\n"
+            text += f"{texts['own']} {score}"
+        else:
+            text += texts['no_score']
+        return text
+    
+    # Место и счёт — из индекса рейтингов в памяти (utils.rank_index)
+    position, total = rank_index.get_position(user_id, category)
+    if position > 0:
+        score = rank_index.get_score(user_id, category)
+        text += f"📍 **Ваша позиция:** {position} место из {total}\n"
+        text += f"{texts['own']} {score}"
+    else:
+        text += texts['no_score']
+    
+    return text
+
+
+async def show_top(callback: CallbackQuery, category: str):
+    """Показать ТОП категории (только подписанные)"""
+    text = await render_top(callback.bot, callback.from_user.id, category)
+    
+    builder = InlineKeyboardBuilder()
+    builder.button(text="🔙 К выбору категории", callback_data="leaderboard")
+    
+    await callback.message.edit_text(
+        text,
+        reply_markup=builder.as_markup(),
+        parse_mode="Markdown"
+    )
+    await callback.answer()
 
 
 @router.callback_query(F.data == "leaderboard")
@@ -69,6 +159,10 @@ async def show_leaderboard_menu(callback: CallbackQuery):
     builder.button(text="👥 ТОП по рефералам", callback_data="top_referrals")
     builder.button(text="🏆 ТОП по победам", callback_data="top_wins")
     builder.button(text="🎯 ТОП по активности", callback_data="top_contests")
+    builder.button(text="🌿 ТОП по рефералам 2-го уровня", callback_data="top_second_level")
+    builder.button(text="🌳 ТОП по размеру сети", callback_data="top_network")
+    builder.button(text="📅 ТОП за неделю / месяц", callback_data=period_callback("week", "all", "wins"))
+    builder.button(text="📈 История моих мест", callback_data="rank_history")
     builder.button(text="🔙 Назад в меню", callback_data="back_to_menu")
     builder.adjust(1)
     
@@ -83,239 +177,126 @@ async def show_leaderboard_menu(callback: CallbackQuery):
 @router.callback_query(F.data == "top_referrals")
 async def show_top_referrals(callback: CallbackQuery):
     """ТОП по рефералам (только подписанные)"""
-    user_id = callback.from_user.id
-    
-    # ✅ ИСПРАВЛЕНО: используем правильную функцию из API
-    top_users = await db.get_leaderboard_by_referrals(limit=20)
-    
-    if not top_users:
-        text = "📊 **ТОП ПО РЕФЕРАЛАМ**\n\n❌ Пока нет данных"
-    else:
-        # Фильтруем только подписанных
-        filtered_users = []
-        for user in top_users:
-            is_subscribed = await check_user_subscription(callback.bot, user['user_id'])
-            if is_subscribed:
-                # ✅ ИСПРАВЛЕНО: берём данные из правильных полей
-                display_name = f"@{user['username']}" if user.get('username') else user.get('full_name', f"User {user['user_id']}")
-                filtered_users.append({
-                    'user_id': user['user_id'],
-                    'name': display_name,
-                    'points': user['referral_count']  # ✅ Изменено с referral_points на referral_count
-                })
-            
-            # Останавливаемся когда набрали 10 подписанных
-            if len(filtered_users) >= 10:
-                break
-        
-        if not filtered_users:
-            text = "📊 **ТОП ПО РЕФЕРАЛАМ**\n\n❌ Пока нет данных"
-        else:
-            text = "👥 **ТОП ПО РЕФЕРАЛАМ**\n\n"
-            
-            # Формируем топ-10
-            for idx, user in enumerate(filtered_users, 1):
-                # Эмодзи для топ-3
-                if idx == 1:
-                    emoji = "🥇"
-                elif idx == 2:
-                    emoji = "🥈"
-                elif idx == 3:
-                    emoji = "🥉"
-                else:
-                    emoji = f"{idx}."
-                
-                # ЭКРАНИРУЕМ ИМЯ
-                safe_name = escape_markdown(user['name'])
-                
-                # Подсветка текущего пользователя
-                if user['user_id'] == user_id:
-                    text += f"**{emoji} {safe_name} — {user['points']} реф.**\n"
-                else:
-                    text += f"{emoji} {safe_name} — {user['points']} реф.\n"
-            
-            # Позиция текущего пользователя
-            position, total = await db.get_user_position(user_id, 'referrals')
-            
-            # Проверяем подписан ли текущий пользователь
-            user_subscribed = await check_user_subscription(callback.bot, user_id)
-            
-            if position > 0 and user_subscribed:
-                text += f"\n━━━━━━━━━━━━━━━━\n"
-                if position <= 10 and user_id in [u['user_id'] for u in filtered_users]:
-                    text += f"📍 Вы в топ-10! Поздравляем! 🎉"
-                else:
-                    referral_count = await db.get_referral_count(user_id)
-                    text += f"📍 **Ваша позиция:** {position} место\n"
-                    text += f"👥 **Ваши рефералы:** {referral_count}"
-            elif not user_subscribed:
-                text += f"\n━━━━━━━━━━━━━━━━\n"
-                text += "⚠️ Вы не подписаны на канал\n"
-                text += "💡 Подпишитесь, чтобы попасть в рейтинг!"
-            else:
-                text += f"\n━━━━━━━━━━━━━━━━\n"
-                text += "📍 У вас пока нет рефералов\n"
-                text += "💡 Пригласите друзей, чтобы попасть в рейтинг!"
-    
-    builder = InlineKeyboardBuilder()
-    builder.button(text="🔙 К выбору категории", callback_data="leaderboard")
-    
-    await callback.message.edit_text(
-        text,
-        reply_markup=builder.as_markup(),
-        parse_mode="Markdown"
-    )
-    await callback.answer()
+    await show_top(callback, "referrals")
 
 
 @router.callback_query(F.data == "top_wins")
 async def show_top_wins(callback: CallbackQuery):
     """ТОП по победам (только подписанные)"""
+    await show_top(callback, "wins")
+
+
+@router.callback_query(F.data == "top_contests")
+async def show_top_contests(callback: CallbackQuery):
+    """ТОП по активности (только подписанные)"""
+    await show_top(callback, "contests")
+
+
+@router.callback_query(F.data == "top_second_level")
+async def show_top_second_level(callback: CallbackQuery):
+    """ТОП по рефералам 2-го уровня (только подписанные)"""
+    await show_top(callback, "second_level")
+
+
+@router.callback_query(F.data == "top_network")
+async def show_top_network(callback: CallbackQuery):
+    """ТОП по размеру сети рефералов (только подписанные)"""
+    await show_top(callback, "network")
+
+
+# ТОПы за период: подписи кнопок и заголовков
+PERIOD_LABELS = {"week": "Неделя", "month": "Месяц", "all": "Всё время"}
+PERIOD_TITLES = {"week": "ЗА НЕДЕЛЮ", "month": "ЗА МЕСЯЦ", "all": "ЗА ВСЁ ВРЕМЯ"}
+TYPE_LABELS = {
+    "all": "Все",
+    "voting_contest": "Голосование",
+    "random_contest": "Рандом",
+    "spam_contest": "Спам",
+}
+METRIC_LABELS = {"wins": ("🏆 Победы", "побед"), "contests": ("🎯 Участия", "участий")}
+
+
+def period_callback(period_type: str, contest_type: str, metric: str) -> str:
+    """callback_data экрана ТОПа за период"""
+    return f"top_period:{period_type}:{contest_type}:{metric}"
+
+
+@router.callback_query(F.data.startswith("top_period:"))
+async def show_top_period(callback: CallbackQuery):
+    """ТОП за неделю / месяц / всё время по типу конкурса (только подписанные)"""
+    try:
+        _, period_type, contest_type, metric = callback.data.split(":")
+    except ValueError:
+        await callback.answer()
+        return
+    
+    if (period_type not in PERIOD_TYPES or contest_type not in PERIOD_CONTEST_TYPES
+            or metric not in PERIOD_METRICS):
+        await callback.answer()
+        return
+    
     user_id = callback.from_user.id
+    board = await leaderboard_service.get_period_board(period_type, contest_type, metric)
+    metric_title, unit = METRIC_LABELS[metric]
     
-    # ✅ ИСПРАВЛЕНО: используем правильную функцию из API
-    top_users = await db.get_leaderboard_by_wins(limit=20)
+    text = f"📅 **ТОП {PERIOD_TITLES[period_type]}**\n"
+    text += f"{metric_title} · {TYPE_LABELS[contest_type]}\n\n"
     
-    if not top_users:
-        text = "📊 **ТОП ПО ПОБЕДАМ**\n\n❌ Пока нет данных"
-    else:
-        # Фильтруем только подписанных
-        filtered_users = []
-        for user in top_users:
-            is_subscribed = await check_user_subscription(callback.bot, user['user_id'])
-            if is_subscribed:
-                display_name = f"@{user['username']}" if user.get('username') else user.get('full_name', f"User {user['user_id']}")
-                filtered_users.append({
-                    'user_id': user['user_id'],
-                    'name': display_name,
-                    'wins': user['total_wins']
-                })
-            
-            if len(filtered_users) >= 10:
-                break
-        
-        if not filtered_users:
-            text = "📊 **ТОП ПО ПОБЕДАМ**\n\n❌ Пока нет данных"
-        else:
-            text = "🏆 **ТОП ПО ПОБЕДАМ**\n\n"
-            
-            for idx, user in enumerate(filtered_users, 1):
-                if idx == 1:
-                    emoji = "🥇"
-                elif idx == 2:
-                    emoji = "🥈"
-                elif idx == 3:
-                    emoji = "🥉"
-                else:
-                    emoji = f"{idx}."
-                
-                # ЭКРАНИРУЕМ ИМЯ
-                safe_name = escape_markdown(user['name'])
-                
-                if user['user_id'] == user_id:
-                    text += f"**{emoji} {safe_name} — {user['wins']} побед**\n"
-                else:
-                    text += f"{emoji} {safe_name} — {user['wins']} побед\n"
-            
-            position, total = await db.get_user_position(user_id, 'wins')
-            user_subscribed = await check_user_subscription(callback.bot, user_id)
-            
-            if position > 0 and user_subscribed:
-                text += f"\n━━━━━━━━━━━━━━━━\n"
-                if position <= 10 and user_id in [u['user_id'] for u in filtered_users]:
-                    text += f"📍 Вы в топ-10! Поздравляем! 🎉"
-                else:
-                    stats = await db.get_user_stats(user_id)
-                    text += f"📍 **Ваша позиция:** {position} место\n"
-                    text += f"🏆 **Ваши победы:** {stats['total_wins']}"
-            elif not user_subscribed:
-                text += f"\n━━━━━━━━━━━━━━━━\n"
-                text += "⚠️ Вы не подписаны на канал\n"
-                text += "💡 Подпишитесь, чтобы попасть в рейтинг!"
-            else:
-                text += f"\n━━━━━━━━━━━━━━━━\n"
-                text += "📍 У вас пока нет побед\n"
-                text += "💡 Участвуйте в конкурсах, чтобы попасть в рейтинг!"
+    if not board["top"]:
+        text += "❌ Пока нет данных"
+    
+    for idx, user in enumerate(board["top"], 1):
+        emoji = MEDALS.get(idx, f"{idx}.")
+        line = f"{emoji} {escape_markdown(user['name'])} — {user['score']} {unit}"
+        text += f"**{line}**\n" if user['user_id'] == user_id else f"{line}\n"
     
     builder = InlineKeyboardBuilder()
+    for value, label in PERIOD_LABELS.items():
+        mark = "• " if value == period_type else ""
+        builder.button(text=f"{mark}{label}", callback_data=period_callback(value, contest_type, metric))
+    for value, label in TYPE_LABELS.items():
+        mark = "• " if value == contest_type else ""
+        builder.button(text=f"{mark}{label}", callback_data=period_callback(period_type, value, metric))
+    for value, (label, _) in METRIC_LABELS.items():
+        mark = "• " if value == metric else ""
+        builder.button(text=f"{mark}{label}", callback_data=period_callback(period_type, contest_type, value))
     builder.button(text="🔙 К выбору категории", callback_data="leaderboard")
+    builder.adjust(3, 4, 2, 1)
     
-    await callback.message.edit_text(
-        text,
-        reply_markup=builder.as_markup(),
-        parse_mode="Markdown"
-    )
+    try:
+        await callback.message.edit_text(
+            text,
+            reply_markup=builder.as_markup(),
+            parse_mode="Markdown"
+        )
+    except Exception:
+        # Тот же экран (повторное нажатие) — Telegram не даёт отредактировать
+        pass
     await callback.answer()
 
 
-@router.callback_query(F.data == "top_contests")
-async def show_top_contests(callback: CallbackQuery):
-    """ТОП по активности (только подписанные)"""
-    user_id = callback.from_user.id
+@router.callback_query(F.data == "rank_history")
+async def show_rank_history(callback: CallbackQuery):
+    """История мест пользователя по дням (ежедневные снимки рейтингов)"""
+    history = await db.get_rank_history(callback.from_user.id, days=7)
     
-    # ✅ ИСПРАВЛЕНО: используем правильную функцию из API
-    top_users = await db.get_leaderboard_by_contests(limit=20)
+    # день -> {категория: место}
+    days = {}
+    for row in history:
+        days.setdefault(row['snapshot_date'], {})[row['category']] = row['position']
     
-    if not top_users:
-        text = "📊 **ТОП ПО АКТИВНОСТИ**\n\n❌ Пока нет данных"
-    else:
-        # Фильтруем только подписанных
-        filtered_users = []
-        for user in top_users:
-            is_subscribed = await check_user_subscription(callback.bot, user['user_id'])
-            if is_subscribed:
-                display_name = f"@{user['username']}" if user.get('username') else user.get('full_name', f"User {user['user_id']}")
-                filtered_users.append({
-                    'user_id': user['user_id'],
-                    'name': display_name,
-                    'contests': user['total_contests']
-                })
-            
-            if len(filtered_users) >= 10:
-                break
-        
-        if not filtered_users:
-            text = "📊 **ТОП ПО АКТИВНОСТИ**\n\n❌ Пока нет данных"
-        else:
-            text = "🎯 **ТОП ПО АКТИВНОСТИ**\n\n"
-            
-            for idx, user in enumerate(filtered_users, 1):
-                if idx == 1:
-                    emoji = "🥇"
-                elif idx == 2:
-                    emoji = "🥈"
-                elif idx == 3:
-                    emoji = "🥉"
-                else:
-                    emoji = f"{idx}."
-                
-                # ЭКРАНИРУЕМ ИМЯ
-                safe_name = escape_markdown(user['name'])
-                
-                if user['user_id'] == user_id:
-                    text += f"**{emoji} {safe_name} — {user['contests']} участий**\n"
-                else:
-                    text += f"{emoji} {safe_name} — {user['contests']} участий\n"
-            
-            position, total = await db.get_user_position(user_id, 'contests')
-            user_subscribed = await check_user_subscription(callback.bot, user_id)
-            
-            if position > 0 and user_subscribed:
-                text += f"\n━━━━━━━━━━━━━━━━\n"
-                if position <= 10 and user_id in [u['user_id'] for u in filtered_users]:
-                    text += f"📍 Вы в топ-10! Поздравляем! 🎉"
-                else:
-                    stats = await db.get_user_stats(user_id)
-                    text += f"📍 **Ваша позиция:** {position} место\n"
-                    text += f"🎯 **Ваши участия:** {stats['total_contests']}"
-            elif not user_subscribed:
-                text += f"\n━━━━━━━━━━━━━━━━\n"
-                text += "⚠️ Вы не подписаны на канал\n"
-                text += "💡 Подпишитесь, чтобы попасть в рейтинг!"
-            else:
-                text += f"\n━━━━━━━━━━━━━━━━\n"
-                text += "📍 Вы ещё не участвовали в конкурсах\n"
-                text += "💡 Примите участие, чтобы попасть в рейтинг!"
+    text = "📈 **ИСТОРИЯ ВАШИХ МЕСТ**\n"
+    text += "🏆 победы · 🎯 активность · 👥 рефералы\n\n"
+    
+    if not days:
+        text += "❌ Пока нет данных — снимки рейтингов делаются раз в день"
+    
+    for day, positions in days.items():
+        cells = [
+            f"{icon} {positions.get(category) or '—'}"
+            for icon, category in (("🏆", "wins"), ("🎯", "contests"), ("👥", "referrals"))
+        ]
+        text += f"{day.strftime('%d.%m')}: {' · '.join(cells)}\n"
     
     builder = InlineKeyboardBuilder()
     builder.button(text="🔙 К выбору категории", callback_data="leaderboard")
@@ -326,5 +307,3 @@ async def show_top_contests(callback: CallbackQuery):
         parse_mode="Markdown"
     )
     await callback.answer()
-
-    
\ No newline at end of file
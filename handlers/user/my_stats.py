@@ -8,6 +8,7 @@ from aiogram.types import CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from database_postgres import db
 from urllib.parse import quote
+from utils.referral_graph import referral_graph
 
 
 router = Router()
@@ -31,6 +32,8 @@ async def show_my_stats(callback: CallbackQuery):
     text = (
         "📊 <b>ВАША СТАТИСТИКА</b>\n\n"
         f"👥 Рефералов: {referral_count}\n"
+        f"🌳 Ваша сеть: {referral_graph.downstream_size(user_id)} "
+        f"(2-й уровень: {referral_graph.second_level_count(user_id)})\n"
         f"🎯 Участий в конкурсах: {stats['total_contests']}\n"
         f"🏆 Побед: {stats['total_wins']}\n\n"
         f"💡 <b>Пригласите друзей!</b>\n"
@@ -8,6 +8,9 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 import config
 from database_postgres import db
+from utils.subscription_cache import subscription_cache
+from utils.user_directory import user_directory
+from utils.referral_queue import referral_queue
 
 
 router = Router()
@@ -35,10 +38,11 @@ async def handle_referral_link(message: Message, ref_code: str):
             await show_main_menu(message)
             return
         
-        # Проверяем был ли уже приглашён этим реферером
-        already_referred = await db.check_referral_exists(referrer_id, referred_id)
+        # Добавляем реферала: запись идёт пачками (utils.referral_queue),
+        # повторный переход по той же ссылке отсекается ON CONFLICT
+        added = await referral_queue.add(referrer_id, referred_id)
         
-        if already_referred:
+        if not added:
             await message.answer(
                 "ℹ️ Вы уже были приглашены этим пользователем!"
             )
@@ -46,15 +50,9 @@ async def handle_referral_link(message: Message, ref_code: str):
             await show_main_menu(message)
             return
         
-        # Добавляем реферала
-        await db.add_referral(referrer_id, referred_id)
-        
-        # Получаем информацию о пригласившем
-        try:
-            referrer_info = await message.bot.get_chat(referrer_id)
-            referrer_name = referrer_info.first_name
-        except:
-            referrer_name = "пользователь"
+        # Имя пригласившего — из справочника пользователей
+        referrer = await user_directory.get(referrer_id)
+        referrer_name = (referrer and referrer['full_name']) or "пользователь"
         
         builder = InlineKeyboardBuilder()
         builder.button(text="📢 Подписаться на канал", url=config.CHANNEL_INVITE_LINK)
@@ -84,35 +82,28 @@ async def check_subscription(callback: CallbackQuery):
     referrer_id = int(callback.data.split("_")[2])
     referred_id = callback.from_user.id
     
-    # Проверяем подписку
-    try:
-        member = await callback.bot.get_chat_member(
-            chat_id=config.CHANNEL_ID, 
-            user_id=referred_id
-        )
-        is_subscribed = member.status in ["member", "administrator", "creator"]
-    except Exception as e:
-        print(f"❌ Ошибка проверки подписки: {e}")
-        is_subscribed = False
+    # Проверяем подписку заново: пользователь только что мог подписаться
+    is_subscribed = await subscription_cache.is_subscribed(callback.bot, referred_id, force=True)
     
     if is_subscribed:
-        # Начисляем очко рефереру
-        await db.mark_referral_subscribed(referrer_id, referred_id)
+        # Начисляем очко рефереру (только при первой подписке по этой ссылке)
+        referral_count = await db.mark_referral_subscribed(referrer_id, referred_id)
         
-        # Проверяем достижения рефера
-        from handlers.user.achievements import check_achievements
-        await check_achievements(callback.bot, referrer_id)
-        
-        # Уведомляем реферера
-        try:
-            await callback.bot.send_message(
-                referrer_id,
-                config.MESSAGES["new_referral"].format(
-                    name=callback.from_user.first_name
+        if referral_count is not None:
+            # Проверяем достижения рефера
+            from handlers.user.achievements import check_achievements
+            await check_achievements(callback.bot, referrer_id, referral_count=referral_count)
+            
+            # Уведомляем реферера
+            try:
+                await callback.bot.send_message(
+                    referrer_id,
+                    config.MESSAGES["new_referral"].format(
+                        name=callback.from_user.first_name
+                    )
                 )
-            )
-        except:
-            pass
+            except:
+                pass
         
         # Показываем главное меню
         from handlers.user.main_menu import get_main_menu_keyboard
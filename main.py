@@ -5,6 +5,8 @@ Contest Bot v2.5 - Точка входа с API сервером
 
 import asyncio
 import logging
+import time
+from functools import partial
 from aiogram import Bot, Dispatcher
 
 import config
@@ -12,77 +14,236 @@ from database_postgres import DatabasePostgres
 import database_postgres
 
 
+async def restore_contest(bot: Bot, contest: dict, jobs: dict):
+    """
+    Поставить задачи планировщика для этапа, в котором находится конкурс
+    Таймеры продолжаются с сохранёнными дедлайнами (jobs — строки contest_jobs
+    по имени задачи), то есть ровно с оставшимся временем
+    """
+    from database_postgres import db
+    from utils.scheduler import job_key, scheduler
+    
+    contest_id = contest['id']
+    contest_type = contest['contest_type']
+    status = contest['status']
+    
+    def saved_deadline(stage: str):
+        """
+        Сохранённый дедлайн этапа (None — задачи нет, этап начнётся заново)
+        Прошедший дедлайн сработает сразу после запуска; задача с тем же
+        дедлайном сохраняет попытки, а failed-задача не запускается (ждёт админа)
+        """
+        job = jobs.get(job_key(stage, contest_id))
+        return job['deadline'] if job else None
+    
+    if status == 'collecting':
+        # Восстановить сбор участников
+        if contest_type == 'voting_contest':
+            from handlers.contests.voting_contest import collect_comments
+            await collect_comments(bot, contest_id, saved_deadline("collect"))
+            print(f"      ✅ Восстановлен сбор (voting)")
+            
+        elif contest_type == 'random_contest':
+            from handlers.contests.random_contest import collect_random_participants
+            await collect_random_participants(bot, contest_id, saved_deadline("collect"))
+            print(f"      ✅ Восстановлен сбор (random)")
+            
+        elif contest_type == 'spam_contest':
+            from handlers.contests.spam_contest import collect_spam_participants
+            await collect_spam_participants(bot, contest_id, saved_deadline("collect"))
+            print(f"      ✅ Восстановлен сбор (spam)")
+
+        # Набор мог заполниться, пока бот был остановлен
+        if await db.get_participants_count(contest_id) >= contest['participants_count']:
+            await scheduler.fire_now("collect", contest_id)
+
+    elif status == 'voting':
+        # Восстановить таймер голосования
+        from handlers.contests.voting_contest import start_timer
+        await start_timer(bot, contest_id, contest['timer_minutes'], saved_deadline("timer"))
+        print(f"      ✅ Восстановлен таймер голосования")
+    
+    elif status == 'running' and contest_type == 'spam_contest':
+        # Восстановить спам-конкурс
+        from handlers.contests.spam_contest import run_spam_timer
+        from utils.spam_counter import spam_counter
+        if not spam_counter.is_running(contest_id):
+            participants = await db.get_participants(contest_id)
+            spam_counter.start_contest(contest_id, [p['user_id'] for p in participants])
+        entry_conditions = contest.get('entry_conditions', {})
+        duration = entry_conditions.get('contest_duration', 10)
+        await run_spam_timer(bot, contest_id, duration, saved_deadline("spam_timer"))
+        print(f"      ✅ Восстановлен спам-конкурс")
+    
+    elif status == 'finishing' and contest_type == 'spam_contest':
+        # Итоги не успели опубликовать — повторить завершение сразу
+        from handlers.contests.spam_contest import run_spam_timer
+        await run_spam_timer(bot, contest_id, 0, saved_deadline("spam_timer") or time.time())
+        print(f"      ✅ Возобновлено завершение спам-конкурса")
+    
+    elif status == 'ready_to_start':
+        print(f"      ℹ️  Ожидает запуска админом")
+
+
 async def restore_active_contests(bot: Bot):
-    """Восстановить активные конкурсы после рестарта"""
-    from handlers.contests.voting_contest import active_tasks
+    """Восстановить активные конкурсы после рестарта или смены ведущего"""
     from database_postgres import db
     
     print("\n🔄 Восстановление активных конкурсов...")
     
     contests = await db.get_active_contests()
     
+    # Все сохранённые задачи — одним запросом
+    jobs = {job['job_key']: job for job in await db.get_contest_jobs()}
+    
     if not contests:
         print("   ℹ️  Нет активных конкурсов для восстановления")
         return
     
     for contest in contests:
-        contest_id = contest['id']
-        contest_type = contest['contest_type']
-        status = contest['status']
-        
-        print(f"   🔄 Конкурс #{contest_id} ({contest_type}, {status})")
+        print(f"   🔄 Конкурс #{contest['id']} ({contest['contest_type']}, {contest['status']})")
         
         try:
-            # Восстанавливаем задачи в зависимости от статуса
-            if status == 'collecting':
-                # Восстановить сбор участников
-                if contest_type == 'voting_contest':
-                    from handlers.contests.voting_contest import collect_comments
-                    task = asyncio.create_task(collect_comments(bot, contest_id))
-                    active_tasks[f"collect_{contest_id}"] = task
-                    print(f"      ✅ Восстановлен сбор (voting)")
-                    
-                elif contest_type == 'random_contest':
-                    from handlers.contests.random_contest import collect_random_participants
-                    task = asyncio.create_task(collect_random_participants(bot, contest_id))
-                    active_tasks[f"collect_{contest_id}"] = task
-                    print(f"      ✅ Восстановлен сбор (random)")
-                    
-                elif contest_type == 'spam_contest':
-                    from handlers.contests.spam_contest import collect_spam_participants
-                    task = asyncio.create_task(collect_spam_participants(bot, contest_id))
-                    active_tasks[f"collect_{contest_id}"] = task
-                    print(f"      ✅ Восстановлен сбор (spam)")
-            
-            elif status == 'voting':
-                # Восстановить таймер голосования
-                from handlers.contests.voting_contest import start_timer
-                task = asyncio.create_task(start_timer(bot, contest_id, contest['timer_minutes']))
-                active_tasks[f"timer_{contest_id}"] = task
-                print(f"      ✅ Восстановлен таймер голосования")
-            
-            elif status == 'running' and contest_type == 'spam_contest':
-                # Восстановить спам-конкурс
-                from handlers.contests.spam_contest import run_spam_timer
-                entry_conditions = contest.get('entry_conditions', {})
-                duration = entry_conditions.get('contest_duration', 10)
-                task = asyncio.create_task(run_spam_timer(bot, contest_id, duration))
-                active_tasks[f"spam_timer_{contest_id}"] = task
-                print(f"      ✅ Восстановлен спам-конкурс")
-            
-            elif status == 'ready_to_start':
-                print(f"      ℹ️  Ожидает запуска админом")
-                
+            await restore_contest(bot, contest, jobs)
         except Exception as e:
             print(f"      ❌ Ошибка восстановления: {e}")
     
     print(f"✅ Восстановлено конкурсов: {len(contests)}\n")
 
 
+async def start_leader_services(bot: Bot):
+    """Этот экземпляр стал ведущим: таймеры конкурсов и фоновые задачи-одиночки"""
+    from utils.scheduler import scheduler
+    from utils.rank_history import rank_history
+    from utils.referral_verifier import referral_verifier
+    
+    # ✅ ЕЖЕДНЕВНЫЕ СНИМКИ РЕЙТИНГОВ И УВЕДОМЛЕНИЯ О МЕСТАХ
+    rank_history.start()
+    
+    # ✅ ФОНОВАЯ ПЕРЕПРОВЕРКА ПОДПИСОК РЕФЕРАЛОВ
+    referral_verifier.start(bot)
+    
+    # ✅ ПЛАНИРОВЩИК ТАЙМЕРОВ КОНКУРСОВ (один цикл на все конкурсы)
+    scheduler.start()
+    
+    # ✅ ВОССТАНОВЛЕНИЕ АКТИВНЫХ КОНКУРСОВ
+    await restore_active_contests(bot)
+
+
+async def stop_leader_services():
+    """Лидерство потеряно: остановить всё, что теперь ведёт другой экземпляр"""
+    from utils.scheduler import scheduler
+    from utils.rank_history import rank_history
+    from utils.referral_verifier import referral_verifier
+    
+    await scheduler.stop()
+    await rank_history.stop()
+    await referral_verifier.stop()
+
+
+async def handle_cluster_event(bot: Bot, kind: str, args: list):
+    """
+    Событие от другого экземпляра бота
+    
+    - registry:<id> — конкурс изменился: перечитать его в реестр (все экземпляры)
+    - jobs:<id> — ведомый изменил задачи конкурса: перечитать их (ведущий)
+    - fire:<этап>:<id> — ведомый завершил набор: сработать задачей (ведущий)
+    
+    Данные в памяти каждого экземпляра (все экземпляры):
+    - stats:<user>:<категория>:<очки> — строка user_stats изменилась
+    - edge:<+|->:<реферер>:<реферал> — ребро графа рефералов
+    - member:<user>:<1|0|пусто> — статус подписки на канал
+    - reset_referrals — админ обнулил реферальную статистику
+    - winner:<тип конкурса>:<user> — выбран победитель (фильтр «последний победитель»)
+    """
+    from database_postgres import db
+    from utils.contest_registry import contest_registry, ACTIVE_STATUSES
+    from utils.leader_election import leader_election
+    from utils.leaderboard_service import leaderboard_service, GRAPH_CATEGORIES
+    from utils.rank_index import rank_index
+    from utils.referral_graph import referral_graph
+    from utils.scheduler import scheduler
+    from utils.spam_counter import spam_counter
+    from utils.subscriber_set import subscriber_set
+    from utils.subscription_cache import subscription_cache
+    
+    if kind == 'stats':
+        user_id, category, score = int(args[0]), args[1], int(args[2])
+        db.forget_stats(user_id)
+        rank_index.update(category, user_id, score)
+        leaderboard_service.mark_dirty(category)
+        return
+    
+    if kind == 'edge':
+        referrer_id, referred_id = int(args[1]), int(args[2])
+        if args[0] == '+':
+            referral_graph.add_edge(referrer_id, referred_id)
+        else:
+            referral_graph.remove_edge(referrer_id, referred_id)
+        return
+    
+    if kind == 'member':
+        user_id = int(args[0])
+        if args[1]:
+            is_member = args[1] == '1'
+            subscriber_set.mark(user_id, is_member)
+            subscription_cache.set(user_id, is_member)
+        else:
+            subscriber_set.forget(user_id)
+            subscription_cache.invalidate(user_id)
+        leaderboard_service.on_subscription_change(user_id)
+        return
+    
+    if kind == 'winner':
+        contest_registry.set_last_winner(args[0], int(args[1]))
+        return
+    
+    if kind == 'reset_referrals':
+        rank_index.reset('referrals')
+        referral_graph.reset()
+        db.invalidate_stats_cache()
+        leaderboard_service.mark_dirty('referrals')
+        for category in GRAPH_CATEGORIES:
+            await leaderboard_service.refresh(category)
+        return
+    
+    if kind == 'registry':
+        contest_id = int(args[0])
+        contest = await db.get_contest_by_id(contest_id)
+        if contest is None:
+            return
+        contest_registry.add(contest)
+        
+        # Сообщения спам-конкурса приходят на любой экземпляр — считаем везде
+        if contest['contest_type'] == 'spam_contest':
+            if contest['status'] == 'running' and not spam_counter.is_running(contest_id):
+                participants = await db.get_participants(contest_id)
+                spam_counter.start_contest(contest_id, [p['user_id'] for p in participants])
+            elif contest['status'] != 'running':
+                # Финальный сброс; ведущий ждёт подтверждения перед подсчётом победителя
+                flushed = await spam_counter.stop_contest(contest_id)
+                if flushed and contest['status'] == 'finishing':
+                    await db.ack_spam_flush(contest_id, leader_election.instance_id)
+        return
+    
+    if not leader_election.is_leader:
+        return
+    
+    if kind == 'jobs':
+        contest_id = int(args[0])
+        contest = await db.get_contest_by_id(contest_id)
+        jobs = {job['job_key']: job for job in await db.get_contest_jobs()}
+        scheduler.forget_missing(contest_id, jobs)
+        if contest and contest['status'] in ACTIVE_STATUSES:
+            await restore_contest(bot, contest, jobs)
+    
+    elif kind == 'fire':
+        stage, contest_id = args[0], int(args[1])
+        await scheduler.fire_now(stage, contest_id)
+
+
 async def shutdown(bot: Bot, db: DatabasePostgres, api_runner=None):
     """Корректное завершение работы бота и API"""
-    from handlers.contests.voting_contest import active_tasks
-    
     print("\n🛑 Завершение работы...")
     
     # Останавливаем API сервер
@@ -94,17 +255,44 @@ async def shutdown(bot: Bot, db: DatabasePostgres, api_runner=None):
         except Exception as e:
             print(f"   ⚠️ Ошибка остановки API: {e}")
     
-    # Отменяем все активные задачи конкурсов
-    if active_tasks:
-        print(f"   ⏳ Отмена {len(active_tasks)} активных задач...")
-        for task_name, task in list(active_tasks.items()):
-            task.cancel()
-            try:
-                await task
-            except asyncio.CancelledError:
-                pass
-        active_tasks.clear()
-        print("   ✅ Все задачи отменены")
+    # Останавливаем планировщик таймеров конкурсов
+    from utils.scheduler import scheduler
+    if scheduler.jobs:
+        print(f"   ⏳ Отмена {len(scheduler.jobs)} задач конкурсов...")
+    await scheduler.stop()
+    print("   ✅ Планировщик остановлен")
+    
+    # Останавливаем фоновое обновление лидербордов
+    from utils.leaderboard_service import leaderboard_service
+    await leaderboard_service.stop()
+    
+    # Останавливаем снимки рейтингов и рассылку уведомлений
+    from utils.rank_history import rank_history
+    from utils.notifier import paced_sender
+    await rank_history.stop()
+    await paced_sender.stop()
+    
+    # Останавливаем перепроверку рефералов (курсор сохранён в БД)
+    from utils.referral_verifier import referral_verifier
+    await referral_verifier.stop()
+    
+    # Отдаём лидерство: другой экземпляр подхватит конкурсы сразу
+    from utils.leader_election import leader_election
+    await leader_election.stop()
+    
+    # Сбрасываем накопленные счётчики спам-конкурсов
+    try:
+        from utils.spam_counter import spam_counter
+        await spam_counter.shutdown()
+    except Exception as e:
+        print(f"   ⚠️ Ошибка записи счётчиков спама: {e}")
+    
+    # Дописываем накопленные имена пользователей
+    try:
+        from utils.user_directory import user_directory
+        await user_directory.flush()
+    except Exception as e:
+        print(f"   ⚠️ Ошибка записи справочника пользователей: {e}")
     
     # Закрываем пул соединений БД
     try:
@@ -144,19 +332,64 @@ async def main():
         bot = Bot(token=config.BOT_TOKEN)
         dp = Dispatcher()
         
+        # Справочник имён пользователей пополняется из каждого обновления
+        from utils.user_directory import UserDirectoryMiddleware
+        dp.update.outer_middleware(UserDirectoryMiddleware())
+        
         # Подключение роутеров
         from handlers import router
         dp.include_router(router)
         print("✅ Роутеры подключены")
         
-        # ✅ ВОССТАНОВЛЕНИЕ АКТИВНЫХ КОНКУРСОВ
-        await restore_active_contests(bot)
+        # ✅ РЕЕСТР АКТИВНЫХ КОНКУРСОВ (горячий путь группы обсуждений)
+        from utils.contest_registry import contest_registry
+        await contest_registry.load(db)
+        
+        # ✅ ЛОКАЛЬНОЕ МНОЖЕСТВО ПОДПИСЧИКОВ КАНАЛА
+        from utils.subscriber_set import subscriber_set
+        await subscriber_set.load(db)
+        
+        # ✅ ИНДЕКС МЕСТ В РЕЙТИНГАХ
+        from utils.rank_index import rank_index
+        await rank_index.load(db)
+        
+        # ✅ ГРАФ РЕФЕРАЛОВ (2-й уровень, вся сеть)
+        from utils.referral_graph import referral_graph
+        await referral_graph.load(db)
+        
+        # ✅ ЛИДЕРБОРДЫ (готовятся в фоне, кнопки читают из памяти)
+        from utils.leaderboard_service import leaderboard_service
+        await leaderboard_service.start(bot)
+        
+        # ✅ СЧЁТЧИКИ ИДУЩИХ СПАМ-КОНКУРСОВ (сообщения считает каждый экземпляр)
+        from utils.spam_counter import spam_counter
+        for contest in contest_registry.get_active():
+            if contest['contest_type'] == 'spam_contest' and contest['status'] == 'running':
+                participants = await db.get_participants(contest['id'])
+                spam_counter.start_contest(contest['id'], [p['user_id'] for p in participants])
+        
+        # ✅ ОТПРАВКА УВЕДОМЛЕНИЙ (очередь наполняет ведущий)
+        from utils.notifier import paced_sender
+        paced_sender.start(bot)
+        
+        # ✅ ВЫБОР ВЕДУЩЕГО: таймеры конкурсов, снимки рейтингов и
+        # перепроверку рефералов ведёт один экземпляр, остальные ждут
+        from utils.leader_election import leader_election
+        await leader_election.start(
+            on_elected=partial(start_leader_services, bot),
+            on_lost=stop_leader_services,
+            on_event=partial(handle_cluster_event, bot)
+        )
         
         # 🆕 ЗАПУСК API СЕРВЕРА ДЛЯ TELEGRAM MINI APP
+        # (в режиме webhook он же принимает обновления Telegram)
         try:
             from api_server import start_api_server
             print("📡 Запуск API сервера для Mini App...")
-            api_runner = await start_api_server()
+            if config.WEBHOOK_URL:
+                api_runner = await start_api_server(dp, bot)
+            else:
+                api_runner = await start_api_server()
             print("✅ API сервер запущен на порту 8000")
         except Exception as e:
             logger.error(f"❌ Ошибка запуска API сервера: {e}")
@@ -166,7 +399,18 @@ async def main():
         
         # Запуск бота
         print("🚀 Бот запущен и готов к работе!\n")
-        await dp.start_polling(bot)
+        # allowed_updates нужны явно: chat_member не приходит по умолчанию
+        if config.WEBHOOK_URL:
+            # Несколько экземпляров за балансировщиком делят обновления
+            await bot.set_webhook(
+                config.WEBHOOK_URL,
+                allowed_updates=dp.resolve_used_update_types(),
+                secret_token=config.WEBHOOK_SECRET
+            )
+            print(f"🌐 Обновления приходят на webhook {config.WEBHOOK_URL}")
+            await asyncio.Event().wait()
+        else:
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
         
     except (KeyboardInterrupt, SystemExit):
         print("\n⚠️  Получен сигнал остановки...")
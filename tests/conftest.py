@@ -0,0 +1,78 @@
+"""
+Общие настройки тестов
+Тестируются структуры в памяти; БД подменяется заглушкой database_postgres.db
+"""
+
+import os
+import sys
+import types
+
+import pytest
+
+# config.py требует обязательные переменные окружения
+os.environ.setdefault("BOT_TOKEN", "1:test")
+os.environ.setdefault("ADMIN_ID", "1")
+os.environ.setdefault("CHANNEL_ID", "-100")
+os.environ.setdefault("DISCUSSION_GROUP_ID", "-200")
+os.environ.setdefault("DATABASE_URL", "postgresql://test@localhost/test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeDB:
+    """
+    Заглушка DatabasePostgres: записывает вызовы, которые делают
+    структуры в памяти, и возвращает заданные ответы
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.job_status = {}
+
+    def _record(self, name, *args):
+        self.calls.append((name, *args))
+
+    def called(self, name):
+        return [call[1:] for call in self.calls if call[0] == name]
+
+    async def save_contest_job(self, job_key, contest_id, stage, deadline, tick_interval):
+        self._record("save_contest_job", job_key, deadline)
+        return self.job_status.get(job_key, ('scheduled', 0))
+
+    async def delete_contest_job(self, job_key):
+        self._record("delete_contest_job", job_key)
+
+    async def delete_contest_jobs(self, contest_id):
+        self._record("delete_contest_jobs", contest_id)
+
+    async def retry_contest_job(self, job_key, attempts, error, deadline):
+        self._record("retry_contest_job", job_key, attempts)
+
+    async def fail_contest_job(self, job_key, attempts, error):
+        self._record("fail_contest_job", job_key, attempts)
+
+    async def notify_cluster(self, kind, *args):
+        self._record("notify_cluster", kind, *args)
+
+    async def notify_cluster_batch(self, payloads):
+        self._record("notify_cluster_batch", list(payloads))
+
+    async def set_channel_subscriber(self, user_id, is_member):
+        self._record("set_channel_subscriber", user_id, is_member)
+
+    async def delete_channel_subscriber(self, user_id):
+        self._record("delete_channel_subscriber", user_id)
+
+    async def unlock_achievements(self, user_id, candidates):
+        self._record("unlock_achievements", user_id, list(candidates))
+        return list(candidates)
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """Подменить модуль database_postgres (ленивые импорты внутри utils)"""
+    db = FakeDB()
+    module = types.ModuleType("database_postgres")
+    module.db = db
+    monkeypatch.setitem(sys.modules, "database_postgres", module)
+    return db
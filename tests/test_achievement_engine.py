@@ -0,0 +1,55 @@
+"""
+Движок достижений: пороги по метрикам и разблокировка одним запросом
+"""
+
+import asyncio
+
+from utils.achievement_engine import AchievementEngine
+
+
+DEFINITIONS = {
+    "wins": {
+        "gold": {"required": 10, "emoji": "🥇", "name": "Золото"},
+        "bronze": {"required": 1, "emoji": "🥉", "name": "Бронза"},
+        "silver": {"required": 5, "emoji": "🥈", "name": "Серебро"},
+    },
+    "referrals": {
+        "first": {"required": 1, "emoji": "🔗", "name": "Первый реферал"},
+    },
+}
+
+
+def test_reached_returns_thresholds_in_range():
+    engine = AchievementEngine(DEFINITIONS)
+
+    assert engine.reached("total_wins", 5, 4) == [("wins", "silver")]
+    assert engine.reached("total_wins", 5, 5) == []
+    assert engine.reached("total_wins", 4, 1) == []
+    assert engine.reached("total_wins", 12, 0) == [("wins", "bronze"), ("wins", "silver"), ("wins", "gold")]
+
+
+def test_reached_without_previous_returns_every_threshold_up_to_value():
+    engine = AchievementEngine(DEFINITIONS)
+
+    assert engine.reached("total_wins", 7) == [("wins", "bronze"), ("wins", "silver")]
+    assert engine.reached("total_wins", 0) == []
+    assert engine.reached("total_contests", 100) == []
+
+
+def test_apply_unlocks_levels_crossed_in_a_jump(fake_db):
+    """Счётчик перескочил несколько порогов — все они отправляются на разблокировку"""
+    engine = AchievementEngine(DEFINITIONS)
+
+    unlocked = asyncio.run(engine.apply(42, {"total_wins": 10, "referral_count": 3}))
+
+    assert fake_db.called("unlock_achievements") == [
+        (42, [("wins", "bronze"), ("wins", "silver"), ("wins", "gold"), ("referrals", "first")])
+    ]
+    assert [a["name"] for a in unlocked] == ["Бронза", "Серебро", "Золото", "Первый реферал"]
+
+
+def test_apply_without_candidates_skips_db(fake_db):
+    engine = AchievementEngine(DEFINITIONS)
+
+    assert asyncio.run(engine.apply(42, {"total_wins": 0})) == []
+    assert fake_db.called("unlock_achievements") == []
@@ -0,0 +1,68 @@
+"""
+Пул эмодзи конкурса: уникальная выдача, повторы при нехватке, возврат
+"""
+
+import config
+from utils.emoji_pool import EmojiPool
+
+
+def assert_consistent(pool):
+    """Индекс указывает на позиции в списке свободных"""
+    assert len(pool.index) == len(pool.free)
+    for emoji, i in pool.index.items():
+        assert pool.free[i] == emoji
+
+
+def test_allocates_every_emoji_once():
+    pool = EmojiPool()
+    allocated = [pool.allocate() for _ in config.PARTICIPANT_EMOJIS]
+
+    assert sorted(allocated) == sorted(config.PARTICIPANT_EMOJIS)
+    assert pool.free == []
+    assert not pool.duplicates
+
+
+def test_used_emojis_are_not_free():
+    used = config.PARTICIPANT_EMOJIS[:3]
+    pool = EmojiPool(used)
+
+    assert not set(used) & set(pool.free)
+    assert_consistent(pool)
+
+
+def test_duplicate_release_does_not_free_emoji():
+    """Повтор при нехватке возвращается в счётчик повторов, а не в свободные"""
+    pool = EmojiPool(config.PARTICIPANT_EMOJIS)
+    emoji = pool.allocate()
+
+    assert pool.duplicates[emoji] == 1
+    pool.release(emoji)
+    assert emoji not in pool.index
+    assert not pool.duplicates
+
+
+def test_release_and_take_keep_index_consistent():
+    pool = EmojiPool()
+    taken = [pool.allocate() for _ in range(5)]
+    for emoji in taken[::2]:
+        pool.release(emoji)
+    assert_consistent(pool)
+
+    pool.take(taken[0])
+    assert taken[0] not in pool.index
+    assert_consistent(pool)
+
+    # Уже занятый эмодзи, выданный в обход пула, считается повтором
+    pool.take(taken[1])
+    assert pool.duplicates[taken[1]] == 1
+    pool.release(taken[1])
+    assert taken[1] not in pool.index
+
+
+def test_release_ignores_unknown_and_free_emojis():
+    pool = EmojiPool()
+    free = list(pool.free)
+
+    pool.release("not-an-emoji")
+    pool.release(free[0])
+    assert pool.free == free
@@ -0,0 +1,82 @@
+"""
+Индекс мест в рейтингах: дерево Фенвика по счёту + отсортированные корзины
+Сверяется с полным пересчётом
+"""
+
+import random
+
+from utils.rank_index import RankIndex, ScoreRanking
+
+
+def brute_ranking(scores):
+    """Полный пересчёт: по убыванию счёта, при равенстве — по user_id"""
+    return sorted(((score, user) for user, score in scores.items() if score > 0),
+                  key=lambda item: (-item[0], item[1]))
+
+
+def assert_matches(ranking, scores):
+    expected = brute_ranking(scores)
+    assert ranking.total == len(expected)
+    for place, (score, user) in enumerate(expected, 1):
+        assert ranking.rank(user) == place
+        assert ranking.at(place) == (user, score)
+
+
+def test_random_updates_match_full_recount():
+    rng = random.Random(42)
+    ranking = ScoreRanking(size=4)
+    scores = {}
+
+    for _ in range(2000):
+        user = rng.randrange(60)
+        score = rng.choice([0, rng.randrange(1, 10), rng.randrange(1, 500)])
+        ranking.set_score(user, score)
+        scores[user] = score
+
+    assert_matches(ranking, scores)
+
+
+def test_growth_keeps_existing_scores():
+    """Счёт больше размера дерева расширяет его без потери корзин"""
+    ranking = ScoreRanking(size=4)
+    ranking.set_score(1, 3)
+    ranking.set_score(2, 1000)
+    ranking.set_score(3, 3)
+
+    assert ranking.size >= 1000
+    assert_matches(ranking, {1: 3, 2: 1000, 3: 3})
+
+
+def test_zero_score_leaves_ranking():
+    ranking = ScoreRanking()
+    ranking.set_score(5, 2)
+    ranking.set_score(5, 0)
+
+    assert ranking.rank(5) == 0
+    assert ranking.total == 0
+    assert ranking.at(1) is None
+
+
+def test_around_returns_neighbours():
+    ranking = ScoreRanking()
+    for user, score in {1: 50, 2: 40, 3: 30, 4: 20, 5: 10}.items():
+        ranking.set_score(user, score)
+
+    assert ranking.around(3, 1) == [(2, 2, 40), (3, 3, 30), (4, 4, 20)]
+    assert ranking.around(1, 2) == [(1, 1, 50), (2, 2, 40), (3, 3, 30)]
+    assert ranking.around(99, 2) == []
+
+
+def test_rank_index_categories():
+    index = RankIndex()
+    index.update('wins', 10, 3)
+    index.update('wins', 11, 5)
+    index.update('referrals', 10, 1)
+
+    assert index.get_position(10, 'wins') == (2, 2)
+    assert index.get_position(11, 'wins') == (1, 2)
+    assert index.get_score(10, 'referrals') == 1
+
+    index.reset('wins')
+    assert index.get_position(11, 'wins') == (0, 0)
+    assert index.get_position(10, 'referrals') == (1, 1)
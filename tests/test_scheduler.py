@@ -0,0 +1,168 @@
+"""
+Планировщик таймеров: сетка тиков, дедлайны, повторы и fire_now
+"""
+
+import asyncio
+import time
+
+from utils.scheduler import ContestScheduler, TimerJob, job_key
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def started(max_attempts=3, retry_delay=0.01):
+    scheduler = ContestScheduler(max_attempts=max_attempts, retry_delay=retry_delay)
+    scheduler.start()
+    return scheduler
+
+
+def test_next_tick_follows_grid():
+    """Следующий тик — ближайшая точка anchor + n * interval строго позже now"""
+    job = TimerJob("timer", 1, None, None, 10, None)
+    job.anchor = 100.0
+
+    assert ContestScheduler._next_tick(job, 100.0) == 110.0
+    assert ContestScheduler._next_tick(job, 105.0) == 110.0
+    assert ContestScheduler._next_tick(job, 110.0) == 120.0
+    assert ContestScheduler._next_tick(job, 95.0) == 100.0
+
+
+def test_ticks_are_anchored_to_deadline(fake_db):
+    """Сетка тиков отсчитывается от дедлайна: последний тик ровно за interval до него"""
+    async def scenario():
+        scheduler = await started()
+        deadline = time.time() + 1000.5
+        await scheduler.schedule("timer", 1, deadline=deadline, on_deadline=None,
+                                 interval=60, on_tick=None)
+        job = scheduler.get_job(job_key("timer", 1))
+        await scheduler.stop()
+        return job, deadline
+
+    job, deadline = run(scenario())
+    steps = (deadline - job.next_tick) / 60
+    assert job.next_tick < deadline
+    assert abs(steps - round(steps)) < 1e-6
+
+
+def test_deadline_fires_once_and_deletes_row(fake_db):
+    async def scenario():
+        scheduler = await started()
+        fired = []
+
+        async def on_deadline():
+            fired.append(time.time())
+
+        await scheduler.schedule("collect", 7, deadline=time.time() + 0.02, on_deadline=on_deadline)
+        await asyncio.sleep(0.15)
+        await scheduler.stop()
+        return scheduler, fired
+
+    scheduler, fired = run(scenario())
+    assert len(fired) == 1
+    assert scheduler.get_jobs() == []
+    assert fake_db.called("delete_contest_job") == [("collect_7",)]
+
+
+def test_failed_deadline_is_retried(fake_db):
+    """Упавший дедлайн повторяется, успешный повтор удаляет задачу"""
+    async def scenario():
+        scheduler = await started(retry_delay=0.01)
+        calls = []
+
+        async def on_deadline():
+            calls.append(1)
+            if len(calls) == 1:
+                raise RuntimeError("boom")
+
+        await scheduler.schedule("timer", 3, deadline=time.time(), on_deadline=on_deadline)
+        await asyncio.sleep(0.2)
+        await scheduler.stop()
+        return calls
+
+    calls = run(scenario())
+    assert len(calls) == 2
+    assert fake_db.called("retry_contest_job") == [("timer_3", 1)]
+    assert fake_db.called("delete_contest_job") == [("timer_3",)]
+    assert fake_db.called("fail_contest_job") == []
+
+
+def test_job_fails_after_max_attempts(fake_db):
+    async def scenario():
+        scheduler = await started(max_attempts=2, retry_delay=0.01)
+        calls = []
+
+        async def on_deadline():
+            calls.append(1)
+            raise RuntimeError("boom")
+
+        await scheduler.schedule("timer", 4, deadline=time.time(), on_deadline=on_deadline)
+        await asyncio.sleep(0.2)
+        await scheduler.stop()
+        return calls
+
+    calls = run(scenario())
+    assert len(calls) == 2
+    assert fake_db.called("fail_contest_job") == [("timer_4", 2)]
+    assert fake_db.called("delete_contest_job") == []
+
+
+def test_failed_job_is_not_restored(fake_db):
+    """Задача, исчерпавшая попытки до рестарта, не запускается снова"""
+    fake_db.job_status["timer_5"] = ('failed', 3)
+
+    async def scenario():
+        scheduler = await started()
+        await scheduler.schedule("timer", 5, deadline=time.time(), on_deadline=None)
+        jobs = scheduler.get_jobs()
+        await scheduler.stop()
+        return jobs
+
+    assert run(scenario()) == []
+
+
+def test_fire_now_during_schedule_is_not_lost(fake_db):
+    """fire_now, пришедший пока задача записывается в БД, срабатывает после записи"""
+    async def scenario():
+        scheduler = await started()
+        release = asyncio.Event()
+        original = fake_db.save_contest_job
+
+        async def slow_save(*args):
+            await release.wait()
+            return await original(*args)
+
+        fake_db.save_contest_job = slow_save
+        fired = []
+
+        async def on_deadline():
+            fired.append(1)
+
+        task = asyncio.create_task(scheduler.schedule("collect", 9, on_deadline=on_deadline))
+        await asyncio.sleep(0)
+        assert await scheduler.fire_now("collect", 9)
+        release.set()
+        await task
+        await asyncio.sleep(0.05)
+        await scheduler.stop()
+        return fired
+
+    assert run(scenario()) == [1]
+
+
+def test_cancelled_job_does_not_fire(fake_db):
+    async def scenario():
+        scheduler = await started()
+        fired = []
+
+        async def on_deadline():
+            fired.append(1)
+
+        await scheduler.schedule("timer", 6, deadline=time.time() + 0.05, on_deadline=on_deadline)
+        assert await scheduler.cancel("timer", 6)
+        await asyncio.sleep(0.1)
+        await scheduler.stop()
+        return fired
+
+    assert run(scenario()) == []
@@ -0,0 +1,66 @@
+"""
+Локальное множество подписчиков: отсортированные массивы, запись в БД и события
+"""
+
+import asyncio
+import random
+
+from utils.subscriber_set import SubscriberSet
+
+
+def test_mark_lookup_and_forget():
+    subscribers = SubscriberSet()
+
+    assert subscribers.lookup(1) is None
+    assert subscribers.mark(1, True)
+    assert not subscribers.mark(1, True)
+    assert subscribers.lookup(1) is True
+
+    assert subscribers.mark(1, False)
+    assert subscribers.lookup(1) is False
+    assert 1 not in subscribers.members
+
+    subscribers.forget(1)
+    assert subscribers.lookup(1) is None
+
+
+def test_arrays_stay_sorted_and_disjoint():
+    rng = random.Random(7)
+    subscribers = SubscriberSet()
+    expected = {}
+
+    for _ in range(1000):
+        user = rng.randrange(200)
+        if rng.random() < 0.1:
+            subscribers.forget(user)
+            expected.pop(user, None)
+        else:
+            is_member = rng.random() < 0.5
+            subscribers.mark(user, is_member)
+            expected[user] = is_member
+
+    assert list(subscribers.members) == sorted(u for u, m in expected.items() if m)
+    assert list(subscribers.non_members) == sorted(u for u, m in expected.items() if not m)
+    for user in range(200):
+        assert subscribers.lookup(user) is expected.get(user)
+
+
+def test_record_later_persists_and_notifies(fake_db):
+    async def scenario():
+        subscribers = SubscriberSet()
+        subscribers.record_later(5, True)
+        # Повтор того же статуса ничего не пишет
+        subscribers.record_later(5, True)
+        subscribers.forget_later(6)
+        await asyncio.sleep(0.3)
+        return subscribers
+
+    subscribers = asyncio.run(scenario())
+    assert subscribers.lookup(5) is True
+    assert fake_db.called("set_channel_subscriber") == [(5, True)]
+    assert fake_db.called("delete_channel_subscriber") == [(6,)]
+
+    payloads = [p for (batch,) in fake_db.called("notify_cluster_batch") for p in batch]
+    assert [p.split(":")[0] for p in payloads] == ["member", "member"]
+    assert payloads[0].endswith(":5:1")
+    assert payloads[1].endswith(":6:")
@@ -0,0 +1,115 @@
+"""
+Каталог достижений
+Собирается один раз из config.ACHIEVEMENTS и используется
+экраном достижений в боте и API Mini App
+"""
+
+from typing import Dict, List
+
+import config
+
+
+# Разделы каталога: (тип, заголовок в боте, метрика, шаблон описания)
+ACHIEVEMENT_SECTIONS = [
+    ("participation", "🎯 **Участие в конкурсах:**", "total_contests", "Участвуй в {n} конкурсах"),
+    ("wins", "🏆 **Победы:**", "total_wins", "Выиграй {n} конкурсов"),
+    ("referrals", "👥 **Рефералы:**", "referral_count", "Пригласи {n} друзей"),
+    ("special", "🔥 **Особые достижения:**", "best_win_streak", "Выиграй {n} {times} подряд"),
+]
+
+
+def _times(n: int) -> str:
+    """Склонение слова «раз» для числа"""
+    if n % 10 in (2, 3, 4) and n % 100 not in (12, 13, 14):
+        return "раза"
+    return "раз"
+
+
+class AchievementCatalog:
+    """
+    Предварительно собранный список достижений
+
+    Статичная часть (названия, пороги, описания, заголовки разделов)
+    готовится при импорте; на запрос подставляется только прогресс пользователя.
+    """
+
+    def __init__(self, definitions: Dict):
+        self.sections: List[Dict] = []
+
+        for achievement_type, title, metric, description in ACHIEVEMENT_SECTIONS:
+            levels = sorted(
+                definitions.get(achievement_type, {}).items(),
+                key=lambda item: item[1]["required"]
+            )
+            self.sections.append({
+                "title": title,
+                "metric": metric,
+                "items": [
+                    {
+                        "id": level,
+                        "key": (achievement_type, level),
+                        "name": info["name"],
+                        "emoji": info["emoji"],
+                        "target": info["required"],
+                        "description": description.format(
+                            n=info["required"], times=_times(info["required"])
+                        ),
+                        "done_line": f"   ✅ {info['name']} ({info['required']})\n",
+                    }
+                    for level, info in levels
+                ],
+            })
+
+    @staticmethod
+    def _earned(item: Dict, value: int, unlocked: set) -> bool:
+        return item["key"] in unlocked or value >= item["target"]
+
+    def render_text(self, progress: Dict) -> str:
+        """
+        Текст экрана достижений в боте
+
+        Args:
+            progress: Результат db.get_achievement_progress
+        """
+        unlocked = progress["unlocked"]
+        parts = ["🏆 **ВАШИ ДОСТИЖЕНИЯ**\n"]
+
+        for section in self.sections:
+            value = progress[section["metric"]]
+            parts.append(f"\n{section['title']}\n")
+            for item in section["items"]:
+                if self._earned(item, value, unlocked):
+                    parts.append(item["done_line"])
+                else:
+                    parts.append(f"   🔒 {item['name']} ({value}/{item['target']})\n")
+
+        return "".join(parts)
+
+    def to_api(self, progress: Dict) -> List[Dict]:
+        """
+        Список достижений для /api/achievements
+
+        Args:
+            progress: Результат db.get_achievement_progress
+        """
+        unlocked = progress["unlocked"]
+        result = []
+
+        for section in self.sections:
+            value = progress[section["metric"]]
+            for item in section["items"]:
+                result.append({
+                    "id": item["id"],
+                    "name": f"{item['emoji']} {item['name']}",
+                    "emoji": item["emoji"],
+                    "description": item["description"],
+                    "target": item["target"],
+                    "progress": min(value, item["target"]),
+                    "earned": self._earned(item, value, unlocked),
+                })
+
+        return result
+
+
+# Глобальный экземпляр
+achievement_catalog = AchievementCatalog(config.ACHIEVEMENTS)
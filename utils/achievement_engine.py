@@ -0,0 +1,97 @@
+"""
+Декларативный движок достижений
+Пороги берутся из config.ACHIEVEMENTS и индексируются по метрикам
+"""
+
+from bisect import bisect_right
+from typing import Dict, List, Optional, Tuple
+
+import config
+
+
+# Какая метрика пользователя отвечает за категорию достижений
+ACHIEVEMENT_METRICS = {
+    "participation": "total_contests",
+    "wins": "total_wins",
+    "referrals": "referral_count",
+}
+
+
+class AchievementEngine:
+    """
+    Индекс порогов достижений по метрикам
+
+    Для каждой метрики хранится отсортированный список порогов,
+    поэтому новые уровни при изменении счётчика находятся бинарным поиском.
+    """
+
+    def __init__(self, definitions: Dict):
+        self.definitions = definitions
+        # metric -> (пороги по возрастанию, [(тип, уровень), ...] в том же порядке)
+        self.index: Dict[str, Tuple[List[int], List[Tuple[str, str]]]] = {}
+
+        for achievement_type, metric in ACHIEVEMENT_METRICS.items():
+            levels = sorted(
+                definitions.get(achievement_type, {}).items(),
+                key=lambda item: item[1]["required"]
+            )
+            self.index[metric] = (
+                [info["required"] for _, info in levels],
+                [(achievement_type, level) for level, _ in levels]
+            )
+
+    def reached(self, metric: str, new_value: int,
+                old_value: Optional[int] = None) -> List[Tuple[str, str]]:
+        """
+        Уровни, достигнутые при изменении метрики
+
+        Args:
+            metric: Метрика ('total_contests', 'total_wins', 'referral_count')
+            new_value: Новое значение
+            old_value: Прежнее значение (None — все уровни до new_value)
+
+        Returns:
+            [(тип_достижения, уровень), ...] с порогами в (old_value, new_value]
+        """
+        thresholds, levels = self.index.get(metric, ([], []))
+        hi = bisect_right(thresholds, new_value)
+        lo = bisect_right(thresholds, old_value) if old_value is not None else 0
+        return levels[lo:hi] if lo < hi else []
+
+    def describe(self, achievement_type: str, level: str) -> Dict:
+        """Эмодзи и название достижения"""
+        info = self.definitions[achievement_type][level]
+        return {
+            "type": achievement_type,
+            "level": level,
+            "emoji": info["emoji"],
+            "name": info["name"],
+        }
+
+    async def apply(self, user_id: int, metrics: Dict[str, int],
+                    previous: Optional[Dict[str, int]] = None) -> List[Dict]:
+        """
+        Разблокировать достигнутые уровни одним запросом
+
+        Args:
+            metrics: Новые значения метрик {'total_contests': 5, ...}
+            previous: Прежние значения (если известны — проверяются только новые пороги)
+
+        Returns:
+            Список впервые разблокированных достижений
+        """
+        candidates = []
+        for metric, value in metrics.items():
+            old_value = previous.get(metric) if previous else None
+            candidates.extend(self.reached(metric, value, old_value))
+
+        if not candidates:
+            return []
+
+        from database_postgres import db
+        unlocked = await db.unlock_achievements(user_id, candidates)
+        return [self.describe(achievement_type, level) for achievement_type, level in unlocked]
+
+
+# Глобальный экземпляр
+achievement_engine = AchievementEngine(config.ACHIEVEMENTS)
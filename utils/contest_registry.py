@@ -0,0 +1,108 @@
+"""
+Реестр активных конкурсов в памяти процесса
+Горячий путь группы обсуждений читает конкурсы отсюда, а не из БД
+"""
+
+from typing import Dict, List, Optional
+
+
+# Статусы, при которых конкурс считается активным
+ACTIVE_STATUSES = ('collecting', 'voting', 'running', 'finishing', 'ready_to_start')
+
+# Допустимые переходы статусов: текущий -> возможные следующие
+# (voting — голосование или розыгрыш, running — идёт спам-конкурс,
+# finishing — спам-конкурс остановлен, итоги ещё не опубликованы)
+CONTEST_TRANSITIONS = {
+    'ready_to_start': ('collecting', 'ended'),
+    'collecting': ('voting', 'running', 'ended'),
+    'voting': ('ended',),
+    'running': ('finishing', 'ended'),
+    'finishing': ('ended',),
+}
+
+
+class ContestRegistry:
+    """
+    Реестр активных конкурсов (тип, статус, условия, вместимость)
+    и последних победителей по типам конкурсов
+    """
+
+    def __init__(self):
+        self.contests: Dict[int, Dict] = {}
+        self.last_winners: Dict[str, int] = {}
+        self._ordered: List[Dict] = []
+
+    async def load(self, db):
+        """Загрузить активные конкурсы и последних победителей из БД (при старте)"""
+        contests = await db.get_active_contests()
+        self.contests = {contest['id']: contest for contest in contests}
+        self._rebuild()
+
+        for contest_type in ('voting_contest', 'random_contest', 'spam_contest'):
+            winners = await db.get_last_winners_by_type(contest_type, limit=1)
+            if winners:
+                self.last_winners[contest_type] = winners[0]
+
+        print(f"✅ Реестр конкурсов загружен: {len(self.contests)} активных")
+
+    def _rebuild(self):
+        """Пересобрать упорядоченный список (новые конкурсы первыми, как в БД)"""
+        self._ordered = sorted(
+            self.contests.values(),
+            key=lambda c: (c.get('created_at') is not None, c.get('created_at')),
+            reverse=True
+        )
+
+    def get_active(self) -> List[Dict]:
+        """Все активные конкурсы без обращения к БД"""
+        return self._ordered
+
+    def get(self, contest_id: int) -> Optional[Dict]:
+        """Активный конкурс по ID"""
+        return self.contests.get(contest_id)
+
+    def add(self, contest: Dict):
+        """Добавить (или заменить) конкурс после создания"""
+        if contest.get('status') in ACTIVE_STATUSES:
+            self.contests[contest['id']] = contest
+        else:
+            self._remove(contest['id'])
+        self._rebuild()
+
+    def set_status(self, contest_id: int, status: str):
+        """Обновить статус; неактивные конкурсы удаляются из реестра"""
+        contest = self.contests.get(contest_id)
+        if not contest:
+            return
+
+        if status in ACTIVE_STATUSES:
+            # Заменяем словарь целиком, чтобы не менять объект под итерирующим кодом
+            self.contests[contest_id] = {**contest, 'status': status}
+        else:
+            self._remove(contest_id)
+        self._rebuild()
+
+    def _remove(self, contest_id: int):
+        """Убрать завершённый конкурс вместе с его конвейером проверок"""
+        self.contests.pop(contest_id, None)
+        from utils.filters import ParticipantFilter
+        ParticipantFilter.forget(contest_id)
+
+    def set_announcement(self, contest_id: int, message_id: int):
+        """Обновить ID сообщения анонса"""
+        contest = self.contests.get(contest_id)
+        if contest:
+            self.contests[contest_id] = {**contest, 'announcement_message_id': message_id}
+            self._rebuild()
+
+    def set_last_winner(self, contest_type: str, user_id: int):
+        """Запомнить последнего победителя данного типа конкурса"""
+        self.last_winners[contest_type] = user_id
+
+    def get_last_winner(self, contest_type: str) -> Optional[int]:
+        """Последний победитель данного типа конкурса"""
+        return self.last_winners.get(contest_type)
+
+
+# Глобальный экземпляр
+contest_registry = ContestRegistry()
@@ -0,0 +1,92 @@
+"""
+Пулы свободных эмодзи участников по конкурсам
+Выдача случайного свободного эмодзи за O(1)
+"""
+
+import random
+from collections import Counter
+from typing import Dict, List
+
+import config
+
+
+class EmojiPool:
+    """
+    Свободные эмодзи одного конкурса
+
+    Список свободных + индекс позиции каждого эмодзи в списке:
+    выдача случайного — обмен с последним и pop, возврат — append.
+    Когда свободных нет, выдаётся повтор из набора; такие повторы
+    считаются отдельно и в список свободных не возвращаются.
+    """
+
+    def __init__(self, used_emojis=()):
+        used = set(used_emojis)
+        self.free: List[str] = [e for e in config.PARTICIPANT_EMOJIS if e not in used]
+        self.index: Dict[str, int] = {e: i for i, e in enumerate(self.free)}
+        self.duplicates: Counter = Counter()
+
+    def allocate(self) -> str:
+        """Случайный свободный эмодзи (если свободных нет — любой из набора)"""
+        if not self.free:
+            emoji = random.choice(config.PARTICIPANT_EMOJIS)
+            self.duplicates[emoji] += 1
+            return emoji
+
+        i = random.randrange(len(self.free))
+        emoji = self.free[i]
+        last = self.free.pop()
+        if last != emoji:
+            self.free[i] = last
+            self.index[last] = i
+        del self.index[emoji]
+        return emoji
+
+    def take(self, emoji: str):
+        """Убрать эмодзи из свободных (его выдали в обход пула)"""
+        i = self.index.pop(emoji, None)
+        if i is None:
+            self.duplicates[emoji] += 1
+            return
+        last = self.free.pop()
+        if last != emoji:
+            self.free[i] = last
+            self.index[last] = i
+
+    def release(self, emoji: str):
+        """Вернуть эмодзи в пул (заявка отклонена)"""
+        if self.duplicates[emoji]:
+            # Повтор: тот же эмодзи всё ещё у другого участника
+            self.duplicates[emoji] -= 1
+            if not self.duplicates[emoji]:
+                del self.duplicates[emoji]
+            return
+        if emoji in self.index or emoji not in config.PARTICIPANT_EMOJIS:
+            return
+        self.index[emoji] = len(self.free)
+        self.free.append(emoji)
+
+
+class EmojiAllocator:
+    """Пулы эмодзи всех конкурсов, собираются из БД при первом обращении"""
+
+    def __init__(self):
+        self.pools: Dict[int, EmojiPool] = {}
+
+    async def get_pool(self, contest_id: int) -> EmojiPool:
+        """Пул конкурса; после рестарта восстанавливается по participants.comment_text"""
+        pool = self.pools.get(contest_id)
+        if pool is None:
+            from database_postgres import db
+            participants = await db.get_participants(contest_id)
+            pool = EmojiPool(p['comment_text'] for p in participants)
+            self.pools[contest_id] = pool
+        return pool
+
+    def drop(self, contest_id: int):
+        """Забыть пул (регистрация завершена или писатель простаивает)"""
+        self.pools.pop(contest_id, None)
+
+
+# Глобальный экземпляр
+emoji_allocator = EmojiAllocator()
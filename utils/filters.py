@@ -1,10 +1,119 @@
 """
 Гибкая система фильтрации участников конкурсов
 Поддержка множественных условий участия + диапазон участий (min/max)
+Условия компилируются в конвейер проверок: память → один SQL-снимок → Telegram API
 """
 
 from database_postgres import db
-from typing import Dict, Any
+from typing import Dict, Any, Callable, List, Optional, Tuple
+from utils.contest_registry import contest_registry
+from utils.referral_graph import referral_graph
+from utils.subscriber_set import subscriber_set
+from utils.subscription_cache import subscription_cache
+
+
+class UserFacts:
+    """
+    Факты о пользователе для проверки условий участия
+
+    Загружаются лениво и не более одного раза: если сообщение подходит
+    под несколько активных конкурсов, факты переиспользуются для всех.
+    """
+
+    def __init__(self, bot, user_id: int):
+        self.bot = bot
+        self.user_id = user_id
+        self._snapshot: Optional[Dict] = None
+        self._subscribed: Optional[bool] = None
+
+    async def snapshot(self) -> Dict:
+        """Статистика и число рефералов — одним запросом к БД"""
+        if self._snapshot is None:
+            self._snapshot = await db.get_user_facts(self.user_id)
+        return self._snapshot
+
+    def known_subscription(self) -> Optional[bool]:
+        """Статус подписки, если он известен без обращения к API"""
+        if self._subscribed is None:
+            self._subscribed = subscriber_set.lookup(self.user_id)
+        return self._subscribed
+
+    async def subscribed(self) -> bool:
+        """Статус подписки (при необходимости — через Telegram API)"""
+        if self.known_subscription() is None:
+            self._subscribed = await subscription_cache.is_subscribed(self.bot, self.user_id)
+        return self._subscribed
+
+
+# Результат проверки: None — условие выполнено, иначе (тип_ошибки, требуемое, текущее)
+Rejection = Optional[Tuple[str, int, int]]
+
+
+class EligibilityPipeline:
+    """
+    Скомпилированные условия участия одного конкурса
+
+    Проверки упорядочены по стоимости:
+      1. в памяти (последний победитель, известный статус подписки,
+         рефералы 2-го уровня из графа рефералов)
+      2. один SQL-снимок фактов пользователя (участия, рефералы)
+      3. Telegram API (подписка неизвестного пользователя)
+    """
+
+    def __init__(self, contest_type: Optional[str], conditions: Dict[str, Any], check_subscription: bool = True):
+        self.contest_type = contest_type
+        self.check_subscription = check_subscription
+        self.snapshot_checks: List[Callable[[Dict], Rejection]] = []
+        self.min_second_level = conditions.get('min_second_level_referrals')
+
+        if 'min_referrals' in conditions:
+            min_refs = conditions['min_referrals']
+            self.snapshot_checks.append(
+                lambda f, n=min_refs: None if f['referral_count'] >= n
+                else ("min_referrals", n, f['referral_count'])
+            )
+
+        if 'min_contests' in conditions:
+            min_contests = conditions['min_contests']
+            self.snapshot_checks.append(
+                lambda f, n=min_contests: None if f['total_contests'] >= n
+                else ("min_contests", n, f['total_contests'])
+            )
+
+        if 'max_contests' in conditions:
+            max_contests = conditions['max_contests']
+            self.snapshot_checks.append(
+                lambda f, n=max_contests: None if f['total_contests'] <= n
+                else ("max_contests", n, f['total_contests'])
+            )
+
+    async def check(self, facts: UserFacts) -> Rejection:
+        """Прогнать пользователя через конвейер, остановившись на первом отказе"""
+        # 1. Проверки в памяти
+        if self.contest_type and contest_registry.get_last_winner(self.contest_type) == facts.user_id:
+            return ("previous_winner", 0, 0)
+
+        if self.check_subscription and facts.known_subscription() is False:
+            return ("not_subscribed", 0, 0)
+
+        if self.min_second_level:
+            second_level = referral_graph.second_level_count(facts.user_id)
+            if second_level < self.min_second_level:
+                return ("min_second_level_referrals", self.min_second_level, second_level)
+
+        # 2. Один SQL-снимок на все условия по статистике
+        if self.snapshot_checks:
+            snapshot = await facts.snapshot()
+            for predicate in self.snapshot_checks:
+                rejection = predicate(snapshot)
+                if rejection:
+                    return rejection
+
+        # 3. Telegram API — только если статус подписки всё ещё неизвестен
+        if self.check_subscription and not await facts.subscribed():
+            return ("not_subscribed", 0, 0)
+
+        return None
 
 
 class ParticipantFilter:
@@ -57,6 +166,33 @@ class ParticipantFilter:
         stats = await db.get_user_stats(user_id)
         return stats['total_contests'] <= max_count
     
+    # Скомпилированные конвейеры по ID конкурса
+    _pipelines: Dict[int, Tuple[Dict, EligibilityPipeline]] = {}
+    
+    @staticmethod
+    def compile(contest: Dict) -> EligibilityPipeline:
+        """
+        Конвейер проверок для конкурса (компилируется один раз на конкурс)
+        
+        Args:
+            contest: Конкурс из реестра (id, contest_type, entry_conditions)
+        """
+        conditions = contest.get('entry_conditions') or {}
+        cached = ParticipantFilter._pipelines.get(contest['id'])
+        
+        # Условия конкурса не меняются, но сверяем объект на случай перезагрузки реестра
+        if cached and cached[0] is conditions:
+            return cached[1]
+        
+        pipeline = EligibilityPipeline(contest.get('contest_type'), conditions)
+        ParticipantFilter._pipelines[contest['id']] = (conditions, pipeline)
+        return pipeline
+    
+    @staticmethod
+    def forget(contest_id: int):
+        """Забыть конвейер конкурса (конкурс ушёл из реестра)"""
+        ParticipantFilter._pipelines.pop(contest_id, None)
+    
     @staticmethod
     async def check_conditions(user_id: int, conditions: Dict[str, Any]) -> tuple[bool, tuple]:
         """
@@ -75,28 +211,11 @@ class ParticipantFilter:
         Returns:
             tuple (bool, tuple): (успех, (тип_ошибки, требуемое, текущее) если неуспех)
         """
-        # Получаем статистику один раз для оптимизации
-        stats = await db.get_user_stats(user_id)
-        user_contests = stats['total_contests']
+        pipeline = EligibilityPipeline(None, conditions, check_subscription=False)
+        rejection = await pipeline.check(UserFacts(None, user_id))
         
-        # Проверка минимального количества рефералов
-        if 'min_referrals' in conditions:
-            min_refs = conditions['min_referrals']
-            if not await ParticipantFilter.check_min_referrals(user_id, min_refs):
-                current = await db.get_referral_count(user_id)
-                return False, ("min_referrals", min_refs, current)
-        
-        # Проверка минимального количества участий
-        if 'min_contests' in conditions:
-            min_contests = conditions['min_contests']
-            if user_contests < min_contests:
-                return False, ("min_contests", min_contests, user_contests)
-        
-        # Проверка максимального количества участий
-        if 'max_contests' in conditions:
-            max_contests = conditions['max_contests']
-            if user_contests > max_contests:
-                return False, ("max_contests", max_contests, user_contests)
+        if rejection:
+            return False, rejection
         
         # Все условия выполнены
         return True, ()
@@ -120,6 +239,9 @@ class ParticipantFilter:
         if 'min_referrals' in conditions:
             parts.append(f"🔗 Минимум {conditions['min_referrals']} рефералов")
         
+        if 'min_second_level_referrals' in conditions:
+            parts.append(f"🔗 Минимум {conditions['min_second_level_referrals']} рефералов 2-го уровня")
+        
         # Умное форматирование диапазона участий
         has_min = 'min_contests' in conditions
         has_max = 'max_contests' in conditions
@@ -0,0 +1,196 @@
+"""
+Выбор ведущего экземпляра бота
+Таймеры и сборщики конкурсов, снимки рейтингов и перепроверку рефералов
+ведёт один экземпляр — тот, кто держит advisory lock в PostgreSQL.
+Остальные обслуживают обновления и API и ждут, чтобы подхватить лидерство.
+"""
+
+import asyncio
+import uuid
+from typing import Awaitable, Callable, List, Optional, Set
+
+import config
+
+
+# on_event(kind, args) — событие от другого экземпляра
+EventCallback = Callable[[str, list], Awaitable]
+
+
+class LeaderElection:
+    """
+    Лидерство = сессионный pg_try_advisory_lock на отдельном соединении
+
+    - раз в check_interval секунд ведомый пробует взять блокировку,
+      ведущий проверяет, что его соединение живо
+    - блокировка снимается вместе с сессией: упавший ведущий отдаёт
+      лидерство сразу (или по таймауту TCP), следующий берёт его
+      в пределах check_interval
+    - то же соединение слушает канал channel (LISTEN/NOTIFY):
+      экземпляры сообщают друг другу об изменениях конкурсов и данных
+      в памяти (счётчики, граф рефералов, подписчики) в формате
+      "вид:экземпляр:аргументы"; свои события игнорируются
+    - publish копит события publish_window секунд и отправляет
+      их одним запросом
+    - каждая проверка обновляет отметку экземпляра в bot_instances:
+      ведущий знает, чьих подтверждений ждать (spam_flush_acks)
+    """
+
+    def __init__(self, lock_id: int, check_interval: float, channel: str, publish_window: float):
+        self.lock_id = lock_id
+        self.check_interval = check_interval
+        self.channel = channel
+        self.publish_window = publish_window
+        self.outbox: List[str] = []
+        self._publisher: Optional[asyncio.Task] = None
+        self.instance_id = uuid.uuid4().hex[:12]
+        self.is_leader = False
+        self.conn = None
+        self._on_elected: Optional[Callable[[], Awaitable]] = None
+        self._on_lost: Optional[Callable[[], Awaitable]] = None
+        self._on_event: Optional[EventCallback] = None
+        self._events: Set[asyncio.Task] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def payload(self, kind: str, *args) -> str:
+        """Текст уведомления для остальных экземпляров"""
+        return ":".join([kind, self.instance_id, *map(str, args)])
+
+    def publish(self, kind: str, *args):
+        """Отправить событие остальным экземплярам в фоне (пачкой)"""
+        self.outbox.append(self.payload(kind, *args))
+        if self._publisher is None or self._publisher.done():
+            self._publisher = asyncio.create_task(self._publish_loop())
+
+    async def _publish_loop(self):
+        while self.outbox:
+            await asyncio.sleep(self.publish_window)
+            await self.flush()
+
+    async def flush(self):
+        """Отправить накопленные события одним запросом"""
+        if not self.outbox:
+            return
+
+        from database_postgres import db
+
+        batch, self.outbox = self.outbox, []
+        try:
+            await db.notify_cluster_batch(batch)
+        except Exception as e:
+            # Экземпляры разойдутся до следующего изменения тех же данных
+            print(f"⚠️ Не удалось отправить {len(batch)} событий экземплярам: {e}")
+
+    def _notified(self, conn, pid, channel, payload: str):
+        kind, instance_id, *args = payload.split(":")
+        if instance_id == self.instance_id or self._on_event is None:
+            return
+        task = asyncio.create_task(self._handle(kind, args))
+        self._events.add(task)
+        task.add_done_callback(self._events.discard)
+
+    async def _handle(self, kind: str, args: list):
+        try:
+            await self._on_event(kind, args)
+        except Exception as e:
+            print(f"⚠️ Ошибка обработки события {kind} {args}: {e}")
+
+    async def _connect(self):
+        from database_postgres import db
+        self.conn = await db.pool.acquire()
+        await self.conn.add_listener(self.channel, self._notified)
+
+    async def _disconnect(self):
+        """Вернуть соединение в пул (блокировка и LISTEN снимаются сбросом сессии)"""
+        from database_postgres import db
+        conn, self.conn = self.conn, None
+        if conn is None:
+            return
+        try:
+            await conn.remove_listener(self.channel, self._notified)
+        except Exception:
+            pass
+        try:
+            await db.pool.release(conn)
+        except Exception as e:
+            print(f"⚠️ Не удалось вернуть соединение ведущего в пул: {e}")
+
+    async def _step(self):
+        """Одна проверка: взять лидерство или убедиться, что оно ещё наше"""
+        try:
+            if self.conn is None:
+                await self._connect()
+            await self.conn.execute('''
+                INSERT INTO bot_instances (instance_id) VALUES ($1)
+                ON CONFLICT (instance_id) DO UPDATE SET seen_at = NOW()
+            ''', self.instance_id)
+            if self.is_leader:
+                return
+            if not await self.conn.fetchval('SELECT pg_try_advisory_lock($1)', self.lock_id):
+                return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Соединение выбора ведущего потеряно: {e}")
+            await self._disconnect()
+            if self.is_leader:
+                # Блокировка ушла вместе с сессией — её уже может держать другой
+                self.is_leader = False
+                print(f"🔻 Экземпляр {self.instance_id} больше не ведущий")
+                await self._on_lost()
+            return
+
+        self.is_leader = True
+        print(f"👑 Экземпляр {self.instance_id} стал ведущим")
+        await self._on_elected()
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await self._step()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Ошибка выбора ведущего: {e}")
+
+    async def start(self, on_elected: Callable[[], Awaitable],
+                    on_lost: Callable[[], Awaitable], on_event: EventCallback):
+        """
+        Начать выборы; первая попытка — сразу, чтобы единственный
+        экземпляр стал ведущим до начала приёма обновлений
+        """
+        self._on_elected = on_elected
+        self._on_lost = on_lost
+        self._on_event = on_event
+        await self._step()
+        if not self.is_leader:
+            print(f"⏳ Экземпляр {self.instance_id} ведомый: ждём освобождения лидерства")
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Остановить выборы и отдать лидерство (ведущие службы уже остановлены)"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        self.is_leader = False
+        await self.flush()
+        if self.conn is not None:
+            try:
+                await self.conn.execute('DELETE FROM bot_instances WHERE instance_id = $1', self.instance_id)
+            except Exception as e:
+                print(f"⚠️ Не удалось снять отметку экземпляра: {e}")
+        await self._disconnect()
+
+
+# Глобальный экземпляр
+leader_election = LeaderElection(
+    lock_id=config.LEADER_LOCK_ID,
+    check_interval=config.LEADER_CHECK_INTERVAL,
+    channel=config.CLUSTER_CHANNEL,
+    publish_window=config.CLUSTER_PUBLISH_WINDOW
+)
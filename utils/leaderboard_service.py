@@ -0,0 +1,221 @@
+"""
+Сервис лидербордов
+ТОПы готовятся в фоне (по расписанию и после изменения счётчиков),
+кнопки бота и /api/leaderboard читают их из памяти
+"""
+
+import asyncio
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from aiogram import Bot
+
+import config
+from utils.referral_graph import referral_graph
+from utils.subscription_cache import subscription_cache
+from utils.user_directory import user_directory
+
+
+# Категория -> (метод БД, поле счёта)
+LEADERBOARD_CATEGORIES = {
+    "referrals": ("get_leaderboard_by_referrals", "referral_count"),
+    "wins": ("get_leaderboard_by_wins", "total_wins"),
+    "contests": ("get_leaderboard_by_contests", "total_contests"),
+}
+
+# Категории по графу рефералов (utils.referral_graph): категория -> метрика графа
+GRAPH_CATEGORIES = {
+    "second_level": "second_level",
+    "network": "network",
+}
+
+
+# Топы за период (таблица user_rollups)
+PERIOD_TYPES = ("week", "month", "all")
+PERIOD_CONTEST_TYPES = ("all", "voting_contest", "random_contest", "spam_contest")
+PERIOD_METRICS = ("wins", "contests")
+
+
+def display_name(row: Dict) -> str:
+    """Отображаемое имя пользователя в ТОПе"""
+    if row.get("username"):
+        return f"@{row['username']}"
+    return row.get("full_name") or f"User {row['user_id']}"
+
+
+class LeaderboardService:
+    """
+    Готовые ТОПы по категориям
+
+    Для каждой категории хранится:
+    - leaders: строки ТОПа из БД как есть (для API)
+    - top: первые top_size подписанных на канал (для бота)
+
+    Категории, чьи счётчики изменились, помечаются грязными
+    и пересчитываются не чаще раза в dirty_interval секунд;
+    раз в refresh_interval пересчитываются все (меняются подписки).
+    ТОПы по графу рефералов (обход всего графа) — только в полном пересчёте.
+    ТОПы за неделю / месяц по типам конкурсов строятся по запросу
+    из user_rollups и живут period_ttl секунд.
+    """
+
+    def __init__(self, top_size: int, fetch_limit: int,
+                 refresh_interval: int, dirty_interval: int, period_ttl: int):
+        self.top_size = top_size
+        self.fetch_limit = fetch_limit
+        self.refresh_interval = refresh_interval
+        self.dirty_interval = dirty_interval
+        self.period_ttl = period_ttl
+        self.boards: Dict[str, Dict] = {}
+        # (период, тип конкурса, метрика) -> доска; живёт period_ttl секунд
+        self.period_boards: Dict[Tuple[str, str, str], Dict] = {}
+        self.dirty: Set[str] = set()
+        self.bot: Optional[Bot] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def mark_dirty(self, category: str):
+        """Счётчики категории изменились — пересчитать в ближайший цикл"""
+        self.dirty.add(category)
+
+    def on_subscription_change(self, user_id: int):
+        """Пользователь подписался или отписался от канала"""
+        for category, board in self.boards.items():
+            if user_id in board["user_ids"]:
+                self.dirty.add(category)
+        for key, board in list(self.period_boards.items()):
+            if user_id in board["user_ids"]:
+                del self.period_boards[key]
+
+    async def _build(self, rows: List[Dict], score_field: str) -> Dict:
+        """Доска из строк БД: строки как есть и подписанные лидеры"""
+        top = []
+        for row in rows:
+            if len(top) >= self.top_size:
+                break
+            # Подписка берётся из локального множества / кэша,
+            # в Telegram уходят только неизвестные пользователи
+            if await subscription_cache.is_subscribed(self.bot, row["user_id"]):
+                top.append({
+                    "user_id": row["user_id"],
+                    "name": display_name(row),
+                    "score": row[score_field],
+                })
+
+        return {
+            "leaders": rows[:self.top_size],
+            "top": top,
+            "user_ids": {row["user_id"] for row in rows},
+            "updated_at": time.time(),
+        }
+
+    async def refresh(self, category: str):
+        """Пересчитать ТОП категории"""
+        if category in GRAPH_CATEGORIES:
+            rows = await self._graph_rows(GRAPH_CATEGORIES[category])
+            self.boards[category] = await self._build(rows, "score")
+            return
+
+        from database_postgres import db
+
+        method, score_field = LEADERBOARD_CATEGORIES[category]
+        rows = await getattr(db, method)(limit=self.fetch_limit)
+        self.boards[category] = await self._build(rows, score_field)
+
+    async def _graph_rows(self, metric: str) -> List[Dict]:
+        """Строки ТОПа по графу рефералов в формате строк БД"""
+        leaders = await referral_graph.top(metric, self.fetch_limit)
+        names = await user_directory.resolve([user_id for user_id, _ in leaders])
+
+        rows = []
+        for rank, (user_id, score) in enumerate(leaders, 1):
+            name = names.get(user_id, {})
+            rows.append({
+                "user_id": user_id,
+                "username": name.get("username"),
+                "full_name": name.get("full_name"),
+                "score": score,
+                "rank": rank,
+            })
+        return rows
+
+    async def get_period_board(self, period_type: str, contest_type: str, metric: str) -> Dict:
+        """
+        ТОП за период по типу конкурса (из user_rollups)
+        Готовая доска переиспользуется period_ttl секунд
+        """
+        key = (period_type, contest_type, metric)
+        board = self.period_boards.get(key)
+        if board is not None and time.time() - board["updated_at"] < self.period_ttl:
+            return board
+
+        from database_postgres import db
+        rows = await db.get_rollup_leaderboard(period_type, contest_type, metric, limit=self.fetch_limit)
+        board = await self._build(rows, "score")
+        self.period_boards[key] = board
+        return board
+
+    async def refresh_all(self):
+        """Пересчитать все категории"""
+        for category in (*LEADERBOARD_CATEGORIES, *GRAPH_CATEGORIES):
+            self.dirty.discard(category)
+            try:
+                await self.refresh(category)
+            except Exception as e:
+                self.dirty.add(category)
+                print(f"⚠️ Ошибка обновления лидерборда {category}: {e}")
+
+    async def _loop(self):
+        last_full = time.monotonic()
+        while True:
+            await asyncio.sleep(self.dirty_interval)
+
+            if time.monotonic() - last_full >= self.refresh_interval:
+                last_full = time.monotonic()
+                await self.refresh_all()
+                continue
+
+            # ТОПы по графу ждут полного пересчёта
+            for category in list(self.dirty - GRAPH_CATEGORIES.keys()):
+                self.dirty.discard(category)
+                try:
+                    await self.refresh(category)
+                except Exception as e:
+                    self.dirty.add(category)
+                    print(f"⚠️ Ошибка обновления лидерборда {category}: {e}")
+
+    async def start(self, bot: Bot):
+        """Первичный расчёт и запуск фонового обновления"""
+        self.bot = bot
+        await self.refresh_all()
+        self._task = asyncio.create_task(self._loop())
+        print(f"✅ Лидерборды готовы: {', '.join(self.boards)}")
+
+    async def stop(self):
+        """Остановить фоновое обновление"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_top(self, category: str) -> List[Dict]:
+        """Подписанные лидеры категории: [{'user_id', 'name', 'score'}, ...]"""
+        board = self.boards.get(category)
+        return board["top"] if board else []
+
+    def get_leaders(self, category: str) -> List[Dict]:
+        """Строки ТОПа из БД (с rank, username, full_name и счётом)"""
+        board = self.boards.get(category)
+        return board["leaders"] if board else []
+
+
+# Глобальный экземпляр
+leaderboard_service = LeaderboardService(
+    top_size=config.LEADERBOARD_TOP_SIZE,
+    fetch_limit=config.LEADERBOARD_FETCH_LIMIT,
+    refresh_interval=config.LEADERBOARD_REFRESH_INTERVAL,
+    dirty_interval=config.LEADERBOARD_DIRTY_INTERVAL,
+    period_ttl=config.LEADERBOARD_PERIOD_TTL
+)
@@ -12,7 +12,7 @@ def format_rejection_message(error_type: str, required: int = 0, current: int =
     Форматирование сообщения об отказе в участии
     
     Args:
-        error_type: Тип ошибки ('min_referrals', 'min_contests', 'max_contests')
+        error_type: Тип ошибки ('min_referrals', 'min_second_level_referrals', 'min_contests', 'max_contests', 'contest_full', ...)
         required: Требуемое значение
         current: Текущее значение у пользователя
         
@@ -32,6 +32,17 @@ def format_rejection_message(error_type: str, required: int = 0, current: int =
             ]
         },
         
+        "min_second_level_referrals": {
+            "emoji": "🌳",
+            "reason": f"Нужно минимум {required} рефералов 2-го уровня (у вас: {current})",
+            "tips": [
+                "💡 Рефералы 2-го уровня — это друзья ваших друзей:",
+                "• Попросите приглашённых поделиться своей ссылкой из /start",
+                "• Засчитываются только подписавшиеся на канал",
+                "• Свою сеть можно посмотреть в разделе «Моя статистика»"
+            ]
+        },
+        
         "min_contests": {
             "emoji": "🎯",
             "reason": f"Нужно минимум {required} участий в конкурсах (у вас: {current})",
@@ -65,6 +76,17 @@ def format_rejection_message(error_type: str, required: int = 0, current: int =
             ]
         },
         
+        "contest_full": {
+            "emoji": "⏳",
+            "reason": "Все места в конкурсе уже заняты",
+            "tips": [
+                "💡 Не расстраивайтесь:",
+                "• Регистрация идёт в порядке комментариев",
+                "• Следите за анонсами — новые конкурсы выходят регулярно",
+                "• Включите уведомления канала, чтобы успеть первым"
+            ]
+        },
+        
         "previous_winner": {
             "emoji": "🏆",
             "reason": "Вы были победителем в прошлом конкурсе этого типа",
@@ -129,3 +151,40 @@ def get_not_subscribed_error() -> str:
 def get_previous_winner_error() -> str:
     """Сообщение об ошибке: был победителем в прошлом конкурсе"""
     return format_rejection_message("previous_winner")
+
+
+def get_contest_full_error() -> str:
+    """Сообщение об ошибке: все места в конкурсе заняты"""
+    return format_rejection_message("contest_full")
+
+
+def format_registration_confirmation(position: int, emoji: str) -> str:
+    """Подтверждение регистрации участника"""
+    return f"✅ Вы в игре! Ваш номер: {position} {emoji}"
+
+
+# Названия рейтингов в уведомлениях
+RANK_CATEGORY_NAMES = {
+    "referrals": "по рефералам",
+    "wins": "по победам",
+    "contests": "по активности",
+}
+
+
+def format_rank_entered_top(category: str, position: int, top_size: int) -> str:
+    """Уведомление: пользователь вошёл в топ рейтинга"""
+    return (
+        f"🎉 Вы вошли в топ-{top_size} рейтинга {RANK_CATEGORY_NAMES[category]}!\n\n"
+        f"📍 Ваше место: {position}"
+    )
+
+
+def format_rank_overtaken(category: str, old_rank: int, new_rank: int = None) -> str:
+    """Уведомление: пользователя обогнали в рейтинге"""
+    if new_rank is None:
+        return f"📉 Вы выбыли из рейтинга {RANK_CATEGORY_NAMES[category]} (было место {old_rank})"
+    return (
+        f"📉 Вас обогнали в рейтинге {RANK_CATEGORY_NAMES[category]}!\n\n"
+        f"📍 Место: {old_rank} → {new_rank}\n"
+        f"💪 Верните свою позицию!"
+    )
@@ -0,0 +1,68 @@
+"""
+Отправка уведомлений пользователям с ограничением скорости
+Массовые рассылки (например, изменения мест в рейтинге) не упираются в лимиты Telegram
+"""
+
+import asyncio
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+import config
+
+
+class PacedSender:
+    """
+    Очередь личных сообщений с одним отправителем
+
+    Сообщения уходят не чаще rate в секунду; на FloodWait отправитель
+    ждёт сколько попросил Telegram и повторяет то же сообщение.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.bot: Optional[Bot] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, bot: Bot):
+        """Запустить отправителя"""
+        self.bot = bot
+        self._task = asyncio.create_task(self._worker())
+
+    async def stop(self):
+        """Остановить отправителя (неотправленные сообщения теряются)"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def send(self, user_id: int, text: str, **kwargs):
+        """Поставить сообщение в очередь"""
+        self.queue.put_nowait((user_id, text, kwargs))
+
+    async def _worker(self):
+        while True:
+            user_id, text, kwargs = await self.queue.get()
+
+            while True:
+                try:
+                    await self.bot.send_message(user_id, text, **kwargs)
+                except TelegramRetryAfter as e:
+                    print(f"⏳ FloodWait при рассылке: ждём {e.retry_after}с")
+                    await asyncio.sleep(e.retry_after)
+                    continue
+                except Exception as e:
+                    # Пользователь заблокировал бота и т.п. — пропускаем
+                    print(f"⚠️ Не удалось отправить уведомление {user_id}: {e}")
+                break
+
+            await asyncio.sleep(self.interval)
+
+
+# Глобальный экземпляр
+paced_sender = PacedSender(rate=config.NOTIFY_RATE)
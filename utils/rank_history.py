@@ -0,0 +1,77 @@
+"""
+Ежедневные снимки рейтингов
+Снимок хранится массивами (один ряд на день и категорию), сравнение
+с предыдущим днём — одним запросом, уведомления — через PacedSender
+"""
+
+import asyncio
+from typing import Optional
+
+import config
+from utils.messages import format_rank_entered_top, format_rank_overtaken
+from utils.notifier import paced_sender
+from utils.rank_index import RANK_CATEGORIES
+
+
+class RankHistory:
+    """
+    Фоновая задача снимков рейтингов
+
+    Раз в check_interval секунд проверяет, есть ли снимок за сегодня;
+    если нет — снимает все категории из user_stats, сравнивает
+    с предыдущим снимком и ставит уведомления в очередь.
+    """
+
+    def __init__(self, top_size: int, check_interval: int):
+        self.top_size = top_size
+        self.check_interval = check_interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self):
+        """Снять сегодняшние рейтинги и разослать изменения"""
+        from database_postgres import db
+
+        for category, column in RANK_CATEGORIES.items():
+            if not await db.take_rank_snapshot(category, column):
+                continue
+
+            changes = await db.diff_rank_snapshots(category, self.top_size)
+            for change in changes:
+                old_rank, new_rank = change['old_rank'], change['new_rank']
+                if new_rank is not None and new_rank <= self.top_size and (
+                        old_rank is None or old_rank > self.top_size):
+                    text = format_rank_entered_top(category, new_rank, self.top_size)
+                else:
+                    text = format_rank_overtaken(category, old_rank, new_rank)
+                paced_sender.send(change['user_id'], text)
+
+            print(f"📸 Снимок рейтинга {category}: {len(changes)} уведомлений")
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"⚠️ Ошибка снимка рейтингов: {e}")
+            await asyncio.sleep(self.check_interval)
+
+    def start(self):
+        """Запустить фоновую задачу"""
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Остановить фоновую задачу"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Глобальный экземпляр
+rank_history = RankHistory(
+    top_size=config.LEADERBOARD_TOP_SIZE,
+    check_interval=config.RANK_SNAPSHOT_CHECK_INTERVAL
+)
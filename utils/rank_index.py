@@ -0,0 +1,175 @@
+"""
+Индекс мест в рейтингах
+Место пользователя и соседи по рейтингу за O(log n) без запросов к БД
+"""
+
+from array import array
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+
+
+# Категория рейтинга -> колонка user_stats
+RANK_CATEGORIES = {
+    "referrals": "referral_points",
+    "wins": "total_wins",
+    "contests": "total_contests",
+}
+
+
+class ScoreRanking:
+    """
+    Рейтинг по одной метрике
+
+    Дерево Фенвика по значениям счёта хранит, сколько пользователей
+    набрали каждый счёт; внутри одного счёта пользователи лежат
+    в отсортированном массиве (при равенстве выше тот, у кого меньше user_id).
+    В рейтинг попадают только пользователи с положительным счётом.
+    """
+
+    def __init__(self, size: int = 64):
+        self.size = size
+        self.tree = array('q', [0] * (size + 1))
+        self.total = 0
+        self.scores: Dict[int, int] = {}
+        self.buckets: Dict[int, array] = {}
+
+    def _grow(self, score: int):
+        """Расширить дерево, чтобы в него помещался счёт"""
+        size = self.size
+        while size < score:
+            size *= 2
+
+        self.size = size
+        self.tree = array('q', [0] * (size + 1))
+        for value, bucket in self.buckets.items():
+            self._add(value, len(bucket))
+
+    def _add(self, score: int, delta: int):
+        i = score
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, score: int) -> int:
+        """Сколько пользователей со счётом <= score"""
+        result = 0
+        i = min(score, self.size)
+        while i > 0:
+            result += self.tree[i]
+            i -= i & -i
+        return result
+
+    def _lower_bound(self, count: int) -> int:
+        """Наименьший счёт, для которого _prefix(счёт) >= count"""
+        pos = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            nxt = pos + step
+            if nxt <= self.size and self.tree[nxt] < count:
+                pos = nxt
+                count -= self.tree[nxt]
+            step >>= 1
+        return pos + 1
+
+    def set_score(self, user_id: int, score: int):
+        """Установить счёт пользователя"""
+        old = self.scores.get(user_id, 0)
+        if old == score:
+            return
+
+        if old > 0:
+            bucket = self.buckets[old]
+            del bucket[bisect_left(bucket, user_id)]
+            if not bucket:
+                del self.buckets[old]
+            self._add(old, -1)
+            self.total -= 1
+
+        if score > 0:
+            if score > self.size:
+                self._grow(score)
+            insort(self.buckets.setdefault(score, array('q')), user_id)
+            self._add(score, 1)
+            self.total += 1
+            self.scores[user_id] = score
+        else:
+            self.scores.pop(user_id, None)
+
+    def rank(self, user_id: int) -> int:
+        """Место пользователя (1 — лучший), 0 если его нет в рейтинге"""
+        score = self.scores.get(user_id)
+        if not score:
+            return 0
+        above = self.total - self._prefix(score)
+        return above + bisect_left(self.buckets[score], user_id) + 1
+
+    def at(self, rank: int) -> Optional[Tuple[int, int]]:
+        """Пользователь на месте rank: (user_id, счёт)"""
+        if rank < 1 or rank > self.total:
+            return None
+        score = self._lower_bound(self.total - rank + 1)
+        above = self.total - self._prefix(score)
+        return self.buckets[score][rank - above - 1], score
+
+    def around(self, user_id: int, k: int) -> List[Tuple[int, int, int]]:
+        """
+        Соседи пользователя по рейтингу
+
+        Returns:
+            [(место, user_id, счёт), ...] для мест rank-k .. rank+k
+        """
+        rank = self.rank(user_id)
+        if not rank:
+            return []
+
+        result = []
+        for place in range(max(1, rank - k), min(self.total, rank + k) + 1):
+            user, score = self.at(place)
+            result.append((place, user, score))
+        return result
+
+
+class RankIndex:
+    """Рейтинги по всем категориям, обновляются из методов-инкрементов БД"""
+
+    def __init__(self):
+        self.rankings: Dict[str, ScoreRanking] = {
+            category: ScoreRanking() for category in RANK_CATEGORIES
+        }
+
+    async def load(self, db):
+        """Построить рейтинги по user_stats (при старте)"""
+        rows = await db.get_rank_scores()
+
+        self.rankings = {category: ScoreRanking() for category in RANK_CATEGORIES}
+        for row in rows:
+            for category, column in RANK_CATEGORIES.items():
+                if row[column]:
+                    self.rankings[category].set_score(row['user_id'], row[column])
+
+        print(f"✅ Рейтинги построены: {len(rows)} пользователей")
+
+    def update(self, category: str, user_id: int, score: int):
+        """Новое значение счётчика пользователя"""
+        self.rankings[category].set_score(user_id, score or 0)
+
+    def reset(self, category: str):
+        """Обнулить рейтинг категории"""
+        self.rankings[category] = ScoreRanking()
+
+    def get_position(self, user_id: int, category: str) -> Tuple[int, int]:
+        """(место, всего в рейтинге); место 0 — пользователя нет в рейтинге"""
+        ranking = self.rankings[category]
+        return ranking.rank(user_id), ranking.total
+
+    def get_score(self, user_id: int, category: str) -> int:
+        """Счёт пользователя в категории"""
+        return self.rankings[category].scores.get(user_id, 0)
+
+    def get_around(self, user_id: int, category: str, k: int) -> List[Tuple[int, int, int]]:
+        """Соседи пользователя: [(место, user_id, счёт), ...]"""
+        return self.rankings[category].around(user_id, k)
+
+
+# Глобальный экземпляр
+rank_index = RankIndex()
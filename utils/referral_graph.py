@@ -0,0 +1,232 @@
+"""
+Граф рефералов в памяти
+Подписанные рефералы хранятся компактными массивами смежности (CSR),
+поэтому «вся сеть», «рефералы 2-го уровня» и ТОП сетей считаются без SQL
+"""
+
+import asyncio
+from array import array
+from collections import deque
+from typing import Callable, Dict, List, Set, Tuple
+
+import config
+
+
+Children = Callable[[int], List[int]]
+
+
+def _second_level(node: int, children: Children) -> int:
+    second = set()
+    for child in children(node):
+        second.update(children(child))
+    second.discard(node)
+    return len(second)
+
+
+def _downstream(node: int, children: Children) -> int:
+    # Обход в ширину; visited защищает от циклов (A пригласил B, B — A)
+    visited = {node}
+    queue = deque([node])
+    while queue:
+        for child in children(queue.popleft()):
+            if child not in visited:
+                visited.add(child)
+                queue.append(child)
+    return len(visited) - 1
+
+
+# Метрики графа: имя -> расчёт по вершине
+GRAPH_METRICS = {
+    "second_level": _second_level,
+    "network": _downstream,
+}
+
+
+def _rank(metric: str, ids: array, offsets: array, targets: array) -> List[Tuple[int, int]]:
+    """Рефереры по убыванию метрики на снимке CSR (выполняется в отдельном потоке)"""
+    def children(node: int):
+        return targets[offsets[node]:offsets[node + 1]]
+
+    score = GRAPH_METRICS[metric]
+    ranked = []
+    for node, user_id in enumerate(ids):
+        if offsets[node] == offsets[node + 1]:
+            continue
+        value = score(node, children)
+        if value > 0:
+            ranked.append((user_id, value))
+    ranked.sort(key=lambda item: (-item[1], item[0]))
+    return ranked
+
+
+class ReferralGraph:
+    """
+    Ориентированный граф «реферер → приглашённый» (только подписанные рефералы)
+
+    Вершины нумеруются подряд; дети вершины i лежат в
+    targets[offsets[i]:offsets[i + 1]]. Рёбра, появившиеся после
+    построения, копятся в added / removed и вливаются в массивы
+    пересборкой, когда изменений набирается compact_threshold.
+    ТОПы считаются в отдельном потоке по снимку массивов, чтобы обход
+    всего графа не останавливал цикл событий.
+    """
+
+    def __init__(self, compact_threshold: int):
+        self.compact_threshold = compact_threshold
+        self._clear()
+
+    def _clear(self):
+        self.index: Dict[int, int] = {}       # user_id -> вершина
+        self.ids = array('q')                 # вершина -> user_id
+        self.offsets = array('q', [0])
+        self.targets = array('q')
+        self.added: Dict[int, List[int]] = {}
+        self.removed: Set[Tuple[int, int]] = set()
+        self.pending = 0
+        self.edges = 0
+        # Кэш ТОПов по метрикам; сбрасывается при любом изменении графа
+        self._top_cache: Dict[str, List[Tuple[int, int]]] = {}
+        self.version = 0
+
+    def _node(self, user_id: int) -> int:
+        """Вершина пользователя (новая — с пустым списком детей)"""
+        node = self.index.get(user_id)
+        if node is None:
+            node = len(self.ids)
+            self.index[user_id] = node
+            self.ids.append(user_id)
+            self.offsets.append(self.offsets[-1])
+        return node
+
+    def _children(self, node: int) -> List[int]:
+        if node + 1 < len(self.offsets):
+            base = self.targets[self.offsets[node]:self.offsets[node + 1]]
+        else:
+            base = ()
+        if self.removed:
+            children = [child for child in base if (node, child) not in self.removed]
+        else:
+            children = list(base)
+        children.extend(self.added.get(node, ()))
+        return children
+
+    def _build(self, adjacency: List[List[int]]):
+        """Собрать массивы CSR из списков детей по вершинам"""
+        offsets = array('q', [0])
+        targets = array('q')
+        for children in adjacency:
+            targets.extend(children)
+            offsets.append(len(targets))
+
+        self.offsets = offsets
+        self.targets = targets
+        self.added = {}
+        self.removed = set()
+        self.pending = 0
+        self.edges = len(targets)
+
+    def compact(self):
+        """Влить накопленные изменения в массивы"""
+        self._build([self._children(node) for node in range(len(self.ids))])
+
+    async def load(self, db):
+        """Построить граф по таблице referrals (при старте)"""
+        self._clear()
+        edges = await db.get_subscribed_referral_edges()
+
+        pairs = [(self._node(edge['referrer_id']), self._node(edge['referred_id'])) for edge in edges]
+        adjacency: List[List[int]] = [[] for _ in self.ids]
+        for parent, child in pairs:
+            adjacency[parent].append(child)
+
+        self._build(adjacency)
+        print(f"✅ Граф рефералов построен: {len(self.ids)} пользователей, {self.edges} связей")
+
+    def reset(self):
+        """Очистить граф (после очистки реферальной системы)"""
+        self._clear()
+
+    def _changed(self):
+        self._top_cache = {}
+        self.version += 1
+        self.pending += 1
+        if self.pending >= self.compact_threshold:
+            self.compact()
+
+    def add_edge(self, referrer_id: int, referred_id: int):
+        """Реферал подписался"""
+        parent = self._node(referrer_id)
+        child = self._node(referred_id)
+
+        if (parent, child) in self.removed:
+            self.removed.discard((parent, child))
+        elif child in self._children(parent):
+            return
+        else:
+            self.added.setdefault(parent, []).append(child)
+
+        self.edges += 1
+        self._changed()
+
+    def remove_edge(self, referrer_id: int, referred_id: int):
+        """Реферал отписался"""
+        parent = self.index.get(referrer_id)
+        child = self.index.get(referred_id)
+        if parent is None or child is None:
+            return
+
+        extra = self.added.get(parent)
+        if extra and child in extra:
+            extra.remove(child)
+        elif child in self._children(parent):
+            self.removed.add((parent, child))
+        else:
+            return
+
+        self.edges -= 1
+        self._changed()
+
+    def direct_count(self, user_id: int) -> int:
+        """Рефералы 1-го уровня"""
+        node = self.index.get(user_id)
+        return len(self._children(node)) if node is not None else 0
+
+    def get_score(self, user_id: int, metric: str) -> int:
+        """Значение метрики графа (GRAPH_METRICS) для пользователя"""
+        node = self.index.get(user_id)
+        if node is None:
+            return 0
+        return GRAPH_METRICS[metric](node, self._children)
+
+    def second_level_count(self, user_id: int) -> int:
+        """Рефералы 2-го уровня: кого пригласили ваши рефералы (без повторов и без вас)"""
+        return self.get_score(user_id, "second_level")
+
+    def downstream_size(self, user_id: int) -> int:
+        """Вся сеть пользователя: все, до кого можно дойти по приглашениям"""
+        return self.get_score(user_id, "network")
+
+    async def top(self, metric: str, limit: int) -> List[Tuple[int, int]]:
+        """
+        ТОП пользователей по метрике графа: [(user_id, значение), ...]
+
+        Считается по всем реферерам в отдельном потоке и кэшируется
+        до следующего изменения графа
+        """
+        cached = self._top_cache.get(metric)
+        if cached is None:
+            # Снимок: после compact() изменения копятся в added / removed,
+            # а новые вершины дописываются в ids / offsets — их копируем
+            if self.pending:
+                self.compact()
+            version = self.version
+            cached = await asyncio.to_thread(
+                _rank, metric, array('q', self.ids), array('q', self.offsets), self.targets
+            )
+            if version == self.version:
+                self._top_cache[metric] = cached
+        return cached[:limit]
+
+
+# Глобальный экземпляр
+referral_graph = ReferralGraph(compact_threshold=config.REFERRAL_GRAPH_COMPACT_THRESHOLD)
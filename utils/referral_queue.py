@@ -0,0 +1,93 @@
+"""
+Очередь записи рефералов короткими пачками
+Когда популярный пользователь публикует ссылку, тысячи /start ref_...
+пишутся в БД одним запросом на пачку, а не соединением на каждый переход
+"""
+
+import asyncio
+from typing import List, Optional, Tuple
+
+import config
+
+
+class ReferralQueue:
+    """
+    Один писатель забирает накопившиеся переходы (до batch_size,
+    ждёт не дольше batch_window секунд) и добавляет их одним
+    INSERT ... ON CONFLICT DO NOTHING RETURNING (db.add_referrals_batch).
+    """
+
+    def __init__(self, batch_size: int, batch_window: float):
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._writer: Optional[asyncio.Task] = None
+
+    async def add(self, referrer_id: int, referred_id: int) -> bool:
+        """
+        Поставить переход в очередь и дождаться записи
+
+        Returns:
+            True если реферал новый, False если уже был приглашён этим реферером
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait(((referrer_id, referred_id), future))
+
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_loop())
+
+        return await future
+
+    async def _collect_batch(self) -> List[Tuple[Tuple[int, int], asyncio.Future]]:
+        """Взять всё, что уже в очереди, и добрать пачку в пределах окна"""
+        batch = [self.queue.get_nowait()]
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_window
+        while len(batch) < self.batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _write_loop(self):
+        """Писатель; завершается, когда очередь опустела"""
+        from database_postgres import db
+
+        while not self.queue.empty():
+            batch = await self._collect_batch()
+
+            try:
+                added = await db.add_referrals_batch([pair for pair, _ in batch])
+            except Exception as e:
+                print(f"❌ Ошибка записи пачки рефералов: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            # Повтор того же перехода в пачке считается уже приглашённым
+            seen = set()
+            for pair, future in batch:
+                if not future.done():
+                    future.set_result(pair in added and pair not in seen)
+                seen.add(pair)
+
+            if len(batch) > 1:
+                print(f"👥 Пачка рефералов: {len(batch)} переходов, новых {len(added)}")
+
+
+# Глобальный экземпляр
+referral_queue = ReferralQueue(
+    batch_size=config.REFERRAL_BATCH_SIZE,
+    batch_window=config.REFERRAL_BATCH_WINDOW
+)
@@ -0,0 +1,117 @@
+"""
+Фоновая перепроверка подписок рефералов
+Отписавшиеся рефералы перестают приносить очки, вернувшиеся — снова приносят
+"""
+
+import asyncio
+from typing import Dict, Optional
+
+from aiogram import Bot
+
+import config
+from utils.subscriber_set import subscriber_set
+from utils.subscription_cache import subscription_cache, SUBSCRIBED_STATUSES
+
+
+JOB_NAME = "referral_verifier"
+
+
+class ReferralVerifier:
+    """
+    Обход таблицы referrals по keyset-курсору (id)
+
+    - проверяются только подтверждённые рефералы (points_awarded)
+    - статус берётся из локального множества подписчиков и кэша;
+      в Telegram уходит не больше budget запросов в секунду
+    - результаты страницы применяются одной транзакцией вместе с курсором,
+      поэтому после рестарта проверка продолжается с того же места
+    - после полного прохода курсор сбрасывается, следующий проход —
+      через pass_interval секунд
+    """
+
+    def __init__(self, budget: float, batch_size: int, pass_interval: int):
+        self.interval = 1 / budget
+        self.batch_size = batch_size
+        self.pass_interval = pass_interval
+        self.bot: Optional[Bot] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def _check(self, user_id: int) -> Optional[bool]:
+        """Подписан ли пользователь; None — проверить не удалось"""
+        known = subscriber_set.lookup(user_id)
+        if known is not None:
+            return known
+
+        cached = subscription_cache.get_cached(user_id)
+        if cached is not None:
+            return cached
+
+        try:
+            member = await self.bot.get_chat_member(chat_id=config.CHANNEL_ID, user_id=user_id)
+        except Exception as e:
+            print(f"⚠️ Перепроверка подписки {user_id} не удалась: {e}")
+            return None
+        finally:
+            # Запрос к API расходует бюджет независимо от результата
+            await asyncio.sleep(self.interval)
+
+        is_subscribed = member.status in SUBSCRIBED_STATUSES
+        subscription_cache.record_api_result(user_id, is_subscribed)
+        return is_subscribed
+
+    async def run_pass(self):
+        """Один проход по рефералам начиная с сохранённого курсора"""
+        from database_postgres import db
+
+        cursor = await db.get_job_cursor(JOB_NAME)
+        checked = changed = 0
+
+        while True:
+            page = await db.get_confirmed_referrals_page(cursor, self.batch_size)
+            if not page:
+                break
+
+            checks: Dict[int, bool] = {}
+            for referral in page:
+                is_subscribed = await self._check(referral['referred_id'])
+                if is_subscribed is not None:
+                    checks[referral['id']] = is_subscribed
+
+            cursor = page[-1]['id']
+            changed += await db.apply_referral_checks(checks, JOB_NAME, cursor)
+            checked += len(checks)
+
+        # Проход завершён — следующий начнётся с начала таблицы
+        await db.set_job_cursor(JOB_NAME, 0)
+        print(f"🔁 Перепроверка рефералов: проверено {checked}, изменено {changed}")
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_pass()
+            except Exception as e:
+                print(f"⚠️ Ошибка перепроверки рефералов: {e}")
+            await asyncio.sleep(self.pass_interval)
+
+    def start(self, bot: Bot):
+        """Запустить фоновую перепроверку"""
+        self.bot = bot
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Остановить перепроверку (курсор уже сохранён)"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Глобальный экземпляр
+referral_verifier = ReferralVerifier(
+    budget=config.REFERRAL_VERIFY_BUDGET,
+    batch_size=config.REFERRAL_VERIFY_BATCH_SIZE,
+    pass_interval=config.REFERRAL_VERIFY_PASS_INTERVAL
+)
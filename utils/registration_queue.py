@@ -0,0 +1,141 @@
+"""
+Очередь регистрации участников с записью микропачками
+Во время всплеска комментариев после анонса заявки конкурса
+пишутся в БД одним запросом на пачку, строго в порядке поступления
+"""
+
+import asyncio
+from typing import Dict, List, Tuple
+
+import config
+from utils.emoji_pool import emoji_allocator
+
+
+class RegistrationQueue:
+    """
+    Очередь заявок на участие для каждого конкурса
+
+    Один писатель на конкурс забирает накопившиеся заявки
+    (до config.REGISTRATION_BATCH_SIZE, ждёт не дольше
+    config.REGISTRATION_BATCH_WINDOW секунд), выдаёт эмодзи по порядку
+    из пула конкурса (utils.emoji_pool) и регистрирует всю пачку
+    одним вызовом db.add_participants_batch.
+    """
+
+    def __init__(self, batch_size: int, batch_window: float, idle_timeout: float = 30):
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.idle_timeout = idle_timeout
+        self.queues: Dict[int, asyncio.Queue] = {}
+        self.writers: Dict[int, asyncio.Task] = {}
+
+    async def register(self, contest_id: int, user_id: int,
+                       username: str, full_name: str) -> Dict:
+        """
+        Поставить заявку в очередь и дождаться результата
+
+        Returns:
+            {'user_id', 'status', 'position', 'count', 'emoji'}
+        """
+        future = asyncio.get_running_loop().create_future()
+        entry = {
+            'user_id': user_id,
+            'username': username,
+            'full_name': full_name
+        }
+
+        queue = self.queues.setdefault(contest_id, asyncio.Queue())
+        queue.put_nowait((entry, future))
+
+        writer = self.writers.get(contest_id)
+        if writer is None or writer.done():
+            self.writers[contest_id] = asyncio.create_task(self._writer(contest_id))
+
+        return await future
+
+    async def _collect_batch(self, queue: asyncio.Queue) -> List[Tuple[Dict, asyncio.Future]]:
+        """Дождаться первой заявки и добрать пачку в пределах окна"""
+        batch = [await asyncio.wait_for(queue.get(), timeout=self.idle_timeout)]
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_window
+        while len(batch) < self.batch_size:
+            # Сначала забираем всё, что уже лежит в очереди
+            if not queue.empty():
+                batch.append(queue.get_nowait())
+                continue
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _writer(self, contest_id: int):
+        """Писатель очереди одного конкурса; завершается после простоя"""
+        queue = self.queues[contest_id]
+
+        while True:
+            try:
+                batch = await self._collect_batch(queue)
+            except asyncio.TimeoutError:
+                # Заявок давно не было — освобождаем писателя
+                if queue.empty():
+                    self.writers.pop(contest_id, None)
+                    self.queues.pop(contest_id, None)
+                    emoji_allocator.drop(contest_id)
+                    return
+                continue
+
+            try:
+                results = await self._write_batch(contest_id, [entry for entry, _ in batch])
+            except Exception as e:
+                print(f"❌ [{contest_id}] Ошибка записи пачки регистраций: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+            added = sum(1 for r in results if r['status'] == 'added')
+            print(f"📝 [{contest_id}] Пачка регистраций: {len(batch)} заявок, добавлено {added}")
+
+    async def _write_batch(self, contest_id: int, entries: List[Dict]) -> List[Dict]:
+        """Выдать эмодзи по порядку и зарегистрировать пачку одним запросом"""
+        from database_postgres import db
+
+        pool = await emoji_allocator.get_pool(contest_id)
+        for entry in entries:
+            entry['emoji'] = pool.allocate()
+
+        try:
+            results = await db.add_participants_batch(contest_id, entries)
+        except BaseException:
+            # Пачка не записана — эмодзи снова свободны
+            for entry in entries:
+                pool.release(entry['emoji'])
+            raise
+
+        for entry, result in zip(entries, results):
+            if result['status'] != 'added':
+                result['emoji'] = entry['emoji']
+                pool.release(entry['emoji'])
+            elif result['emoji'] != entry['emoji']:
+                # Предложенный эмодзи уже выдал другой экземпляр бота: БД записала
+                # свободный; предложенный занят, а записанный больше не свободен
+                pool.take(result['emoji'])
+        return results
+
+
+# Глобальный экземпляр
+registration_queue = RegistrationQueue(
+    batch_size=config.REGISTRATION_BATCH_SIZE,
+    batch_window=config.REGISTRATION_BATCH_WINDOW
+)
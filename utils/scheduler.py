@@ -0,0 +1,355 @@
+"""
+Планировщик таймеров конкурсов
+Один цикл на все конкурсы: куча дедлайнов, срабатывание в абсолютное время
+Задачи дублируются в таблицу contest_jobs, чтобы после рестарта
+продолжить их с оставшимся временем
+"""
+
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+import config
+
+
+# on_tick(remaining) — remaining: секунд до дедлайна (None, если дедлайна нет)
+TickCallback = Callable[[Optional[float]], Awaitable]
+DeadlineCallback = Callable[[], Awaitable]
+
+
+def job_key(stage: str, contest_id: int) -> str:
+    """Имя задачи этапа конкурса (timer_15, collect_15, ...)"""
+    return f"{stage}_{contest_id}"
+
+
+class TimerJob:
+    """Таймер одного этапа конкурса: тики раз в interval и/или дедлайн"""
+
+    __slots__ = ('key', 'stage', 'contest_id', 'deadline', 'interval', 'anchor', 'next_tick',
+                 'on_tick', 'on_deadline', 'seq', 'task', 'cancelled', 'attempts')
+
+    def __init__(self, stage: str, contest_id: int, deadline: Optional[float],
+                 on_deadline: Optional[DeadlineCallback], interval: Optional[float],
+                 on_tick: Optional[TickCallback]):
+        self.key = job_key(stage, contest_id)
+        self.stage = stage
+        self.contest_id = contest_id
+        self.deadline = deadline
+        self.on_deadline = on_deadline
+        self.interval = interval
+        self.on_tick = on_tick
+        # Тики идут по сетке anchor + n * interval: от дедлайна назад
+        # (последний тик ровно за interval до дедлайна) или от момента запуска
+        self.anchor = 0.0
+        self.next_tick: Optional[float] = None
+        self.seq = -1
+        self.task: Optional[asyncio.Task] = None
+        self.cancelled = False
+        self.attempts = 0
+
+    def next_fire(self) -> Optional[float]:
+        """Ближайшее срабатывание; None — задача ждёт fire_now"""
+        if self.next_tick is None:
+            return self.deadline
+        if self.deadline is None:
+            return self.next_tick
+        return min(self.next_tick, self.deadline)
+
+
+class ContestScheduler:
+    """
+    Все таймеры конкурсов в одной куче (время срабатывания, seq, задача)
+
+    - время абсолютное (time.time()): следующий тик считается от сетки,
+      а не от конца предыдущего, поэтому задержки не накапливаются
+    - один фоновый цикл спит до ближайшего срабатывания;
+      колбэки выполняются отдельными короткими задачами
+    - если предыдущий тик задачи ещё выполняется, следующий пропускается;
+      дедлайн дожидается выполняющегося тика
+    - задачи и их дедлайны пишутся в contest_jobs; упавший дедлайн
+      повторяется через retry_delay (с удвоением) до max_attempts раз,
+      после чего задача помечается failed и видна в админке
+    - цикл работает только на ведущем экземпляре (utils.leader_election);
+      на ведомом изменения пишутся в contest_jobs и передаются ведущему
+      через NOTIFY ("jobs", "fire")
+    """
+
+    def __init__(self, max_attempts: int, retry_delay: float):
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.heap: List = []
+        self.jobs: Dict[str, TimerJob] = {}
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._running: Set[asyncio.Task] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def active(self) -> bool:
+        """Цикл запущен (этот экземпляр — ведущий)"""
+        return self._task is not None
+
+    async def schedule(self, stage: str, contest_id: int,
+                       deadline: Optional[float] = None, on_deadline: Optional[DeadlineCallback] = None,
+                       interval: Optional[float] = None, on_tick: Optional[TickCallback] = None,
+                       tick_now: bool = False):
+        """
+        Поставить таймер и записать его в contest_jobs
+        (задача того же этапа того же конкурса заменяется)
+
+        Args:
+            stage: этап конкурса ("collect", "timer", "spam_timer")
+            contest_id: конкурс, к которому относится задача
+            deadline: абсолютное время дедлайна (time.time()) или None
+            on_deadline: вызывается один раз в дедлайн или по fire_now
+            interval, on_tick: периодические тики до дедлайна
+            tick_now: первый тик — сразу, не дожидаясь сетки
+        """
+        job = TimerJob(stage, contest_id, deadline, on_deadline, interval, on_tick)
+        self._drop(job.key)
+        if self.active:
+            # Задача видна fire_now уже во время записи в БД (в кучу — после записи)
+            self.jobs[job.key] = job
+
+        from database_postgres import db
+        status, job.attempts = await db.save_contest_job(job.key, contest_id, stage, deadline, interval)
+
+        if status == 'failed':
+            # Восстановленная задача уже исчерпала попытки — решает админ
+            if self.jobs.get(job.key) is job:
+                del self.jobs[job.key]
+            print(f"🛑 [{contest_id}] Задача {job.key} остановлена после {job.attempts} попыток, не запускаем")
+            return
+
+        if not self.active:
+            # Задачу выполнит ведущий: он перечитает этапы конкурса из БД
+            await db.notify_cluster("jobs", contest_id)
+            return
+
+        if self.jobs.get(job.key) is not job:
+            # Пока задача записывалась, её отменили или заменили
+            return
+
+        # job.deadline мог сдвинуть fire_now, пока задача записывалась
+        now = time.time()
+        if interval:
+            job.anchor = deadline if deadline is not None else now
+            job.next_tick = now if tick_now else self._next_tick(job, now)
+            if job.deadline is not None and job.next_tick >= job.deadline:
+                job.next_tick = None
+
+        self._push(job)
+
+    def _drop(self, key: str) -> bool:
+        """Убрать задачу из памяти; True если она была"""
+        job = self.jobs.pop(key, None)
+        if job is None:
+            return False
+
+        job.cancelled = True
+        # Колбэк может отменять собственную задачу — себя не прерываем
+        if job.task and not job.task.done() and job.task is not asyncio.current_task():
+            job.task.cancel()
+        return True
+
+    async def cancel(self, stage: str, contest_id: int) -> bool:
+        """Отменить задачу этапа конкурса; True если она была"""
+        key = job_key(stage, contest_id)
+        from database_postgres import db
+        await db.delete_contest_job(key)
+        if not self.active:
+            await db.notify_cluster("jobs", contest_id)
+        return self._drop(key)
+
+    async def cancel_contest(self, contest_id: int) -> int:
+        """Отменить все задачи конкурса (включая failed в БД)"""
+        keys = [key for key, job in self.jobs.items() if job.contest_id == contest_id]
+        for key in keys:
+            self._drop(key)
+        from database_postgres import db
+        await db.delete_contest_jobs(contest_id)
+        if not self.active:
+            await db.notify_cluster("jobs", contest_id)
+        return len(keys)
+
+    def forget_missing(self, contest_id: int, keys) -> int:
+        """Убрать из памяти задачи конкурса, строк которых уже нет в contest_jobs"""
+        missing = [key for key, job in self.jobs.items()
+                   if job.contest_id == contest_id and key not in keys]
+        for key in missing:
+            self._drop(key)
+        return len(missing)
+
+    async def fire_now(self, stage: str, contest_id: int) -> bool:
+        """
+        Сработать дедлайном немедленно (например, набор участников завершён)
+        True если задача была запланирована (на ведомом — передана ведущему)
+        """
+        if not self.active:
+            from database_postgres import db
+            await db.notify_cluster("fire", stage, contest_id)
+            return True
+
+        job = self.jobs.get(job_key(stage, contest_id))
+        if job is None:
+            return False
+
+        job.deadline = time.time()
+        job.next_tick = None
+        if job.seq >= 0:
+            # Иначе задача ещё записывается: schedule поставит её с новым дедлайном
+            self._push(job)
+        return True
+
+    def get_job(self, key: str) -> Optional[TimerJob]:
+        """Задача в памяти по имени"""
+        return self.jobs.get(key)
+
+    def get_jobs(self) -> List[TimerJob]:
+        """Запланированные задачи (для админки)"""
+        return sorted(self.jobs.values(), key=lambda job: job.next_fire() or math.inf)
+
+    @staticmethod
+    def _next_tick(job: TimerJob, now: float) -> float:
+        """Ближайшая точка сетки тиков строго позже now"""
+        n = math.floor((now - job.anchor) / job.interval) + 1
+        return job.anchor + n * job.interval
+
+    def _push(self, job: TimerJob):
+        job.seq = next(self._seq)
+        fire_at = job.next_fire()
+        if fire_at is None:
+            # Ни тиков, ни дедлайна: задача ждёт fire_now
+            return
+        heapq.heappush(self.heap, (fire_at, job.seq, job))
+        self._wakeup.set()
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+        return task
+
+    def _dispatch(self, job: TimerJob, at: float, now: float):
+        """Обработать срабатывание задачи, вынутое из кучи"""
+        if job.deadline is not None and at >= job.deadline:
+            if self.jobs.get(job.key) is job:
+                del self.jobs[job.key]
+            job.task = self._spawn(self._run_deadline(job, job.task))
+            return
+
+        remaining = job.deadline - at if job.deadline is not None else None
+        if job.task is None or job.task.done():
+            job.task = self._spawn(self._run(job, job.on_tick(remaining)))
+        else:
+            print(f"⏭️ [{job.contest_id}] {job.key}: предыдущий тик ещё выполняется, пропускаем")
+
+        job.next_tick = self._next_tick(job, max(now, at))
+        if job.deadline is not None and job.next_tick >= job.deadline:
+            job.next_tick = None
+        self._push(job)
+
+    async def _run(self, job: TimerJob, coro):
+        try:
+            await coro
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ [{job.contest_id}] Ошибка в задаче {job.key}: {e}")
+
+    async def _run_deadline(self, job: TimerJob, previous: Optional[asyncio.Task]):
+        if previous is not None and not previous.done():
+            await asyncio.wait([previous])
+        if job.cancelled:
+            return
+
+        from database_postgres import db
+
+        error = None
+        if job.on_deadline is not None:
+            try:
+                await job.on_deadline()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                error = e
+
+        try:
+            if error is None:
+                # Этап завершён; если колбэк поставил задачу с тем же именем — не трогаем
+                if job.key not in self.jobs:
+                    await db.delete_contest_job(job.key)
+            else:
+                await self._retry(job, error)
+        except Exception as e:
+            print(f"⚠️ [{job.contest_id}] Не удалось обновить задачу {job.key} в БД: {e}")
+
+    async def _retry(self, job: TimerJob, error: Exception):
+        """Повторить упавший дедлайн позже или пометить задачу failed"""
+        from database_postgres import db
+
+        attempts = job.attempts + 1
+        print(f"❌ [{job.contest_id}] Ошибка в задаче {job.key} (попытка {attempts}): {error}")
+
+        if attempts >= self.max_attempts:
+            print(f"🛑 [{job.contest_id}] Задача {job.key} остановлена после {attempts} попыток")
+            await db.fail_contest_job(job.key, attempts, str(error))
+            return
+
+        retry = TimerJob(job.stage, job.contest_id, time.time() + self.retry_delay * 2 ** (attempts - 1),
+                         job.on_deadline, None, None)
+        retry.attempts = attempts
+        self.jobs[retry.key] = retry
+        self._push(retry)
+        await db.retry_contest_job(retry.key, attempts, str(error), retry.deadline)
+
+    async def _loop(self):
+        while True:
+            self._wakeup.clear()
+
+            now = time.time()
+            while self.heap and self.heap[0][0] <= now:
+                at, seq, job = heapq.heappop(self.heap)
+                # Отменённые и перепланированные записи пропускаются
+                if job.cancelled or seq != job.seq:
+                    continue
+                self._dispatch(job, at, now)
+
+            timeout = self.heap[0][0] - time.time() if self.heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        """Запустить цикл планировщика"""
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Остановить цикл и прервать выполняющиеся колбэки"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        running = list(self._running)
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+
+        self.jobs.clear()
+        self.heap.clear()
+
+
+# Глобальный экземпляр
+scheduler = ContestScheduler(
+    max_attempts=config.CONTEST_JOB_MAX_ATTEMPTS,
+    retry_delay=config.CONTEST_JOB_RETRY_DELAY
+)
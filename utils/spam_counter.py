@@ -0,0 +1,113 @@
+"""
+Счётчик спам-сообщений с отложенной записью (write-behind)
+Сообщения считаются в памяти и пачкой сбрасываются в spam_messages
+"""
+
+import asyncio
+from collections import Counter
+from typing import Dict, Set
+
+import config
+
+
+class SpamCounter:
+    """
+    Счётчики идущих спам-конкурсов в памяти процесса
+
+    Для каждого конкурса хранится множество участников и накопленные
+    (ещё не записанные) приращения. Фоновая задача раз в
+    config.SPAM_FLUSH_INTERVAL секунд записывает их одним запросом.
+    """
+
+    def __init__(self):
+        self.participants: Dict[int, Set[int]] = {}
+        self.pending: Dict[int, Counter] = {}
+        self._flush_task = None
+        self._lock = asyncio.Lock()
+
+    def start_contest(self, contest_id: int, user_ids):
+        """Начать подсчёт для конкурса с заданным списком участников"""
+        self.participants[contest_id] = set(user_ids)
+        self.pending.setdefault(contest_id, Counter())
+        self._ensure_flush_task()
+        print(f"⚡ [{contest_id}] Счётчик спама запущен ({len(self.participants[contest_id])} участников)")
+
+    def is_running(self, contest_id: int) -> bool:
+        """Идёт ли подсчёт для конкурса"""
+        return contest_id in self.participants
+
+    def count(self, contest_id: int, user_id: int) -> bool:
+        """
+        Засчитать сообщение (без обращения к БД)
+
+        Returns:
+            True если пользователь — участник конкурса
+        """
+        members = self.participants.get(contest_id)
+        if members is None or user_id not in members:
+            return False
+
+        self.pending[contest_id][user_id] += 1
+        return True
+
+    async def flush(self, contest_id: int = None):
+        """Записать накопленные приращения в БД (для одного или всех конкурсов)"""
+        from database_postgres import db
+
+        async with self._lock:
+            contest_ids = [contest_id] if contest_id is not None else list(self.pending)
+
+            for cid in contest_ids:
+                counts = self.pending.get(cid)
+                if not counts:
+                    continue
+
+                # Забираем накопленное до записи, новые сообщения копятся в новом счётчике
+                self.pending[cid] = Counter()
+                try:
+                    await db.add_spam_counts(cid, counts)
+                except asyncio.CancelledError:
+                    self.pending[cid].update(counts)
+                    raise
+                except Exception as e:
+                    print(f"❌ [{cid}] Ошибка записи счётчиков спама: {e}")
+                    # Возвращаем неудачную пачку, чтобы не потерять сообщения
+                    self.pending[cid].update(counts)
+
+    async def stop_contest(self, contest_id: int) -> bool:
+        """
+        Остановить подсчёт для конкурса и записать остаток
+        False — запись не удалась, остаток сохранён до следующей попытки
+        """
+        self.participants.pop(contest_id, None)
+        await self.flush(contest_id)
+        if self.pending.get(contest_id):
+            return False
+        self.pending.pop(contest_id, None)
+        return True
+
+    def _ensure_flush_task(self):
+        """Запустить фоновую задачу сброса, если она ещё не запущена"""
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        """Периодический сброс счётчиков в БД"""
+        try:
+            # Задача живёт, пока есть хотя бы один идущий спам-конкурс
+            while self.participants:
+                await asyncio.sleep(config.SPAM_FLUSH_INTERVAL)
+                await self.flush()
+        except asyncio.CancelledError:
+            pass
+
+    async def shutdown(self):
+        """Сбросить всё накопленное при остановке бота"""
+        if self._flush_task:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+
+# Глобальный экземпляр
+spam_counter = SpamCounter()
@@ -0,0 +1,118 @@
+"""
+Локальное множество подписчиков канала
+Поддерживается по обновлениям chat_member и хранится в PostgreSQL
+"""
+
+import asyncio
+from array import array
+from bisect import bisect_left
+from typing import Optional
+
+from utils.leader_election import leader_election
+
+
+class SubscriberSet:
+    """
+    Известные подписчики и отписавшиеся пользователи канала
+
+    Хранятся как отсортированные массивы int64, поиск — бинарный, O(log n).
+    Пользователи, которых нет ни в одном массиве, считаются неизвестными.
+    """
+
+    def __init__(self):
+        self.members = array('q')
+        self.non_members = array('q')
+
+    async def load(self, db):
+        """Загрузить множество из БД (при старте)"""
+        members, non_members = await db.get_channel_subscribers()
+        self.members = array('q', sorted(members))
+        self.non_members = array('q', sorted(non_members))
+        print(f"✅ Подписчики канала загружены: {len(self.members)} подписано, "
+              f"{len(self.non_members)} отписано")
+
+    @staticmethod
+    def _contains(values: array, user_id: int) -> bool:
+        idx = bisect_left(values, user_id)
+        return idx < len(values) and values[idx] == user_id
+
+    @staticmethod
+    def _insert(values: array, user_id: int):
+        idx = bisect_left(values, user_id)
+        if idx == len(values) or values[idx] != user_id:
+            values.insert(idx, user_id)
+
+    @staticmethod
+    def _remove(values: array, user_id: int):
+        idx = bisect_left(values, user_id)
+        if idx < len(values) and values[idx] == user_id:
+            del values[idx]
+
+    def lookup(self, user_id: int) -> Optional[bool]:
+        """
+        Статус подписки по локальному множеству
+
+        Returns:
+            True / False если пользователь известен, None если нет
+        """
+        if self._contains(self.members, user_id):
+            return True
+        if self._contains(self.non_members, user_id):
+            return False
+        return None
+
+    def mark(self, user_id: int, is_member: bool) -> bool:
+        """
+        Обновить статус в памяти
+
+        Returns:
+            True если статус изменился
+        """
+        if self.lookup(user_id) is is_member:
+            return False
+
+        if is_member:
+            self._remove(self.non_members, user_id)
+            self._insert(self.members, user_id)
+        else:
+            self._remove(self.members, user_id)
+            self._insert(self.non_members, user_id)
+        return True
+
+    def forget(self, user_id: int):
+        """Сделать пользователя неизвестным (только в памяти)"""
+        self._remove(self.members, user_id)
+        self._remove(self.non_members, user_id)
+
+    async def record(self, user_id: int, is_member: bool):
+        """Обновить статус в памяти и сохранить в БД"""
+        if self.mark(user_id, is_member):
+            leader_election.publish("member", user_id, int(is_member))
+            await self._persist(user_id, is_member)
+
+    def record_later(self, user_id: int, is_member: bool):
+        """Обновить статус в памяти сразу, а запись в БД выполнить в фоне"""
+        if self.mark(user_id, is_member):
+            leader_election.publish("member", user_id, int(is_member))
+            asyncio.create_task(self._persist(user_id, is_member))
+
+    def forget_later(self, user_id: int):
+        """Сделать пользователя неизвестным (в памяти сразу, в БД — в фоне)"""
+        self.forget(user_id)
+        leader_election.publish("member", user_id, "")
+        asyncio.create_task(self._persist(user_id, None))
+
+    @staticmethod
+    async def _persist(user_id: int, is_member: Optional[bool]):
+        from database_postgres import db
+        try:
+            if is_member is None:
+                await db.delete_channel_subscriber(user_id)
+            else:
+                await db.set_channel_subscriber(user_id, is_member)
+        except Exception as e:
+            print(f"⚠️ Не удалось сохранить подписку {user_id}: {e}")
+
+
+# Глобальный экземпляр
+subscriber_set = SubscriberSet()
@@ -0,0 +1,132 @@
+"""
+Кэш статуса подписки на канал
+Общий для регистрации, рефералов и лидербордов
+"""
+
+import asyncio
+import time
+from typing import Dict, Tuple
+
+from aiogram import Bot
+
+import config
+from utils.subscriber_set import subscriber_set
+
+
+# Статусы участника канала, которые считаются подпиской
+SUBSCRIBED_STATUSES = ("member", "administrator", "creator")
+
+
+class _FetchAborted(Exception):
+    """Запрос к API отменил тот, кто его начал; ожидающие проверяют заново"""
+
+
+class SubscriptionCache:
+    """
+    Кэш результатов bot.get_chat_member для config.CHANNEL_ID
+
+    - положительный и отрицательный результат живут разное время
+    - одновременные запросы по одному пользователю объединяются в один вызов API
+    - ошибки API не кэшируются
+    - пользователи из локального множества подписчиков (utils.subscriber_set)
+      проверяются без обращения к API; в множество попадают только
+      положительные ответы API, отрицательные живут negative_ttl секунд,
+      чтобы новая подписка была видна и без обновления chat_member
+    """
+
+    def __init__(self, positive_ttl: int, negative_ttl: int):
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self._cache: Dict[int, Tuple[bool, float]] = {}
+        self._inflight: Dict[int, asyncio.Future] = {}
+
+    def get_cached(self, user_id: int):
+        """Статус из кэша или None, если его нет или он устарел"""
+        entry = self._cache.get(user_id)
+        if entry is None:
+            return None
+
+        is_subscribed, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._cache[user_id]
+            return None
+        return is_subscribed
+
+    def set(self, user_id: int, is_subscribed: bool):
+        """Сохранить известный статус подписки"""
+        ttl = self.positive_ttl if is_subscribed else self.negative_ttl
+        self._cache[user_id] = (is_subscribed, time.monotonic() + ttl)
+
+    def record_api_result(self, user_id: int, is_subscribed: bool):
+        """Запомнить ответ get_chat_member (кэш и множество подписчиков)"""
+        self.set(user_id, is_subscribed)
+        if is_subscribed:
+            # Дальше статус пользователя поддерживается обновлениями chat_member
+            subscriber_set.record_later(user_id, True)
+        elif subscriber_set.lookup(user_id):
+            # Устаревший «подписан» из множества: дальше решает TTL-кэш
+            subscriber_set.forget_later(user_id)
+
+    def invalidate(self, user_id: int):
+        """Сбросить кэш для пользователя (например, после нажатия «Я подписался»)"""
+        self._cache.pop(user_id, None)
+
+    async def is_subscribed(self, bot: Bot, user_id: int, force: bool = False) -> bool:
+        """
+        Проверка подписки пользователя на канал
+        
+        Args:
+            force: Пропустить локальные данные и спросить Telegram
+        """
+        if force:
+            self.invalidate(user_id)
+        else:
+            known = subscriber_set.lookup(user_id)
+            if known is not None:
+                return known
+            
+            cached = self.get_cached(user_id)
+            if cached is not None:
+                return cached
+
+        # Если по этому пользователю уже идёт запрос — ждём его результат
+        inflight = self._inflight.get(user_id)
+        if inflight is not None:
+            try:
+                return await asyncio.shield(inflight)
+            except _FetchAborted:
+                # Отменили не нас, а начавший запрос — спрашиваем сами
+                return await self.is_subscribed(bot, user_id)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[user_id] = future
+        try:
+            result = await self._fetch(bot, user_id)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            # Не отменяем общий future: ожидающие его запросы не отменялись
+            future.set_exception(_FetchAborted())
+            future.exception()  # ожидающих может не быть — не логируем
+            raise
+        finally:
+            self._inflight.pop(user_id, None)
+
+    async def _fetch(self, bot: Bot, user_id: int) -> bool:
+        """Запрос к Telegram API"""
+        try:
+            member = await bot.get_chat_member(chat_id=config.CHANNEL_ID, user_id=user_id)
+        except Exception as e:
+            print(f"⚠️ Ошибка проверки подписки для {user_id}: {e}")
+            return False
+
+        is_subscribed = member.status in SUBSCRIBED_STATUSES
+        self.record_api_result(user_id, is_subscribed)
+        return is_subscribed
+
+
+# Глобальный экземпляр
+subscription_cache = SubscriptionCache(
+    positive_ttl=config.SUBSCRIPTION_CACHE_TTL,
+    negative_ttl=config.SUBSCRIPTION_NEGATIVE_TTL
+)
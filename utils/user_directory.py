@@ -0,0 +1,153 @@
+"""
+Справочник имён пользователей
+Таблица users пополняется из каждого обновления через middleware,
+перед ней — небольшой LRU-кэш в памяти
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User
+
+import config
+
+
+class UserDirectory:
+    """
+    Имена пользователей по user_id
+
+    - LRU на max_size записей; промах читается из БД по первичному ключу
+    - изменения (новое имя или last_seen старше touch_interval)
+      копятся в памяти и пишутся пачкой раз в flush_interval секунд
+    - промах БД запоминается на missing_ttl секунд: пользователь мог
+      появиться через другой экземпляр бота
+    """
+
+    def __init__(self, max_size: int, flush_interval: float, touch_interval: float,
+                 missing_ttl: float):
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.touch_interval = touch_interval
+        self.missing_ttl = missing_ttl
+        # user_id -> {'user_id', 'username', 'full_name', 'seen_at'}
+        self.cache: "OrderedDict[int, Dict]" = OrderedDict()
+        self.pending: Dict[int, Dict] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def _remember(self, entry: Dict):
+        self.cache[entry['user_id']] = entry
+        self.cache.move_to_end(entry['user_id'])
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+
+    def touch(self, user: User):
+        """Пользователь прислал обновление — обновить имя при необходимости"""
+        now = time.monotonic()
+        cached = self.cache.get(user.id)
+
+        if (cached is not None
+                and cached['username'] == user.username
+                and cached['full_name'] == user.full_name
+                and now - cached['seen_at'] < self.touch_interval):
+            self.cache.move_to_end(user.id)
+            return
+
+        entry = {
+            'user_id': user.id,
+            'username': user.username,
+            'full_name': user.full_name,
+            'seen_at': now,
+        }
+        self._remember(entry)
+        self.pending[user.id] = entry
+
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while self.pending:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        """Записать накопленные изменения одним запросом"""
+        if not self.pending:
+            return
+
+        from database_postgres import db
+
+        batch = list(self.pending.values())
+        self.pending = {}
+        try:
+            await db.upsert_users(batch)
+        except Exception as e:
+            # Вернём в очередь, если за это время не пришло свежее имя
+            for entry in batch:
+                self.pending.setdefault(entry['user_id'], entry)
+            print(f"⚠️ Ошибка записи справочника пользователей: {e}")
+
+    async def resolve(self, user_ids: Iterable[int]) -> Dict[int, Dict]:
+        """
+        Имена пользователей: {user_id: {'user_id', 'username', 'full_name'}}
+        Неизвестные пользователи в ответ не попадают
+        """
+        result = {}
+        missing = []
+        now = time.monotonic()
+        for user_id in user_ids:
+            entry = self.cache.get(user_id)
+            if entry is None or (entry.get('missing') and now - entry['seen_at'] >= self.missing_ttl):
+                missing.append(user_id)
+                continue
+            self.cache.move_to_end(user_id)
+            if not entry.get('missing'):
+                result[user_id] = entry
+
+        if missing:
+            from database_postgres import db
+            rows = await db.get_users(missing)
+            for user_id in missing:
+                row = rows.get(user_id)
+                if row is None:
+                    # Запоминаем промах на missing_ttl, чтобы не спрашивать БД каждый раз;
+                    # первое же обновление от пользователя заменит запись
+                    self._remember({'user_id': user_id, 'username': None, 'full_name': None,
+                                    'seen_at': now, 'missing': True})
+                    continue
+                # seen_at = 0: при следующем обновлении last_seen перезапишется
+                entry = {**row, 'seen_at': 0.0}
+                self._remember(entry)
+                result[user_id] = entry
+
+        return result
+
+    async def get(self, user_id: int) -> Optional[Dict]:
+        """Имя одного пользователя или None"""
+        return (await self.resolve([user_id])).get(user_id)
+
+
+class UserDirectoryMiddleware(BaseMiddleware):
+    """Outer-middleware: отмечает автора каждого обновления в справочнике"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = data.get('event_from_user')
+        if user is not None and not user.is_bot:
+            user_directory.touch(user)
+        return await handler(event, data)
+
+
+# Глобальный экземпляр
+user_directory = UserDirectory(
+    max_size=config.USER_DIRECTORY_CACHE_SIZE,
+    flush_interval=config.USER_DIRECTORY_FLUSH_INTERVAL,
+    touch_interval=config.USER_DIRECTORY_TOUCH_INTERVAL,
+    missing_ttl=config.USER_DIRECTORY_MISSING_TTL
+)